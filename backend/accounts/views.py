@@ -14,7 +14,6 @@ import logging
 import random
 from datetime import date
 from patients.models import Patient, Doctor
-from patients.tasks import cancel_missed_appointments_for_doctor
 from patients.sms_service import send_sms
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
@@ -168,17 +167,7 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not self.user.is_active:
             raise serializers.ValidationError("Пожалуйста, активируйте ваш аккаунт, проверив почту.")
         
-        # --- ЗАПУСК ОЧИСТКИ ПРИ ВХОДЕ ВРАЧА ---
-        if self.user.is_doctor:
-            try:
-                # Убедимся, что профиль доктора существует
-                doctor = self.user.doctor 
-                cancel_missed_appointments_for_doctor(doctor.id)
-            except Doctor.DoesNotExist:
-                print(f"Профиль врача для пользователя {self.user.id} не найден, очистка пропущена.")
-            except Exception as e:
-                print(f"Не удалось запустить очистку для врача {self.user.id}: {e}")
-        # --- КОНЕЦ БЛОКА ---
+        # Просроченные записи отменяет ежедневная команда cancel_missed_appointments
             
         data['email'] = self.user.email
         data['role'] = 'doctor' if self.user.is_doctor else 'patient'
@@ -62,6 +62,32 @@ else:
         }
     }
 
+# --- Кэш (Redis на нескольких узлах, память процесса локально) ---
+# С несколькими воркерами (gunicorn) REDIS_URL обязателен: индекс слотов,
+# профили ролей и кэш ответов сбрасываются при изменениях, а LocMemCache
+# сбрасывается только в процессе, который сохранил изменение. Без DEBUG
+# о LocMemCache предупреждает проверка patients.W001 (patients/checks.py).
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'novamed',
+        }
+    }
+
+# Время жизни закэшированных ответов API, секунды
+RESPONSE_CACHE_TIMEOUT = 300
+
 # --- Шаблоны ---
 TEMPLATES = [
     {
@@ -99,11 +125,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Загрузка больших файлов по частям (patients.uploads)
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_tmp'
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3))
+# Файлы пациентов - вне MEDIA_ROOT, отдаются только с проверкой доступа (patients.storage)
+PROTECTED_MEDIA_ROOT = BASE_DIR / 'protected_media'
+# Отдача файлов пациентов через nginx: internal location с alias на PROTECTED_MEDIA_ROOT (patients.downloads)
+FILE_DOWNLOAD_ACCEL_PREFIX = os.environ.get('FILE_DOWNLOAD_ACCEL_PREFIX')
 
 # --- Модель пользователя и DRF ---
 AUTH_USER_MODEL = 'accounts.User'
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('patients.authentication.RoleJWTAuthentication',),
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticatedOrReadOnly',),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -123,6 +156,8 @@ CORS_ALLOWED_ORIGIN_REGEXES = [
 ]
 # Убираем старый CORS_ALLOWED_ORIGINS, чтобы не было конфликтов
 CORS_ALLOW_ALL_ORIGINS = False
+# Курсор дельта-синхронизации записей (patients.changelog)
+CORS_EXPOSE_HEADERS = ['X-Sync-Cursor']
 
 # --- Email (Gmail) ---
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -20,7 +20,12 @@ urlpatterns = [
     path('api/patients/me/', patient_views.MyPatientView.as_view(), name='my_patient'),
     path('api/patients/check_unique/', patient_views.PatientUniqueCheckView.as_view(), name='patient_check_unique'),
     re_path(r'^api/patients/(?P<patient_id>[0-9]+)/history/$', patient_views.PatientMedicalHistoryView.as_view(), name='patient_history'),
+    re_path(r'^api/patients/(?P<patient_id>[0-9]+)/history/pdf/$', patient_views.PatientMedicalHistoryPdfView.as_view(), name='patient_history_pdf'),
     re_path(r'^api/patients/(?P<patient_id>[0-9]+)/files/upload/$', patient_views.PatientFileUploadView.as_view(), name='upload_file'),
+    re_path(r'^api/patients/(?P<patient_id>[0-9]+)/files/uploads/$', patient_views.PatientFileUploadStartView.as_view(), name='upload_file_start'),
+    path('api/uploads/<uuid:upload_id>/', patient_views.FileUploadChunkView.as_view(), name='upload_file_chunk'),
+    path('api/uploads/<uuid:upload_id>/complete/', patient_views.FileUploadCompleteView.as_view(), name='upload_file_complete'),
+    re_path(r'^api/files/(?P<file_id>[0-9]+)/download/$', patient_views.PatientFileDownloadView.as_view(), name='download_file'),
     path('api/patients/active-medicines/', patient_views.PatientActiveMedicinesListView.as_view(), name='patient_active_medicines'),
     path('api/patients/active-medicines/sync/', patient_views.PatientActiveMedicinesSyncView.as_view(), name='active_medicines_sync'),
     
@@ -33,11 +38,13 @@ urlpatterns = [
     
     # ===== Medicines =====
     path('api/medicines/', patient_views.MedicineListView.as_view(), name='medicines-list'),
+    path('api/medicines/search/', patient_views.MedicineSearchView.as_view(), name='medicines-search'),
     re_path(r'^api/medicines/(?P<pk>[0-9]+)/$', patient_views.MedicineDetailView.as_view(), name='medicine-detail'),
     # ===== Appointments =====
     path('api/appointments/', patient_views.MyAppointmentsView.as_view(), name='my_appointments'),
     path('api/appointments/create/', patient_views.AppointmentCreateView.as_view(), name='appointment_create'),
     path('api/appointments/available-slots/', patient_views.AvailableSlotsView.as_view(), name='available_slots'),
+    path('api/appointments/available-slots/range/', patient_views.AvailableSlotsRangeView.as_view(), name='available_slots_range'),
     path('api/appointments/create-by-doctor/', patient_views.AppointmentCreateByDoctorView.as_view(), name='appointment_create_by_doctor'),
     re_path(r'^api/appointments/(?P<pk>[0-9]+)/$', patient_views.AppointmentDetailViewSet.as_view(), name='appointment_detail'),
     re_path(r'^api/appointments/(?P<appointment_id>[0-9]+)/complete/$', patient_views.CompleteAppointmentView.as_view(), name='complete_appointment'),
@@ -45,4 +52,8 @@ urlpatterns = [
     # ===== Diagnosis Templates =====
     path('api/diagnosis-templates/', patient_views.DiagnosisTemplateListView.as_view(), name='diagnosis_templates'),
     re_path(r'^api/diagnosis-templates/(?P<template_id>[0-9]+)/use/$', patient_views.UseTemplateView.as_view(), name='use_template'),   
+
+    # ===== Служебное =====
+    path('api/admin/response-cache/stats/', patient_views.ResponseCacheStatsView.as_view(), name='response_cache_stats'),
+    path('api/admin/analytics/', patient_views.ClinicAnalyticsView.as_view(), name='clinic_analytics'),
 ]
\ No newline at end of file
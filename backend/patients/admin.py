@@ -6,6 +6,13 @@ from .models import (
     Prescription, DoctorNote, 
     DiagnosisTemplate, PatientFile,
     PatientActiveMedicine,
+    OutboxMessage,
+    AppointmentReminder,
+    DoctorDailyStats,
+    PatientChart,
+    AppointmentChange,
+    FileUpload,
+    FileBlob,
     )
 
 @admin.register(Patient)
@@ -29,6 +36,42 @@ class MedicineAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'description')
     search_fields = ('name',)
 
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'appointment', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+
+@admin.register(AppointmentReminder)
+class AppointmentReminderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'appointment', 'channel', 'status', 'sent_at')
+    list_filter = ('status', 'channel')
+
+@admin.register(DoctorDailyStats)
+class DoctorDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('id', 'doctor', 'day', 'completed_count', 'updated_at')
+    list_filter = ('day',)
+
+@admin.register(PatientChart)
+class PatientChartAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'version', 'is_stale', 'built_at')
+    list_filter = ('is_stale',)
+    readonly_fields = ('patient_json', 'doctor_json')
+
+@admin.register(AppointmentChange)
+class AppointmentChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'appointment_id', 'patient_id', 'doctor_id', 'action', 'changed_at')
+    list_filter = ('action',)
+
+@admin.register(FileUpload)
+class FileUploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'patient', 'filename', 'received', 'size', 'updated_at')
+
+@admin.register(FileBlob)
+class FileBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'file', 'size', 'ref_count', 'derivatives_status', 'created_at')
+    list_filter = ('derivatives_status',)
+    readonly_fields = ('sha256', 'file', 'size', 'ref_count', 'thumbnail', 'preview')
+
 admin.site.site_header = "NovaMed — Администрирование"
 admin.site.site_title = "NovaMed Admin"
 admin.site.index_title = "Панель управления"
@@ -0,0 +1,153 @@
+"""
+Проверка лекарств на аллергии пациента.
+
+Текст поля Patient.allergies один раз разбирается в множество нормализованных
+терминов (нижний регистр, ё -> е, грубое отсечение окончаний, синонимы и
+торговые названия приводятся к МНН). Лекарство считается аллергеном, если
+хотя бы один термин его названия есть в этом множестве или начинается с
+термина аллергии ("йод" -> "Йодомарин"), поэтому проверка каталога линейна
+по числу лекарств. Общие слова (кислота, натрия, витамин и т.п.) терминами
+не считаются: по ним совпадали бы все соли и все кислоты.
+
+Множество терминов кэшируется по пациенту и сбрасывается сигналом
+при сохранении/удалении Patient.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Patient
+
+
+CACHE_TIMEOUT = getattr(settings, 'ALLERGY_MATCHER_TIMEOUT', 3600)
+
+# МНН -> другие названия (торговые, устаревшие, англоязычные)
+SYNONYMS = {
+    'ацетилсалициловая кислота': ('аспирин', 'aspirin', 'кардиомагнил', 'тромбо асс'),
+    'парацетамол': ('ацетаминофен', 'paracetamol', 'панадол', 'эффералган'),
+    'ибупрофен': ('нурофен', 'ibuprofen'),
+    'метамизол': ('анальгин', 'metamizole'),
+    'дротаверин': ('но-шпа', 'ношпа'),
+    'бензилпенициллин': ('пенициллин', 'penicillin'),
+    'амоксициллин': ('амоксиклав', 'флемоксин', 'amoxicillin'),
+    'лидокаин': ('lidocaine',),
+    'новокаин': ('прокаин',),
+}
+
+# Слова, которые встречаются в тексте об аллергии, но не являются аллергенами
+STOPWORDS = {
+    'аллергия', 'аллергии', 'аллерген', 'аллергическая', 'реакция', 'реакции',
+    'непереносимость', 'на', 'и', 'или', 'в', 'к', 'по', 'нет', 'не', 'выявлено',
+    'препарат', 'препараты', 'таблетки', 'мг', 'мл', 'раствор',
+    # Общие части названий: кислоты, соли, витамины, лекарственные формы
+    'кислота', 'кислоты', 'соль', 'соли', 'натрий', 'натрия', 'натриевая', 'натриевой',
+    'калий', 'калия', 'калиевая', 'кальций', 'кальция', 'магний', 'магния',
+    'гидрохлорид', 'гидрохлорида', 'хлорид', 'сульфат', 'фосфат', 'ацетат', 'цитрат',
+    'витамин', 'витамины', 'витамина', 'мазь', 'гель', 'крем', 'спрей', 'капли',
+    'капсулы', 'сироп', 'суспензия', 'порошок', 'форте',
+}
+
+# Слово начинается с буквы и может содержать цифры (b12), числа отбрасываются
+_WORD_RE = re.compile(r'[a-zа-я][a-zа-я0-9]*')
+# Падежные окончания существительных и прилагательных, длинные проверяются первыми
+_ENDINGS = ('ами', 'ями', 'ого', 'его', 'ому', 'ему',
+            'ая', 'яя', 'ое', 'ее', 'ую', 'юю', 'ые', 'ие', 'ых', 'их', 'ым', 'им', 'ый', 'ий',
+            'ов', 'ев', 'ом', 'ем', 'ой', 'ей', 'ам', 'ям', 'ах', 'ях',
+            'а', 'я', 'у', 'ю', 'ы', 'и', 'е', 'о')
+_MIN_STEM = 4
+
+
+def _stem(word):
+    if len(word) > _MIN_STEM:
+        for ending in _ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+                return word[:-len(ending)]
+    return word
+
+
+def _words(text):
+    text = (text or '').lower().replace('ё', 'е').replace('-', ' ')
+    return [_stem(w) for w in _WORD_RE.findall(text)]
+
+
+def _build_synonyms():
+    phrases = {}
+    for inn, names in SYNONYMS.items():
+        canonical = ' '.join(_words(inn))
+        for name in (inn,) + names:
+            phrases[tuple(_words(name))] = canonical
+    return phrases
+
+
+_PHRASES = _build_synonyms()
+_STOP_STEMS = {_stem(word) for word in STOPWORDS}
+_MAX_PHRASE = max(len(phrase) for phrase in _PHRASES)
+
+
+def terms(text):
+    """Множество нормализованных терминов текста (синонимы сведены к МНН)."""
+    words = _words(text)
+    result = set()
+    i = 0
+    while i < len(words):
+        for size in range(min(_MAX_PHRASE, len(words) - i), 0, -1):
+            canonical = _PHRASES.get(tuple(words[i:i + size]))
+            if canonical:
+                result.add(canonical)
+                i += size
+                break
+        else:
+            if len(words[i]) >= 3 and words[i] not in _STOP_STEMS:
+                result.add(words[i])
+            i += 1
+    return result
+
+
+@lru_cache(maxsize=50000)
+def medicine_terms(name):
+    return frozenset(terms(name))
+
+
+class AllergyMatcher:
+    def __init__(self, allergens):
+        self.allergens = frozenset(allergens)
+        # Длины однословных терминов - для проверки по началу слова
+        self._prefix_lengths = sorted({len(term) for term in self.allergens if ' ' not in term})
+
+    def __bool__(self):
+        return bool(self.allergens)
+
+    def matches(self, medicine_name):
+        for term in medicine_terms(medicine_name):
+            if term in self.allergens:
+                return True
+            for length in self._prefix_lengths:
+                if length >= len(term):
+                    break
+                if term[:length] in self.allergens:
+                    return True
+        return False
+
+
+def _cache_key(patient_id):
+    # v2: дефис разделяет слова, числа не термины - старые множества не годятся
+    return f'allergy:v2:{patient_id}'
+
+
+def get_matcher(patient_id):
+    """Матчер аллергий пациента или None, если пациента нет."""
+    key = _cache_key(patient_id)
+    allergens = cache.get(key)
+    if allergens is None:
+        row = Patient.objects.filter(id=patient_id).values_list('id', 'allergies').first()
+        if row is None:
+            return None
+        allergens = frozenset(terms(row[1]))
+        cache.set(key, allergens, CACHE_TIMEOUT)
+    return AllergyMatcher(allergens)
+
+
+def invalidate(patient_id):
+    cache.delete(_cache_key(patient_id))
@@ -0,0 +1,144 @@
+"""
+Аналитика по всей клинике для администраторов.
+
+Факты о приемах за период читаются одним запросом (values_list) в pandas
+DataFrame, все показатели считаются векторными group-by без циклов по врачам:
+- загрузка по часу недели: занятые слоты / доступные слоты всех врачей;
+- доля завершенных и отмененных приемов по отделениям;
+- частота диагнозов.
+
+Результат кэшируется на ANALYTICS_CACHE_TIMEOUT секунд.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import slots
+from .models import Appointment, Doctor
+
+
+CACHE_TIMEOUT = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 900)
+TOP_DIAGNOSES = 20
+NO_DEPARTMENT = 'Без отделения'
+COLUMNS = ['doctor_id', 'department', 'date_time', 'status', 'diagnosis']
+
+
+def _cache_key(start_day, end_day):
+    return f'analytics:{start_day.isoformat()}:{end_day.isoformat()}'
+
+
+def load_frame(start_day, end_day):
+    """Приемы за локальные дни [start_day, end_day] одним запросом."""
+    rows = Appointment.objects.for_local_range(start_day, end_day).values_list(
+        'doctor_id', 'doctor__department', 'date_time', 'status', 'diagnosis'
+    )
+    frame = pd.DataFrame.from_records(rows.iterator(chunk_size=10000), columns=COLUMNS)
+    frame['date_time'] = pd.to_datetime(frame['date_time'], utc=True).dt.tz_convert(settings.TIME_ZONE)
+    frame['department'] = frame['department'].fillna('').replace('', NO_DEPARTMENT)
+    frame['diagnosis'] = frame['diagnosis'].fillna('').str.strip()
+    return frame
+
+
+def _weekday_occurrences(start_day, end_day):
+    """Сколько раз каждый день недели (0 - понедельник) встречается в периоде."""
+    days = pd.date_range(start_day, end_day, freq='D')
+    return np.bincount(days.weekday, minlength=7)
+
+
+def occupancy_by_hour(frame, start_day, end_day, doctors_count):
+    booked = np.zeros((7, 24), dtype=np.int64)
+    active = frame[frame['status'] != 'cancelled']
+    if not active.empty:
+        np.add.at(booked, (active['date_time'].dt.weekday.to_numpy(), active['date_time'].dt.hour.to_numpy()), 1)
+
+    # Слотов в каждом часе рабочей сетки (одинаково для всех рабочих дней)
+    slots_per_hour = np.bincount([t.hour for t in slots.SLOT_TIMES], minlength=24)
+    working_days = np.ones(7, dtype=np.int64)
+    working_days[list(slots.WEEKEND_DAYS)] = 0
+    capacity = np.outer(_weekday_occurrences(start_day, end_day) * working_days, slots_per_hour) * doctors_count
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        occupancy = np.where(capacity > 0, booked / capacity, np.nan)
+
+    cells = np.argwhere((capacity > 0) | (booked > 0))
+    return [
+        {
+            'weekday': int(weekday),
+            'hour': int(hour),
+            'booked': int(booked[weekday, hour]),
+            'capacity': int(capacity[weekday, hour]),
+            'occupancy': None if np.isnan(occupancy[weekday, hour]) else round(float(occupancy[weekday, hour]), 4),
+        }
+        for weekday, hour in cells
+    ]
+
+
+def department_rates(frame):
+    if frame.empty:
+        return []
+    by_department = pd.crosstab(frame['department'], frame['status'])
+    for status in ('scheduled', 'completed', 'cancelled'):
+        if status not in by_department:
+            by_department[status] = 0
+    total = by_department.sum(axis=1)
+    result = pd.DataFrame({
+        'total': total,
+        'completed': by_department['completed'],
+        'cancelled': by_department['cancelled'],
+        'scheduled': by_department['scheduled'],
+        'completion_rate': (by_department['completed'] / total).round(4),
+        'cancellation_rate': (by_department['cancelled'] / total).round(4),
+    }).sort_values('total', ascending=False)
+    return [
+        {
+            'department': row.Index,
+            'total': int(row.total),
+            'completed': int(row.completed),
+            'cancelled': int(row.cancelled),
+            'scheduled': int(row.scheduled),
+            'completion_rate': float(row.completion_rate),
+            'cancellation_rate': float(row.cancellation_rate),
+        }
+        for row in result.itertuples()
+    ]
+
+
+def diagnosis_frequencies(frame, top=TOP_DIAGNOSES):
+    diagnoses = frame.loc[(frame['status'] == 'completed') & (frame['diagnosis'] != ''), 'diagnosis']
+    counts = diagnoses.value_counts()
+    total = int(counts.sum())
+    return [
+        {'diagnosis': diagnosis, 'count': int(count), 'share': round(float(count) / total, 4)}
+        for diagnosis, count in counts.head(top).items()
+    ]
+
+
+def compute(start_day, end_day):
+    frame = load_frame(start_day, end_day)
+    doctors_count = Doctor.objects.count()
+    return {
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'generated_at': timezone.now().isoformat(),
+        'appointments': len(frame),
+        'doctors': doctors_count,
+        'occupancy_by_hour': occupancy_by_hour(frame, start_day, end_day, doctors_count),
+        'departments': department_rates(frame),
+        'diagnoses': diagnosis_frequencies(frame),
+    }
+
+
+def get_report(start_day=None, end_day=None, refresh=False):
+    """Отчет за период (по умолчанию - последние 90 дней) из кэша или заново."""
+    end_day = end_day or timezone.localdate()
+    start_day = start_day or end_day - timedelta(days=89)
+    key = _cache_key(start_day, end_day)
+    report = None if refresh else cache.get(key)
+    if report is None:
+        report = compute(start_day, end_day)
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,18 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import roles
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация, которая заодно определяет роль пользователя:
+    request.doctor и request.patient - профиль или None.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user = result[0]
+            request.doctor = roles.get_doctor(user)
+            request.patient = roles.get_patient(user)
+        return result
@@ -0,0 +1,104 @@
+"""
+Хранилище содержимого файлов пациентов с дедупликацией (FileBlob).
+
+Файл хранится один раз под именем, полученным из SHA-256 содержимого.
+Повторная загрузка того же файла (тот же анализ к нескольким приемам) -
+только новая строка PatientFile и +1 к ref_count блоба, без записи на диск.
+Удаление PatientFile уменьшает ref_count (signals.py); блоб без ссылок
+удаляется вместе с файлом после коммита.
+
+PatientFile.file указывает на файл блоба, поэтому отдача (downloads.py)
+работает с f.file как с обычным файлом. Блобы лежат в закрытом хранилище
+(storage.py) и публичных URL не имеют.
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import FileBlob, PatientFile
+
+
+BLOCK_SIZE = 64 * 1024
+
+
+def content_sha256(content):
+    """SHA-256 файла Django (File/UploadedFile), читая его блоками."""
+    digest = hashlib.sha256()
+    for block in content.chunks(BLOCK_SIZE):
+        digest.update(block)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def acquire(sha256, size, filename, content):
+    """
+    Блоб с таким содержимым и +1 ссылка на него. content (File) записывается
+    в хранилище, только если такого содержимого еще нет.
+    Вызывать в той же транзакции, что и создание PatientFile.
+    """
+    if FileBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1):
+        return FileBlob.objects.get(sha256=sha256)
+
+    blob = FileBlob(sha256=sha256, size=size, ref_count=1)
+    blob.file.save(filename, content, save=False)
+    try:
+        with transaction.atomic():
+            blob.save(force_insert=True)
+    except IntegrityError:
+        # Тот же файл параллельно сохранил другой запрос - используем его блоб
+        blob.file.delete(save=False)
+        FileBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        blob = FileBlob.objects.get(sha256=sha256)
+    return blob
+
+
+def create_patient_file(content, sha256=None, **fields):
+    """PatientFile с содержимым content (File); fields - остальные поля PatientFile."""
+    sha256 = sha256 or content_sha256(content)
+    with transaction.atomic():
+        blob = acquire(sha256, content.size, content.name, content)
+        return PatientFile.objects.create(blob=blob, file=blob.file.name, **fields)
+
+
+def _collect(sha256):
+    # Условие ref_count=0 в самом DELETE: параллельный acquire успеет либо
+    # увеличить счетчик (блоб останется), либо создаст блоб заново
+    blob = FileBlob.objects.filter(sha256=sha256, ref_count=0).first()
+    if blob is not None and FileBlob.objects.filter(sha256=sha256, ref_count=0).delete()[0]:
+        for field in (blob.file, blob.thumbnail, blob.preview):
+            if field:
+                field.delete(save=False)
+
+
+def release(sha256):
+    """-1 ссылка; блоб без ссылок удаляется после коммита."""
+    FileBlob.objects.filter(sha256=sha256, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: _collect(sha256))
+
+
+def adopt(patient_file):
+    """
+    Переводит PatientFile, загруженный до появления блобов, на блоб.
+    Новый блоб забирает существующий файл без копирования; дубликат
+    ссылается на уже сохраненное содержимое, а его копия удаляется.
+    Возвращает True, если копия оказалась дубликатом.
+    """
+    storage = patient_file.file.storage
+    old_name = patient_file.file.name
+    with storage.open(old_name, 'rb') as fh:
+        digest = hashlib.sha256()
+        for block in iter(lambda: fh.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    size = storage.size(old_name)
+
+    with transaction.atomic():
+        updated = FileBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        if not updated:
+            FileBlob.objects.create(sha256=sha256, file=old_name, size=size, ref_count=1)
+        blob = FileBlob.objects.get(sha256=sha256)
+        PatientFile.objects.filter(id=patient_file.id).update(blob=blob, file=blob.file.name)
+    if updated and old_name != blob.file.name:
+        transaction.on_commit(lambda: storage.delete(old_name))
+    return bool(updated)
@@ -0,0 +1,91 @@
+"""
+Журнал изменений записей на прием (AppointmentChange) для дельта-синхронизации.
+
+Клиент получает курсор в заголовке X-Sync-Cursor полного ответа и в следующий
+раз передает ?since=<курсор>, получая только изменившиеся и удаленные записи.
+
+Номера изменений выдаются до коммита, поэтому транзакция, начатая раньше,
+может закоммитить меньший номер позже. Чтобы такие изменения не терялись,
+курсор продвигается только по изменениям старше SETTLE_SECONDS; более свежие
+изменения приходят и в следующей синхронизации (клиент применяет их повторно).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment, AppointmentChange, MedicalRecord
+
+
+SETTLE = timedelta(seconds=getattr(settings, 'APPOINTMENT_CHANGES_SETTLE_SECONDS', 10))
+CURSOR_HEADER = 'X-Sync-Cursor'
+RECENT_LIMIT = 500
+
+
+def record(appointment_id, patient_id, doctor_id, action='updated'):
+    AppointmentChange.objects.create(
+        appointment_id=appointment_id, patient_id=patient_id, doctor_id=doctor_id, action=action
+    )
+
+
+def record_many(rows, action='updated'):
+    """rows: (appointment_id, patient_id, doctor_id)"""
+    now = timezone.now()
+    AppointmentChange.objects.bulk_create([
+        AppointmentChange(appointment_id=a, patient_id=p, doctor_id=d, action=action, changed_at=now)
+        for a, p, d in rows
+    ], batch_size=1000)
+
+
+def record_for_appointment_id(appointment_id):
+    """Изменилось содержимое приема (мед. запись, рецепты, заметки, файлы)."""
+    row = Appointment.objects.filter(id=appointment_id).values_list('patient_id', 'doctor_id').first()
+    if row:
+        record(appointment_id, *row)
+
+
+def record_for_medical_record_id(medical_record_id):
+    appointment_id = MedicalRecord.objects.filter(id=medical_record_id).values_list(
+        'appointment_id', flat=True
+    ).first()
+    if appointment_id:
+        record_for_appointment_id(appointment_id)
+
+
+def parse_cursor(value):
+    """Курсор из запроса; ValueError, если он некорректен."""
+    cursor = int(value)
+    if cursor < 0:
+        raise ValueError(value)
+    return cursor
+
+
+def current_cursor():
+    """Курсор для полного ответа: снимать до чтения данных."""
+    settled_before = timezone.now() - SETTLE
+    recent = list(AppointmentChange.objects.order_by('-id').values_list('id', 'changed_at')[:RECENT_LIMIT])
+    for change_id, changed_at in recent:
+        if changed_at <= settled_before:
+            return change_id
+    # Журнал пуст или все последние изменения еще свежие
+    return recent[-1][0] - 1 if len(recent) == RECENT_LIMIT else 0
+
+
+def changes_since(cursor, **filters):
+    """
+    Изменения после cursor (filters: patient_id=... или doctor_id=...).
+    Возвращает (id измененных приемов, новый курсор).
+    """
+    settled_before = timezone.now() - SETTLE
+    appointment_ids = set()
+    new_cursor = cursor
+    settled = True
+    rows = AppointmentChange.objects.filter(id__gt=cursor, **filters).order_by('id').values_list(
+        'id', 'appointment_id', 'changed_at'
+    )
+    for change_id, appointment_id, changed_at in rows:
+        appointment_ids.add(appointment_id)
+        settled = settled and changed_at <= settled_before
+        if settled:
+            new_cursor = change_id
+    return appointment_ids, new_cursor
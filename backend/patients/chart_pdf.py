@@ -0,0 +1,209 @@
+"""
+PDF медицинской карты на сервере.
+
+Источник - тот же JSON снимка карты, что отдает PatientMedicalHistoryView
+(charts.get). Документ рендерится matplotlib постранично: каждая готовая
+страница сразу уходит клиенту, поэтому первая страница приходит до того,
+как сверстана вся история. Шрифты дописываются в конец документа.
+
+Готовый PDF кэшируется по версии и времени сборки снимка: пока карта
+не изменилась, повторная выгрузка - одно чтение из кэша.
+"""
+import io
+import json
+import textwrap
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+
+CACHE_TIMEOUT = getattr(settings, 'CHART_PDF_CACHE_TIMEOUT', 24 * 3600)
+
+PAGE_SIZE = (8.27, 11.69)  # A4, дюймы
+MARGIN = 0.7
+WRAP_WIDTH = 80
+# Стиль строки: (размер шрифта, жирный, высота строки в дюймах)
+STYLES = {
+    'title': (16, True, 0.4),
+    'heading': (11, True, 0.26),
+    'label': (10, True, 0.2),
+    'text': (10, False, 0.19),
+    'gap': (10, False, 0.14),
+}
+
+PATIENT_FIELDS = [
+    ('Дата рождения', 'birth_date'),
+    ('Пол', 'gender'),
+    ('ИИН', 'iin'),
+    ('Телефон', 'phone'),
+    ('Рост', 'height'),
+    ('Вес', 'weight'),
+    ('Группа крови', 'blood_type'),
+    ('Номер страховки', 'insurance_number'),
+    ('Экстренный контакт', 'emergency_contact'),
+    ('Хронические заболевания', 'chronic_diseases'),
+    ('Аллергии', 'allergies'),
+]
+
+RECORD_FIELDS = [
+    ('Жалобы', 'complaints'),
+    ('Анамнез', 'anamnesis'),
+    ('Объективные данные', 'objective_data'),
+    ('Рекомендации', 'recommendations'),
+]
+
+
+def _cache_key(patient_id, is_doctor, version, built_at):
+    variant = 'doctor' if is_doctor else 'patient'
+    return f'chart_pdf:{patient_id}:{variant}:{version}:{built_at.timestamp()}'
+
+
+def filename(patient_id):
+    return f'medical_card_{patient_id}.pdf'
+
+
+class _ChunkWriter:
+    """Файл для PdfPages, из которого записанное забирается по частям."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        # PdfPages пишет только вперед; seek нужен, чтобы его приняли за файл
+        raise io.UnsupportedOperation('seek')
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _format_date(value):
+    return timezone.localtime(datetime.fromisoformat(value)).strftime('%d.%m.%Y %H:%M')
+
+
+def _wrapped(style, text):
+    for paragraph in str(text).splitlines() or ['']:
+        for line in textwrap.wrap(paragraph, WRAP_WIDTH) or ['']:
+            yield style, line
+
+
+def _field(label, value):
+    yield 'label', f'{label}:'
+    yield from _wrapped('text', value)
+
+
+def _lines(chart):
+    """Строки документа (стиль, текст) в порядке вывода."""
+    patient = chart['patient']
+    yield 'title', 'Медицинская карта пациента'
+    yield 'heading', patient['name']
+    for label, key in PATIENT_FIELDS:
+        if patient.get(key):
+            yield from _wrapped('text', f'{label}: {patient[key]}')
+
+    yield 'gap', ''
+    yield 'heading', f"История приемов ({len(chart['history'])})"
+    for entry in chart['history']:
+        yield 'gap', ''
+        yield from _wrapped(
+            'heading',
+            f"{_format_date(entry['date'])} - {entry['doctor']} ({entry['doctor_specialization']})"
+        )
+        if entry.get('diagnosis'):
+            yield from _field('Диагноз', entry['diagnosis'])
+        for label, key in RECORD_FIELDS:
+            if entry.get(key):
+                yield from _field(label, entry[key])
+        if entry.get('prescriptions'):
+            yield 'label', 'Назначения:'
+            for number, p in enumerate(entry['prescriptions'], 1):
+                details = ', '.join(value for value in (p['dosage'], p['frequency'], p['duration']) if value)
+                yield from _wrapped('text', f"{number}. {p['medicine']}" + (f' - {details}' if details else ''))
+                if p.get('instructions'):
+                    yield from _wrapped('text', f"   {p['instructions']}")
+        if entry.get('files'):
+            yield 'label', 'Файлы:'
+            for f in entry['files']:
+                yield from _wrapped('text', f"{f['title']} ({f['file_type']})")
+        if entry.get('doctor_notes'):
+            yield 'label', 'Заметки врача:'
+            for note in entry['doctor_notes']:
+                yield from _wrapped('text', f"{_format_date(note['created_at'])}: {note['note']}")
+
+
+def _pages(lines):
+    """Разбивает строки на страницы по высоте."""
+    available = PAGE_SIZE[1] - 2 * MARGIN
+    page, used = [], 0.0
+    for style, text in lines:
+        height = STYLES[style][2]
+        if page and used + height > available:
+            yield page
+            page, used = [], 0.0
+        if style == 'gap' and not page:
+            continue
+        page.append((style, text))
+        used += height
+    if page:
+        yield page
+
+
+def _draw(page, number):
+    width, height = PAGE_SIZE
+    fig = Figure(figsize=PAGE_SIZE)
+    y = height - MARGIN
+    for style, text in page:
+        size, bold, line_height = STYLES[style]
+        if text:
+            fig.text(
+                MARGIN / width, y / height, text,
+                fontsize=size, fontweight='bold' if bold else 'normal', va='top'
+            )
+        y -= line_height
+    fig.text(1 - MARGIN / width, MARGIN / 2 / height, f'Стр. {number}', fontsize=8, ha='right', color='gray')
+    return fig
+
+
+def render(chart_json):
+    """Генератор PDF по частям: одна часть на страницу, последняя - шрифты и оглавление файла."""
+    chart = json.loads(chart_json)
+    out = _ChunkWriter()
+    with PdfPages(out, metadata={'Title': 'Медицинская карта', 'Creator': 'NovaMed'}) as pdf:
+        for number, page in enumerate(_pages(_lines(chart)), 1):
+            pdf.savefig(_draw(page, number))
+            yield out.drain()
+    yield out.drain()
+
+
+def get_cached(patient_id, is_doctor, version, built_at):
+    if version is None:
+        return None
+    return cache.get(_cache_key(patient_id, is_doctor, version, built_at))
+
+
+def stream(patient_id, is_doctor, chart_json, version, built_at):
+    """Отдает PDF по страницам и кладет целый документ в кэш после последней."""
+    parts = []
+    for chunk in render(chart_json):
+        parts.append(chunk)
+        yield chunk
+    # Снимок, записанный не до конца (version is None), не кэшируем
+    if version is not None:
+        cache.set(_cache_key(patient_id, is_doctor, version, built_at), b''.join(parts), CACHE_TIMEOUT)
@@ -0,0 +1,109 @@
+"""
+Снимки медицинских карт (PatientChart).
+
+Карта собирается один раз и хранится готовым JSON в двух вариантах:
+для пациента и для врача (с приватными заметками). Открытие карты - чтение
+одной строки. Изменения MedicalRecord, Prescription, DoctorNote, PatientFile,
+Patient и завершение приема помечают снимок устаревшим и увеличивают его
+версию (signals.py); фоновая команда rebuild_patient_charts пересобирает
+устаревшие снимки. Если снимок устарел к моменту чтения, он собирается сразу.
+
+Сборка записывает результат только если версия не изменилась за время
+сборки, поэтому параллельное изменение не затирается старыми данными.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import history
+from .models import Patient, PatientChart
+
+
+# Страховка для данных, которые не сбрасывают снимок (переименование врача, препарата)
+MAX_AGE = timedelta(seconds=getattr(settings, 'PATIENT_CHART_MAX_AGE', 24 * 3600))
+
+
+def build(patient):
+    """Оба варианта карты одним проходом по истории: (patient_json, doctor_json)."""
+    header = history.dumps(history.patient_data(patient))
+    public, private = [], []
+    for apt in history.history_queryset(patient).iterator(chunk_size=history.CHUNK_SIZE):
+        entry = history.history_entry(apt, is_doctor=True)
+        private.append(history.dumps(entry))
+        entry.pop('doctor_notes', None)
+        public.append(history.dumps(entry))
+
+    def document(entries):
+        return f'{{"patient":{header},"history":[{",".join(entries)}]}}'
+
+    return document(public), document(private)
+
+
+def _refresh(patient):
+    """
+    Пересобирает снимок: (patient_json, doctor_json, version, built_at).
+    version и built_at равны None, если снимок изменился во время сборки и не записан.
+    """
+    chart, _ = PatientChart.objects.get_or_create(
+        patient=patient,
+        defaults={'patient_json': '', 'doctor_json': '', 'is_stale': True},
+    )
+    patient_json, doctor_json = build(patient)
+    built_at = timezone.now()
+    saved = PatientChart.objects.filter(patient=patient, version=chart.version).update(
+        patient_json=patient_json,
+        doctor_json=doctor_json,
+        is_stale=False,
+        built_at=built_at,
+    )
+    if not saved:
+        return patient_json, doctor_json, None, None
+    return patient_json, doctor_json, chart.version, built_at
+
+
+def refresh(patient):
+    """Пересобирает снимок пациента и возвращает (patient_json, doctor_json)."""
+    patient_json, doctor_json, _, _ = _refresh(patient)
+    return patient_json, doctor_json
+
+
+def get(patient_id, is_doctor):
+    """
+    Карта из снимка (или собранная заново): (JSON, версия снимка, время сборки).
+    None, если пациента нет.
+    """
+    column = 'doctor_json' if is_doctor else 'patient_json'
+    row = PatientChart.objects.filter(
+        patient_id=patient_id, is_stale=False, built_at__gte=timezone.now() - MAX_AGE
+    ).values_list(column, 'version', 'built_at').first()
+    if row is not None:
+        return row
+
+    patient = Patient.objects.select_related('user').filter(id=patient_id).first()
+    if patient is None:
+        return None
+    patient_json, doctor_json, version, built_at = _refresh(patient)
+    return (doctor_json if is_doctor else patient_json), version, built_at
+
+
+def get_json(patient_id, is_doctor):
+    """JSON карты из снимка (или собранный заново); None, если пациента нет."""
+    chart = get(patient_id, is_doctor)
+    return chart[0] if chart is not None else None
+
+
+def mark_stale(**lookup):
+    """Помечает устаревшими снимки, подходящие под фильтр (например patient_id=...)."""
+    PatientChart.objects.filter(**lookup).update(is_stale=True, version=F('version') + 1)
+
+
+def rebuild_stale(batch_size):
+    """Пересобирает до batch_size устаревших снимков, самые старые первыми."""
+    patient_ids = list(
+        PatientChart.objects.filter(is_stale=True).order_by('built_at').values_list('patient_id', flat=True)[:batch_size]
+    )
+    for patient in Patient.objects.select_related('user').filter(id__in=patient_ids):
+        refresh(patient)
+    return len(patient_ids)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Профили ролей, индекс слотов и кэш ответов сбрасываются сигналами.
+    LocMemCache живет в памяти процесса: сброс не доходит до остальных
+    воркеров gunicorn, и до истечения срока жизни записей они работают
+    с устаревшими данными. В одном процессе такой кэш корректен.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        'Кэш по умолчанию - LocMemCache: сброс кэша не доходит до других процессов',
+        hint='Задайте REDIS_URL, если веб-процесс запускается с несколькими воркерами.',
+        id='patients.W001',
+    )]
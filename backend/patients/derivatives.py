@@ -0,0 +1,228 @@
+"""
+Миниатюры и превью снимков (рентген, МРТ, КТ, УЗИ).
+
+После загрузки снимка его блоб ставится в очередь (derivatives_status='pending',
+signals.py), и после коммита копии создаются в фоне того же веб-процесса:
+файл блоба лежит на его локальном диске, отдельный процесс (dyno) его не
+увидит. Блобы берутся в аренду как в outbox.py: короткая транзакция
+(SELECT ... FOR UPDATE SKIP LOCKED) ставит статус 'processing' и срок аренды
+и сразу коммитится, изображения уменьшаются в пуле потоков (imaging.py, Pillow
+отпускает GIL) без открытой транзакции, а результат записывается условным
+UPDATE, только если аренда все еще наша. Поэтому blobs.acquire/release не
+ждут, пока обрабатывается пачка.
+
+Ошибка откладывает повтор с экспоненциальной задержкой, после MAX_ATTEMPTS
+попыток блоб остается 'failed'. Блобы упавшего процесса возвращаются в работу
+по истечении аренды. Команда generate_derivatives обрабатывает очередь
+вручную (пул процессов) - на одном сервере или с общим хранилищем.
+
+Готовые копии попадают в медицинскую карту (thumbnail_url/preview_url): снимки
+карт помечаются устаревшими, а приемы - измененными для дельта-синхронизации.
+Одинаковые снимки хранятся одним блобом, поэтому копии создаются один раз.
+Файлы, которые Pillow не читает (DICOM, PDF), получают статус 'skipped'.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from . import changelog, charts, imaging
+from .models import FileBlob, PatientFile
+
+
+IMAGING_TYPES = ('xray', 'mri', 'ct', 'ultrasound')
+SIZES = {
+    'thumbnail': tuple(getattr(settings, 'DERIVATIVE_THUMBNAIL_SIZE', (256, 256))),
+    'preview': tuple(getattr(settings, 'DERIVATIVE_PREVIEW_SIZE', (1280, 1280))),
+}
+BATCH_SIZE = 20
+WORKERS = getattr(settings, 'DERIVATIVES_WORKERS', 2)
+MAX_ATTEMPTS = getattr(settings, 'DERIVATIVES_MAX_ATTEMPTS', 5)
+BACKOFF_BASE = getattr(settings, 'DERIVATIVES_BACKOFF_SECONDS', 60)
+BACKOFF_MAX = getattr(settings, 'DERIVATIVES_BACKOFF_MAX_SECONDS', 3600)
+LEASE = timedelta(seconds=getattr(settings, 'DERIVATIVES_LEASE_SECONDS', 600))
+
+
+def enqueue(patient_file):
+    """Ставит блоб снимка в очередь, если копии для него еще не создавались."""
+    if patient_file.blob_id and patient_file.file_type in IMAGING_TYPES:
+        queued = FileBlob.objects.filter(sha256=patient_file.blob_id, derivatives_status='none').update(
+            derivatives_status='pending', derivatives_next_at=timezone.now()
+        )
+        if queued:
+            transaction.on_commit(kick)
+
+
+def enqueue_existing():
+    """Ставит в очередь все снимки, загруженные до появления копий."""
+    return FileBlob.objects.filter(
+        derivatives_status='none', patient_files__file_type__in=IMAGING_TYPES
+    ).distinct().update(derivatives_status='pending', derivatives_next_at=timezone.now())
+
+
+def backoff_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def _source(blob):
+    # Локальное хранилище - процессу пула передается только путь
+    try:
+        return blob.file.path
+    except NotImplementedError:
+        with blob.file.open('rb') as fh:
+            return fh.read()
+
+
+def _notify(sha256s):
+    """Копии готовы: карты пересобрать, приемы отдать клиентам при синхронизации."""
+    charts.mark_stale(patient__files__blob__in=sha256s)
+    rows = PatientFile.objects.filter(blob__in=sha256s, medical_record__isnull=False).values_list(
+        'medical_record__appointment_id', 'patient_id', 'medical_record__appointment__doctor_id'
+    ).distinct()
+    changelog.record_many(rows)
+
+
+def _due(now):
+    return FileBlob.objects.filter(
+        derivatives_status__in=('pending', 'processing', 'failed'),
+        derivatives_next_at__lte=now,
+        derivatives_attempts__lt=MAX_ATTEMPTS,
+    )
+
+
+def _claim(batch_size):
+    """
+    Забирает пачку блобов в аренду: статус 'processing', попытка засчитывается
+    сразу, derivatives_next_at - конец аренды. Блокировки строк держатся только
+    до коммита этой короткой транзакции.
+    """
+    now = timezone.now()
+    lease_until = now + LEASE
+    with transaction.atomic():
+        ids = list(
+            _due(now).select_for_update(skip_locked=True)
+            .order_by('derivatives_next_at')
+            .values_list('sha256', flat=True)[:batch_size]
+        )
+        if not ids:
+            return [], lease_until
+        FileBlob.objects.filter(sha256__in=ids).update(
+            derivatives_status='processing',
+            derivatives_attempts=F('derivatives_attempts') + 1,
+            derivatives_next_at=lease_until,
+        )
+    # Последняя попытка упавшего процесса: повторов больше не будет
+    FileBlob.objects.filter(
+        derivatives_status='processing', derivatives_next_at__lte=now, derivatives_attempts__gte=MAX_ATTEMPTS
+    ).update(derivatives_status='failed', derivatives_next_at=None)
+    return list(FileBlob.objects.filter(sha256__in=ids)), lease_until
+
+
+def _record(blob, lease_until, **fields):
+    """Записывает результат, только если блоб все еще в нашей аренде."""
+    return FileBlob.objects.filter(
+        sha256=blob.sha256, derivatives_status='processing', derivatives_next_at=lease_until
+    ).update(**fields)
+
+
+def _save_copies(blob, lease_until, result):
+    blob.thumbnail.save('thumbnail.jpg', ContentFile(result['thumbnail']), save=False)
+    blob.preview.save('preview.jpg', ContentFile(result['preview']), save=False)
+    if _record(blob, lease_until, thumbnail=blob.thumbnail.name, preview=blob.preview.name,
+               derivatives_status='ready', derivatives_next_at=None):
+        return True
+    # Аренда потеряна или блоб удален вместе с последним файлом - копии не нужны
+    print(f"--- [Превью] Аренда {blob.sha256} истекла, результат отброшен")
+    blob.thumbnail.delete(save=False)
+    blob.preview.delete(save=False)
+    return False
+
+
+def process_batch(executor, batch_size=BATCH_SIZE):
+    """
+    Создает копии для одной пачки блобов из очереди.
+    Возвращает (готово, пропущено, ошибок).
+    """
+    ready = skipped = failed = 0
+    blobs, lease_until = _claim(batch_size)
+    if not blobs:
+        return ready, skipped, failed
+
+    done = []
+    futures = {executor.submit(imaging.render_derivatives, _source(blob), SIZES): blob for blob in blobs}
+    for future in as_completed(futures):
+        blob = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"--- [Превью] Ошибка для {blob.sha256} (попытка {blob.derivatives_attempts}): {type(e).__name__}: {e}")
+            _record(blob, lease_until, derivatives_status='failed',
+                    derivatives_next_at=timezone.now() + backoff_delay(blob.derivatives_attempts))
+            failed += 1
+            continue
+        if result is None:
+            _record(blob, lease_until, derivatives_status='skipped', derivatives_next_at=None)
+            skipped += 1
+            continue
+        if _save_copies(blob, lease_until, result):
+            done.append(blob.sha256)
+            ready += 1
+
+    if done:
+        _notify(done)
+    return ready, skipped, failed
+
+
+# --- Обработка в фоне веб-процесса ---
+
+_lock = threading.Lock()
+_dispatcher = None
+_renderer = None
+_retry_timer = None
+_retry_at = None
+
+
+def kick():
+    """Запускает разбор очереди в фоновом потоке текущего процесса и сразу возвращается."""
+    global _dispatcher, _renderer
+    with _lock:
+        if _dispatcher is None:
+            _dispatcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='derivatives')
+            _renderer = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='derivatives-render')
+    _dispatcher.submit(_drain)
+
+
+def _drain():
+    try:
+        while sum(process_batch(_renderer)) >= BATCH_SIZE:
+            pass
+        _schedule_retry()
+    except Exception as e:
+        print(f"--- [Превью] Ошибка обработки очереди: {type(e).__name__}: {e}")
+    finally:
+        # Соединение с БД этого потока
+        connections.close_all()
+
+
+def _schedule_retry():
+    """Повтор после ошибки или истекшей аренды: таймер до ближайшего срока."""
+    global _retry_timer, _retry_at
+    next_at = FileBlob.objects.filter(
+        Q(derivatives_status='processing') | Q(derivatives_status='failed', derivatives_attempts__lt=MAX_ATTEMPTS)
+    ).aggregate(next_at=Min('derivatives_next_at'))['next_at']
+    if next_at is None:
+        return
+    with _lock:
+        if _retry_timer is not None and _retry_timer.is_alive():
+            if _retry_at <= next_at:
+                return
+            _retry_timer.cancel()
+        _retry_at = next_at
+        _retry_timer = threading.Timer(max((next_at - timezone.now()).total_seconds(), 1), kick)
+        _retry_timer.daemon = True
+        _retry_timer.start()
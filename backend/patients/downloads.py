@@ -0,0 +1,181 @@
+"""
+Отдача файлов пациентов с проверкой доступа (PatientFileDownloadView).
+
+- FileResponse: открытый файл передается WSGI-серверу как есть, gunicorn
+  отправляет его через sendfile без копирования в Python. Для Range файл
+  заранее ставится на начало диапазона, а Content-Length ограничивает длину.
+- Если задан FILE_DOWNLOAD_ACCEL_PREFIX, отдачу делает nginx
+  (X-Accel-Redirect на internal location с PROTECTED_MEDIA_ROOT), включая Range.
+
+Файлы пациентов не имеют публичных URL (storage.py): и оригинал, и копии
+снимков (variant=thumbnail|preview) отдаются только отсюда.
+
+Содержимое PatientFile не меняется после загрузки, поэтому ETag строгий:
+SHA-256 блоба (для копий - с именем копии). Условные запросы (If-None-Match, If-Modified-Since, If-Range)
+обрабатываются до открытия файла.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+ACCEL_PREFIX = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', None)
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+VARIANTS = ('thumbnail', 'preview')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class _RangeFile:
+    """
+    Открытый файл, ограниченный length байтами с текущей позиции.
+    fileno() оставлен, чтобы сервер мог отправить диапазон через sendfile.
+    """
+
+    def __init__(self, fh, length):
+        self._fh = fh
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fh.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._fh.fileno()
+
+    def close(self):
+        self._fh.close()
+
+
+def stored_file(patient_file, variant=None):
+    """Оригинал или уменьшенная копия снимка (FieldFile); None, если файла нет."""
+    if variant is None:
+        return patient_file.file or None
+    blob = patient_file.blob
+    return (getattr(blob, variant) or None) if blob else None
+
+
+def url(patient_file, variant=None, as_attachment=False):
+    """Ссылка на отдачу с проверкой доступа (путь, без домена)."""
+    link = reverse('download_file', args=[patient_file.id])
+    if variant:
+        return f'{link}?variant={variant}'
+    return f'{link}?download=1' if as_attachment else link
+
+
+def etag(patient_file, variant=None):
+    if variant:
+        return f'"{patient_file.blob_id}-{variant}"'
+    if patient_file.blob_id:
+        return f'"{patient_file.blob_id}"'
+    # Файлы, загруженные до блобов (см. adopt_file_blobs)
+    return f'W/"{patient_file.id}-{int(patient_file.uploaded_at.timestamp())}"'
+
+
+def parse_range(header, size):
+    """
+    (начало, конец) включительно для заголовка Range или None, если отдавать файл целиком.
+    Несколько диапазонов не поддерживаются - отдается весь файл (это допускает RFC 9110).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            raise RangeNotSatisfiable()
+    else:
+        # bytes=-N: последние N байт
+        if int(last) == 0:
+            raise RangeNotSatisfiable()
+        start, end = max(size - int(last), 0), size - 1
+    return start, end
+
+
+def _if_range_matches(request, tag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"'):
+        # Сравнение только строгих ETag
+        return not tag.startswith('W/') and value == tag
+    date = parse_http_date_safe(value)
+    return date is not None and date >= last_modified
+
+
+def download_name(patient_file, variant=None):
+    title = patient_file.title or 'file'
+    if variant:
+        return f'{os.path.splitext(title)[0]}_{variant}.jpg'
+    ext = os.path.splitext(patient_file.file.name)[1]
+    return title if title.lower().endswith(ext.lower()) else f'{title}{ext}'
+
+
+def serve(request, patient_file, variant=None, as_attachment=False):
+    """Ответ с файлом; FileNotFoundError, если его нет (в т.ч. копия еще не готова)."""
+    field = stored_file(patient_file, variant)
+    if field is None:
+        raise FileNotFoundError(patient_file.id)
+
+    tag = etag(patient_file, variant)
+    last_modified = int(patient_file.uploaded_at.timestamp())
+    not_modified = get_conditional_response(request, etag=tag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['ETag'] = tag
+        return not_modified
+
+    filename = download_name(patient_file, variant)
+    if ACCEL_PREFIX:
+        response = HttpResponse()
+        del response['Content-Type']  # тип определит nginx по файлу
+        response['X-Accel-Redirect'] = ACCEL_PREFIX.rstrip('/') + '/' + quote(field.name)
+        disposition = 'attachment' if as_attachment else 'inline'
+        response['Content-Disposition'] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+    else:
+        response = _file_response(request, field, filename, as_attachment, tag, last_modified)
+
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    # Кэшировать можно, но каждый раз с проверкой (и проверкой доступа) на сервере
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _file_response(request, field, filename, as_attachment, tag, last_modified):
+    size = field.size
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range and not _if_range_matches(request, tag, last_modified):
+        byte_range = None
+
+    fh = field.storage.open(field.name, 'rb')
+    if byte_range is None:
+        return FileResponse(fh, as_attachment=as_attachment, filename=filename)
+
+    start, end = byte_range
+    fh.seek(start)
+    response = FileResponse(_RangeFile(fh, end - start + 1), as_attachment=as_attachment, filename=filename)
+    response.status_code = 206
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = end - start + 1
+    return response
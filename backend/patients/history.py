@@ -0,0 +1,131 @@
+"""
+Медицинская карта пациента: данные пациента и история завершенных приемов.
+
+Используется PatientMedicalHistoryView. В режиме стриминга JSON отдается
+по частям: приемы читаются итератором пачками по chunk_size, связанные
+данные (рецепты, файлы, заметки) подгружаются prefetch'ем на каждую пачку,
+поэтому память на воркер ограничена размером пачки, а не всей историей.
+"""
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import downloads
+from .models import Appointment
+
+
+CHUNK_SIZE = 100
+
+
+def patient_data(patient):
+    return {
+        'id': patient.id,
+        'name': f"{patient.first_name} {patient.last_name}",
+        'first_name': patient.first_name,
+        'last_name': patient.last_name,
+        'birth_date': patient.birth_date,
+        'gender': patient.get_gender_display(),
+        'height': patient.height,
+        'weight': patient.weight,
+        'iin': patient.iin,
+        'phone': patient.user.phone,
+        'chronic_diseases': patient.chronic_diseases,
+        'allergies': patient.allergies,
+        'blood_type': patient.blood_type,
+        'insurance_number': patient.insurance_number,
+        'emergency_contact': patient.emergency_contact,
+    }
+
+
+def history_queryset(patient):
+    """Завершенные приемы пациента со всеми связанными данными, новые первыми."""
+    return Appointment.objects.completed().filter(
+        patient=patient
+    ).select_related('doctor', 'medical_record').prefetch_related(
+        'medical_record__prescriptions__medicine',
+        'medical_record__doctor_notes',
+        'medical_record__files__blob'
+    ).order_by('-date_time')
+
+
+def history_entry(apt, is_doctor):
+    record_data = {
+        'appointment_id': apt.id,
+        'date': apt.date_time.isoformat(),
+        'doctor': f"{apt.doctor.last_name} {apt.doctor.first_name}",
+        'doctor_specialization': apt.doctor.specialty,
+        'diagnosis': apt.diagnosis,
+    }
+
+    if hasattr(apt, 'medical_record'):
+        mr = apt.medical_record
+        record_data.update({
+            'medical_record_id': mr.id,
+            'complaints': mr.complaints,
+            'anamnesis': mr.anamnesis,
+            'objective_data': mr.objective_data,
+            'recommendations': mr.recommendations,
+            'prescriptions': [
+                {
+                    'id': p.id,
+                    'medicine': p.medicine.name,
+                    'medicine_id': p.medicine.id,
+                    'dosage': p.dosage,
+                    'frequency': p.frequency,
+                    'duration': p.duration,
+                    'instructions': p.instructions
+                }
+                for p in mr.prescriptions.all()
+            ],
+            'files': [
+                {
+                    'id': f.id,
+                    'title': f.title,
+                    'file_type': f.get_file_type_display(),
+                    'uploaded_at': f.uploaded_at.isoformat(),
+                    # Только ссылки на отдачу с проверкой доступа (downloads.py), не на MEDIA
+                    'url': downloads.url(f),
+                    'download_url': downloads.url(f, as_attachment=True),
+                    # Миниатюра и превью снимков (derivatives.py), пока не готовы - None
+                    'thumbnail_url': downloads.url(f, 'thumbnail') if f.blob and f.blob.thumbnail else None,
+                    'preview_url': downloads.url(f, 'preview') if f.blob and f.blob.preview else None,
+                }
+                for f in mr.files.all()
+            ]
+        })
+
+        # Приватные заметки видны только врачу
+        if is_doctor:
+            record_data['doctor_notes'] = [
+                {
+                    'note': note.note,
+                    'created_at': note.created_at.isoformat()
+                }
+                for note in mr.doctor_notes.all()
+            ]
+
+    return record_data
+
+
+def dumps(data):
+    # Тот же формат, что у JSONRenderer DRF по умолчанию
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def stream(patient, is_doctor, chunk_size=CHUNK_SIZE):
+    """
+    Генератор JSON-документа {"patient": ..., "history": [...]} по частям.
+    Каждая часть - одна пачка приемов.
+    """
+    yield f'{{"patient":{dumps(patient_data(patient))},"history":['.encode()
+    batch = []
+    first = True
+    for apt in history_queryset(patient).iterator(chunk_size=chunk_size):
+        batch.append(dumps(history_entry(apt, is_doctor)))
+        if len(batch) >= chunk_size:
+            yield (('' if first else ',') + ','.join(batch)).encode()
+            first = False
+            batch = []
+    if batch:
+        yield (('' if first else ',') + ','.join(batch)).encode()
+    yield b']}'
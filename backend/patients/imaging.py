@@ -0,0 +1,52 @@
+"""
+Уменьшенные копии снимков (Pillow).
+
+Модуль не зависит от Django: функции выполняются в потоках веб-процесса
+или в процессах пула команды generate_derivatives и получают путь к файлу
+или его байты.
+"""
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+JPEG_QUALITY = 85
+
+
+def _to_8bit(image):
+    """16-битные и float-снимки (рентген) растягиваются в 0..255, а не обрезаются."""
+    if image.mode.startswith('I;16'):
+        image = image.convert('I')
+    if image.mode in ('I', 'F'):
+        low, high = image.getextrema()
+        scale = 255.0 / (high - low) if high > low else 1.0
+        return image.point(lambda v: (v - low) * scale).convert('L')
+    if image.mode not in ('L', 'RGB'):
+        return image.convert('RGB')
+    return image
+
+
+def render_derivatives(source, sizes):
+    """
+    source - путь к файлу или байты; sizes - {имя: (ширина, высота)}.
+    Возвращает {имя: JPEG-байты} или None, если файл не является изображением.
+    """
+    try:
+        image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    except UnidentifiedImageError:
+        return None
+
+    with image:
+        largest = max(sizes.values())
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft(None, largest)
+        image = _to_8bit(ImageOps.exif_transpose(image))
+
+        result = {}
+        # От большего к меньшему: каждая копия уменьшается из предыдущей
+        for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            image.thumbnail(size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            result[name] = buffer.getvalue()
+    return result
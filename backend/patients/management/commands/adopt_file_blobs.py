@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from patients.blobs import adopt
+from patients.models import PatientFile
+
+
+class Command(BaseCommand):
+    help = (
+        'Переводит файлы пациентов, загруженные до появления хранилища блобов, '
+        'на блобы; копии одинаковых файлов удаляются. Запускается один раз после миграции.'
+    )
+
+    def handle(self, *args, **options):
+        adopted = duplicates = missing = 0
+        for pf in PatientFile.objects.filter(blob__isnull=True).exclude(file='').iterator():
+            try:
+                duplicates += adopt(pf)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            adopted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Переведено файлов: {adopted}, из них дубликатов: {duplicates}, не найдено на диске: {missing}'
+        ))
@@ -0,0 +1,138 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from patients.models import Appointment, Doctor, Patient
+
+
+INDEX_NAMES = (
+    'appt_doctor_status_dt_idx',
+    'appt_patient_status_dt_idx',
+    'appt_scheduled_dt_idx',
+    'appt_doctor_list_idx',
+    'appt_patient_list_idx',
+)
+CONSTRAINT_NAME = 'appt_unique_scheduled_doctor_slot'
+
+SEED_SQL = """
+    WITH ids AS (
+        SELECT %(patient_ids)s::bigint[] AS patients, %(doctor_ids)s::bigint[] AS doctors
+    )
+    INSERT INTO patients_appointment (patient_id, doctor_id, date_time, status, notes, diagnosis, room_number)
+    SELECT
+        ids.patients[1 + (g %% array_length(ids.patients, 1))],
+        ids.doctors[1 + ((g / 7) %% array_length(ids.doctors, 1))],
+        %(start)s + g * interval '1 minute',
+        CASE
+            WHEN %(start)s + g * interval '1 minute' > now() THEN 'scheduled'
+            WHEN g %% 10 = 0 THEN 'cancelled'
+            ELSE 'completed'
+        END,
+        '', '', ''
+    FROM ids, generate_series(1, %(rows)s) AS g
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет таблицу записей синтетическими данными и печатает планы (EXPLAIN ANALYZE) '
+        'горячих запросов с индексами и без них. Только PostgreSQL; все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000, help='Сколько записей создать')
+        parser.add_argument('--doctors', type=int, default=200, help='Сколько врачей создать')
+        parser.add_argument('--patients', type=int, default=20_000, help='Сколько пациентов создать')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Бенчмарк поддерживает только PostgreSQL')
+
+        with transaction.atomic():
+            doctor_ids, patient_ids = self._seed_people(options['doctors'], options['patients'])
+            self._seed_appointments(doctor_ids, patient_ids, options['rows'])
+
+            queries = self._hot_queries(doctor_ids[0], patient_ids[0])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('\n=== С индексами ==='))
+            self._explain_all(queries)
+
+            with connection.cursor() as cursor:
+                # Отложенные проверки FK мешают DDL внутри транзакции
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                # Частичное уникальное ограничение создается как уникальный индекс
+                for name in INDEX_NAMES + (CONSTRAINT_NAME,):
+                    cursor.execute(f'DROP INDEX {name}')
+                cursor.execute('ANALYZE patients_appointment')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('\n=== Без индексов ==='))
+            self._explain_all(queries)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('\nГотово, тестовые данные откатены.'))
+
+    def _seed_people(self, doctors_count, patients_count):
+        self.stdout.write(f'Создание {doctors_count} врачей и {patients_count} пациентов...')
+        users = User.objects.bulk_create([
+            User(username=f'bench_{i}', email=f'bench_{i}@bench.local', password='!', is_active=False,
+                 is_doctor=i < doctors_count, is_patient=i >= doctors_count)
+            for i in range(doctors_count + patients_count)
+        ], batch_size=5000)
+        doctor_users, patient_users = users[:doctors_count], users[doctors_count:]
+
+        doctors = Doctor.objects.bulk_create([
+            Doctor(user=u, first_name='Bench', last_name=str(i), birth_date=date(1980, 1, 1),
+                   iin=f'9{i:011d}', specialty=random.choice(['Терапевт', 'Хирург', 'Кардиолог']),
+                   experience_years=10, work_phone='+70000000000')
+            for i, u in enumerate(doctor_users)
+        ], batch_size=5000)
+        patients = Patient.objects.bulk_create([
+            Patient(user=u, first_name='Bench', last_name=str(i), birth_date=date(1990, 1, 1),
+                    gender='M', iin=f'8{i:011d}')
+            for i, u in enumerate(patient_users)
+        ], batch_size=5000)
+        return [d.id for d in doctors], [p.id for p in patients]
+
+    def _seed_appointments(self, doctor_ids, patient_ids, rows):
+        self.stdout.write(f'Создание {rows} записей...')
+        started = time.monotonic()
+        # Записи идут раз в минуту, поэтому пара (врач, время) не повторяется
+        start = timezone.now() - timedelta(minutes=int(rows * 0.9))
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_SQL, {
+                'patient_ids': patient_ids,
+                'doctor_ids': doctor_ids,
+                'start': start,
+                'rows': rows,
+            })
+            cursor.execute('ANALYZE patients_appointment')
+        self.stdout.write(f'  заняло {time.monotonic() - started:.1f} с')
+
+    def _hot_queries(self, doctor_id, patient_id):
+        now = timezone.now()
+        today_start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow_start = today_start + timedelta(days=1)
+        return [
+            ('Записи врача на день (MyAppointmentsView, AvailableSlotsView)',
+             Appointment.objects.filter(doctor_id=doctor_id, status='scheduled',
+                                        date_time__gte=tomorrow_start,
+                                        date_time__lt=tomorrow_start + timedelta(days=1))),
+            ('Завершенные приемы врача за 30 дней (DoctorStatisticsView)',
+             Appointment.objects.filter(doctor_id=doctor_id, status='completed',
+                                        date_time__gte=now - timedelta(days=30)).values('id')),
+            ('Записи пациента (MyAppointmentsView)',
+             Appointment.objects.filter(patient_id=patient_id, status='scheduled').order_by('date_time')),
+            ('Просроченные записи (cancel_missed_appointments)',
+             Appointment.objects.filter(status='scheduled', date_time__lt=today_start).values('id')),
+        ]
+
+    def _explain_all(self, queries):
+        for title, queryset in queries:
+            self.stdout.write(self.style.HTTP_INFO(f'\n-- {title}'))
+            self.stdout.write(queryset.explain(analyze=True, buffers=True))
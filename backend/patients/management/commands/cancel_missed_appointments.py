@@ -0,0 +1,35 @@
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from patients.tasks import cancel_missed_appointments
+
+
+class Command(BaseCommand):
+    help = (
+        'Отменяет все запланированные записи, день которых уже прошел. '
+        'С --loop работает постоянно (процесс clock): отменяет сразу при старте '
+        'и затем каждый день сразу после полуночи по местному времени.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно (процесс clock)')
+        parser.add_argument('--delay', type=int, default=5, help='Через сколько минут после полуночи запускать')
+
+    def handle(self, *args, **options):
+        while True:
+            count = cancel_missed_appointments()
+            self.stdout.write(self.style.SUCCESS(f'Отменено пропущенных записей: {count}'))
+
+            if not options['loop']:
+                break
+            time.sleep(self._seconds_until_next_run(options['delay']))
+
+    def _seconds_until_next_run(self, delay):
+        now = timezone.localtime()
+        next_run = timezone.make_aware(
+            datetime.combine(now.date() + timedelta(days=1), dt_time()) + timedelta(minutes=delay)
+        )
+        return max((next_run - now).total_seconds(), 0)
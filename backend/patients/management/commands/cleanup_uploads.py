@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from patients.uploads import cleanup_stale
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные загрузки файлов по частям и их временные файлы. Запускается планировщиком ежедневно.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Сколько часов без новых частей считать загрузку брошенной')
+
+    def handle(self, *args, **options):
+        count = cleanup_stale(timedelta(hours=options['hours']))
+        self.stdout.write(self.style.SUCCESS(f'Удалено брошенных загрузок: {count}'))
@@ -0,0 +1,27 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from patients import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает аналитику по клинике (загрузка по часам недели, показатели отделений, диагнозы), '
+        'кладет ее в кэш и печатает в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Начало периода (YYYY-MM-DD), по умолчанию - 90 дней назад')
+        parser.add_argument('--end', help='Конец периода (YYYY-MM-DD), по умолчанию - сегодня')
+        parser.add_argument('--cached', action='store_true', help='Взять отчет из кэша, если он есть')
+
+    def handle(self, *args, **options):
+        start_day = parse_date(options['start']) if options['start'] else None
+        end_day = parse_date(options['end']) if options['end'] else None
+        if (options['start'] and not start_day) or (options['end'] and not end_day):
+            raise CommandError('Неверный формат даты, нужен YYYY-MM-DD')
+
+        report = analytics.get_report(start_day, end_day, refresh=not options['cached'])
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,37 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from patients.derivatives import enqueue_existing, process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает миниатюры и превью снимков из очереди (Pillow, пул процессов). '
+        'Обычно копии создает веб-процесс после загрузки; команда нужна, чтобы '
+        'разобрать очередь вручную на сервере, который видит файлы блобов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Файлов за одну пачку')
+        parser.add_argument('--workers', type=int, default=None, help='Процессов в пуле (по умолчанию - число ядер)')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно (фоновый процесс)')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между опросами, если очередь пуста (сек)')
+        parser.add_argument('--enqueue-existing', action='store_true', help='Поставить в очередь снимки, загруженные раньше')
+
+    def handle(self, *args, **options):
+        if options['enqueue_existing']:
+            self.stdout.write(f'Поставлено в очередь: {enqueue_existing()}')
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                ready, skipped, failed = process_batch(executor, options['batch_size'])
+                if ready or skipped or failed:
+                    self.stdout.write(f'Превью: готово {ready}, пропущено {skipped}, ошибок {failed}')
+
+                if not options['loop']:
+                    break
+                # Пачка была полной - сразу забираем следующую
+                if ready + skipped + failed < options['batch_size']:
+                    time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет уведомления из outbox (email/SMS) пачками с повторами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Сообщений за одну пачку')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно (процесс worker)')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между опросами, если очередь пуста (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, retried, dead = deliver_batch(options['batch_size'])
+            if sent or retried or dead:
+                self.stdout.write(f'Outbox: отправлено {sent}, отложено {retried}, не доставлено {dead}')
+
+            if not options['loop']:
+                break
+            # Пачка была полной - сразу забираем следующую
+            if sent + retried + dead < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from patients import stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет или чинит дневную статистику врачей (DoctorDailyStats) '
+        'по завершенным приемам за период.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Сколько последних дней пересчитать')
+        parser.add_argument('--start', help='Начало периода (YYYY-MM-DD), вместо --days')
+        parser.add_argument('--end', help='Конец периода (YYYY-MM-DD), по умолчанию - сегодня')
+        parser.add_argument('--doctor', type=int, help='Только для врача с этим id')
+
+    def handle(self, *args, **options):
+        end_day = parse_date(options['end']) if options['end'] else timezone.localdate()
+        if options['start']:
+            start_day = parse_date(options['start'])
+        else:
+            start_day = end_day - timedelta(days=options['days'])
+        if not start_day or not end_day:
+            raise CommandError('Неверный формат даты, нужен YYYY-MM-DD')
+        if start_day > end_day:
+            raise CommandError('Начало периода позже конца')
+
+        with transaction.atomic():
+            written = stats.rebuild(start_day, end_day, doctor_id=options['doctor'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика за {start_day} - {end_day} пересчитана, строк: {written}'
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from patients.charts import rebuild_stale
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает устаревшие снимки медицинских карт пациентов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Карт за одну пачку')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно (фоновый процесс)')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между опросами, если устаревших карт нет (сек)')
+
+    def handle(self, *args, **options):
+        while True:
+            rebuilt = rebuild_stale(options['batch_size'])
+            if rebuilt:
+                self.stdout.write(f'Карты: пересобрано {rebuilt}')
+
+            if not options['loop']:
+                break
+            # Пачка была полной - сразу забираем следующую
+            if rebuilt < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.formats import date_format
+
+from patients.models import Appointment, AppointmentReminder
+from patients.sms_service import send_sms
+
+
+class Command(BaseCommand):
+    help = (
+        'Рассылает напоминания (email и SMS) о приемах на завтра. '
+        'Уже отправленные напоминания пропускаются, поэтому команду можно перезапускать.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата приемов (YYYY-MM-DD), по умолчанию - завтра')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Записей в одной пачке')
+        parser.add_argument('--no-sms', action='store_true', help='Не отправлять SMS')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            target_date = parse_date(options['date'])
+            if not target_date:
+                raise CommandError('Неверный формат даты, нужен YYYY-MM-DD')
+        else:
+            target_date = timezone.localdate() + timedelta(days=1)
+
+        channels = ['email'] if options['no_sms'] else ['email', 'sms']
+        # Шаблоны компилируются один раз на весь запуск
+        self.html_template = get_template('emails/appointment_reminder.html')
+        self.subject = f"Напоминание о приеме в NovaMed {target_date.strftime('%d.%m.%Y')}"
+
+        appointments = (
+            Appointment.objects.scheduled()
+            .for_local_day(target_date)
+            .select_related('patient__user', 'doctor')
+            .order_by('id')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+
+        totals = {'sent': 0, 'failed': 0, 'skipped': 0}
+        while True:
+            chunk = list(islice(appointments, options['chunk_size']))
+            if not chunk:
+                break
+            for key, value in self._process_chunk(chunk, channels).items():
+                totals[key] += value
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Напоминания на {target_date}: отправлено {totals['sent']}, "
+            f"ошибок {totals['failed']}, пропущено {totals['skipped']}"
+        ))
+
+    def _process_chunk(self, chunk, channels):
+        done = set(
+            AppointmentReminder.objects.filter(
+                appointment_id__in=[apt.id for apt in chunk], status='sent'
+            ).values_list('appointment_id', 'channel')
+        )
+        counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+
+        # Одно SMTP-соединение на пачку
+        connection = get_connection()
+        try:
+            for apt in chunk:
+                for channel in channels:
+                    if (apt.id, channel) in done:
+                        counts['skipped'] += 1
+                        continue
+                    try:
+                        if not self._send(apt, channel, connection):
+                            counts['skipped'] += 1
+                            continue
+                    except Exception as e:
+                        self._record(apt, channel, 'failed', error=f'{type(e).__name__}: {e}')
+                        counts['failed'] += 1
+                    else:
+                        self._record(apt, channel, 'sent', sent_at=timezone.now())
+                        counts['sent'] += 1
+        finally:
+            connection.close()
+        return counts
+
+    def _record(self, apt, channel, status, error='', sent_at=None):
+        """
+        Результат сохраняется сразу после отправки, а не в конце пачки:
+        если команда упадет посреди пачки, перезапуск не отправит повторно
+        уже доставленные напоминания.
+        """
+        AppointmentReminder.objects.bulk_create(
+            [AppointmentReminder(appointment=apt, channel=channel, status=status, error=error, sent_at=sent_at)],
+            update_conflicts=True,
+            unique_fields=['appointment', 'channel'],
+            update_fields=['status', 'error', 'sent_at'],
+        )
+
+    def _send(self, apt, channel, connection):
+        """Отправляет напоминание. Возвращает False, если у пациента нет контакта для канала."""
+        local_dt = timezone.localtime(apt.date_time)
+        if channel == 'email':
+            if not apt.patient.user.email:
+                return False
+            context = {
+                'patient_name': apt.patient.first_name,
+                'doctor_name': f"{apt.doctor.last_name} {apt.doctor.first_name}",
+                'doctor_specialty': apt.doctor.specialty,
+                'appointment_date': date_format(local_dt, 'j E Y г.'),
+                'appointment_time': local_dt.strftime('%H:%M'),
+                'room_number': apt.room_number or apt.doctor.office_number or 'уточняется',
+            }
+            plain_message = (
+                f"Здравствуйте, {context['patient_name']}! Напоминаем о приеме у врача "
+                f"{context['doctor_name']} {context['appointment_date']} в {context['appointment_time']}."
+            )
+            email = EmailMultiAlternatives(
+                self.subject, plain_message, settings.DEFAULT_FROM_EMAIL, [apt.patient.user.email],
+                connection=connection,
+            )
+            email.attach_alternative(self.html_template.render(context), 'text/html')
+            email.send()
+            return True
+
+        phone = apt.patient.user.phone
+        if not phone:
+            return False
+        message = f"NovaMed: напоминаем о приеме у Dr. {apt.doctor.last_name} {local_dt.strftime('%d.%m')} в {local_dt.strftime('%H:%M')}."
+        if not send_sms(phone, message):
+            raise RuntimeError('SMS не отправлено')
+        return True
@@ -0,0 +1,137 @@
+"""
+Поиск препаратов по названию для автодополнения.
+
+Запрос и названия сводятся к общему ключу (translit.search_key), поэтому
+поиск не зависит от раскладки: "paracet" находит "Парацетамол".
+
+- PostgreSQL с pg_trgm: префикс названия или любого слова и нечеткое
+  совпадение (оператор %) по триграммному индексу на search_key.
+- Иначе (SQLite, нет расширения): отсортированные списки ключей в памяти
+  процесса и двоичный поиск по префиксу. Списки перестраиваются, когда
+  сигнал Medicine меняет версию каталога в кэше.
+"""
+import time
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Medicine
+from .translit import search_key
+
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+VERSION_KEY = 'medicine_search:version'
+
+TRGM_SQL = """
+    SELECT id, name FROM patients_medicine
+    WHERE search_key LIKE %(prefix)s OR search_key LIKE %(word_prefix)s OR search_key %% %(key)s
+    ORDER BY search_key LIKE %(prefix)s DESC, similarity(search_key, %(key)s) DESC, name
+    LIMIT %(limit)s
+"""
+
+_trgm_available = None
+# (версия каталога, ключи названий, ключи слов со второго)
+_index = (None, [], [])
+
+
+def _has_trgm():
+    global _trgm_available
+    if _trgm_available is None:
+        _trgm_available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trgm_available = cursor.fetchone() is not None
+    return _trgm_available
+
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_trgm(key, limit):
+    escaped = _like_escape(key)
+    with connection.cursor() as cursor:
+        cursor.execute(TRGM_SQL, {
+            'prefix': f'{escaped}%',
+            'word_prefix': f'% {escaped}%',
+            'key': key,
+            'limit': limit,
+        })
+        return [{'id': row[0], 'name': row[1]} for row in cursor.fetchall()]
+
+
+def _catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def _get_index():
+    global _index
+    version = _catalog_version()
+    if _index[0] != version:
+        names, words = [], []
+        for medicine_id, name, key in Medicine.objects.values_list('id', 'name', 'search_key').iterator():
+            key = key or search_key(name)
+            names.append((key, name, medicine_id))
+            for pos, char in enumerate(key):
+                if pos and key[pos - 1] == ' ' and char != ' ':
+                    words.append((key[pos:], name, medicine_id))
+        names.sort()
+        words.sort()
+        _index = (version, names, words)
+    return _index
+
+
+def _prefix_scan(entries, key, limit, seen, results):
+    i = bisect_left(entries, (key,))
+    while i < len(entries) and len(results) < limit and entries[i][0].startswith(key):
+        _, name, medicine_id = entries[i]
+        if medicine_id not in seen:
+            seen.add(medicine_id)
+            results.append({'id': medicine_id, 'name': name})
+        i += 1
+
+
+def _search_memory(key, limit):
+    _, names, words = _get_index()
+    seen, results = set(), []
+    # Сначала совпадения с начала названия, затем с начала любого другого слова
+    _prefix_scan(names, key, limit, seen, results)
+    _prefix_scan(words, key, limit, seen, results)
+    return results
+
+
+def search(query, limit=DEFAULT_LIMIT):
+    """Топ-limit препаратов по запросу: список {'id', 'name'}."""
+    key = search_key(query)
+    if not key:
+        return []
+    keys = [key]
+    # Недописанное "amoxic": по последней латинской c нельзя понять, k это или c
+    if query.strip().lower().endswith('c') and key.endswith('k'):
+        keys.append(key[:-1] + 'c')
+
+    limit = max(1, min(limit, MAX_LIMIT))
+    find = _search_trgm if _has_trgm() else _search_memory
+    results, seen = [], set()
+    for key in keys:
+        for item in find(key, limit):
+            if item['id'] not in seen and len(results) < limit:
+                seen.add(item['id'])
+                results.append(item)
+    return results
+
+
+def invalidate():
+    """Каталог изменился: индексы в памяти всех процессов перестроятся при следующем поиске."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:19
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+UNIQUE_SLOT_INDEX = 'appt_unique_scheduled_doctor_slot'
+
+
+def cancel_duplicate_scheduled(apps, schema_editor):
+    """
+    Перед добавлением уникального ограничения отменяет дубли:
+    из нескольких запланированных записей к врачу на одно время остается самая ранняя.
+    Отмененные записи выводятся в лог, чтобы администратор мог связаться с пациентами.
+    """
+    Appointment = apps.get_model('patients', 'Appointment')
+    duplicates = (
+        Appointment.objects.filter(status='scheduled')
+        .values('doctor_id', 'date_time')
+        .annotate(total=Count('id'), keep_id=Min('id'))
+        .filter(total__gt=1)
+    )
+    for dup in duplicates:
+        cancelled = Appointment.objects.filter(
+            doctor_id=dup['doctor_id'],
+            date_time=dup['date_time'],
+            status='scheduled',
+        ).exclude(id=dup['keep_id'])
+        for appointment_id, patient_id in cancelled.values_list('id', 'patient_id'):
+            print(
+                f"\n--- [Миграция] Отменен дубль записи {appointment_id}: пациент {patient_id}, "
+                f"врач {dup['doctor_id']}, {dup['date_time'].isoformat()} (оставлена запись {dup['keep_id']})"
+            )
+        cancelled.update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY - без блокировки записи в большую таблицу приемов,
+    # а это невозможно внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'date_time'], name='appt_doctor_status_dt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status', 'date_time'], name='appt_patient_status_dt_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 'scheduled')), fields=['date_time'], name='appt_scheduled_dt_idx'),
+        ),
+        migrations.RunPython(cancel_duplicate_scheduled, migrations.RunPython.noop, atomic=True),
+        # Условное уникальное ограничение в PostgreSQL - это частичный уникальный индекс;
+        # строим его так же CONCURRENTLY (недостроенный после сбоя индекс удаляется при повторе)
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    [
+                        f'DROP INDEX CONCURRENTLY IF EXISTS {UNIQUE_SLOT_INDEX}',
+                        f'CREATE UNIQUE INDEX CONCURRENTLY {UNIQUE_SLOT_INDEX} '
+                        f"ON patients_appointment (doctor_id, date_time) WHERE status = 'scheduled'",
+                    ],
+                    f'DROP INDEX CONCURRENTLY IF EXISTS {UNIQUE_SLOT_INDEX}',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='appointment',
+                    constraint=models.UniqueConstraint(condition=models.Q(('status', 'scheduled')), fields=('doctor', 'date_time'), name=UNIQUE_SLOT_INDEX),
+                ),
+            ],
+        ),
+    ]
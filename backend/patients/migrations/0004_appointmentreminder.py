@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS')], max_length=10, verbose_name='Канал')),
+                ('status', models.CharField(choices=[('sent', 'Отправлено'), ('failed', 'Ошибка')], max_length=10, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='patients.appointment', verbose_name='Запись на приём')),
+            ],
+            options={
+                'verbose_name': 'Напоминание о приёме',
+                'verbose_name_plural': 'Напоминания о приёме',
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'channel'), name='reminder_unique_appointment_channel')],
+            },
+        ),
+    ]
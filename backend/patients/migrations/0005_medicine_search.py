@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:30
+
+from django.db import migrations, models, transaction, DatabaseError
+
+from patients.translit import search_key
+
+
+TRGM_INDEX = 'medicine_search_key_trgm_idx'
+
+
+def fill_search_key(apps, schema_editor):
+    Medicine = apps.get_model('patients', 'Medicine')
+    medicines = list(Medicine.objects.only('id', 'name'))
+    for medicine in medicines:
+        medicine.search_key = search_key(medicine.name)
+    Medicine.objects.bulk_update(medicines, ['search_key'], batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    Триграммный индекс для поиска по подстроке и с опечатками. Только PostgreSQL;
+    если расширение pg_trgm недоступно, поиск работает через индекс в памяти процесса.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as e:
+        print(f"pg_trgm недоступен, триграммный индекс не создан: {e}")
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON patients_medicine USING gin (search_key gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {TRGM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_appointmentreminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='search_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=400),
+        ),
+        migrations.RunPython(fill_search_key, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
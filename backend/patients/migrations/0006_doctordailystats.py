@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0005_medicine_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='Завершено приемов')),
+                ('patient_ids', models.JSONField(blank=True, default=list, verbose_name='Пациенты')),
+                ('diagnosis_counts', models.JSONField(blank=True, default=dict, verbose_name='Диагнозы')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='patients.doctor', verbose_name='Врач')),
+            ],
+            options={
+                'verbose_name': 'Статистика врача за день',
+                'verbose_name_plural': 'Статистика врачей по дням',
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'day'), name='doctor_stats_unique_day')],
+            },
+        ),
+    ]
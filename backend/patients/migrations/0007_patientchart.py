@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_doctordailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientChart',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='chart', serialize=False, to='patients.patient', verbose_name='Пациент')),
+                ('patient_json', models.TextField(verbose_name='Карта для пациента')),
+                ('doctor_json', models.TextField(verbose_name='Карта для врача')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+                ('is_stale', models.BooleanField(default=False, verbose_name='Устарела')),
+                ('built_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Собрана')),
+            ],
+            options={
+                'verbose_name': 'Медицинская карта (снимок)',
+                'verbose_name_plural': 'Медицинские карты (снимки)',
+                'indexes': [models.Index(condition=models.Q(('is_stale', True)), fields=['built_at'], name='chart_stale_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_patientchart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменено'),
+        ),
+        migrations.CreateModel(
+            name='AppointmentChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('appointment_id', models.PositiveBigIntegerField(verbose_name='Запись на приём')),
+                ('patient_id', models.PositiveBigIntegerField(null=True, verbose_name='Пациент')),
+                ('doctor_id', models.PositiveBigIntegerField(null=True, verbose_name='Врач')),
+                ('action', models.CharField(choices=[('created', 'Создана'), ('updated', 'Изменена'), ('deleted', 'Удалена')], max_length=10, verbose_name='Действие')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение записи на приём',
+                'verbose_name_plural': 'Журнал изменений записей',
+                'indexes': [models.Index(fields=['patient_id', 'id'], name='appt_change_patient_idx'), models.Index(fields=['doctor_id', 'id'], name='appt_change_doctor_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:44
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_appointment_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_type', models.CharField(choices=[('analysis', 'Анализ'), ('xray', 'Рентген'), ('mri', 'МРТ'), ('ct', 'КТ'), ('ultrasound', 'УЗИ'), ('other', 'Другое')], max_length=20, verbose_name='Тип')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('title', models.CharField(default='Документ', max_length=255, verbose_name='Название')),
+                ('description', models.TextField(blank=True, default='', verbose_name='Описание')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Размер')),
+                ('received', models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Начата')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Последняя часть')),
+                ('medical_record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='patients.medicalrecord', verbose_name='Медицинская запись')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='patients.patient', verbose_name='Пациент')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Загружает')),
+            ],
+            options={
+                'verbose_name': 'Загрузка файла',
+                'verbose_name_plural': 'Загрузки файлов',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:47
+
+import patients.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_fileblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileblob',
+            name='derivatives_status',
+            field=models.CharField(choices=[('none', 'Не нужны'), ('pending', 'В очереди'), ('ready', 'Готовы'), ('skipped', 'Не изображение'), ('failed', 'Ошибка')], default='none', max_length=10, verbose_name='Копии для просмотра'),
+        ),
+        migrations.AddField(
+            model_name='fileblob',
+            name='preview',
+            field=models.FileField(blank=True, upload_to=patients.models.derivative_upload_to, verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='fileblob',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to=patients.models.derivative_upload_to, verbose_name='Миниатюра'),
+        ),
+        migrations.AddIndex(
+            model_name='fileblob',
+            index=models.Index(condition=models.Q(('derivatives_status', 'pending')), fields=['created_at'], name='blob_derivatives_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:58
+
+import os
+import shutil
+
+import patients.models
+import patients.storage
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def _stored_names(apps):
+    FileBlob = apps.get_model('patients', 'FileBlob')
+    PatientFile = apps.get_model('patients', 'PatientFile')
+    names = set(PatientFile.objects.exclude(file='').values_list('file', flat=True))
+    for field in ('file', 'thumbnail', 'preview'):
+        names.update(FileBlob.objects.exclude(**{field: ''}).values_list(field, flat=True))
+    return names
+
+
+def _move(names, source_root, target_root):
+    moved = 0
+    for name in names:
+        source = os.path.join(source_root, name)
+        target = os.path.join(target_root, name)
+        if os.path.exists(source) and not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+            moved += 1
+    if moved:
+        print(f"\n--- [Файлы] Перенесено файлов: {moved} ({source_root} -> {target_root})")
+
+
+def move_to_protected(apps, schema_editor):
+    """Файлы пациентов уходят из публичного MEDIA_ROOT в PROTECTED_MEDIA_ROOT."""
+    _move(_stored_names(apps), str(settings.MEDIA_ROOT), str(settings.PROTECTED_MEDIA_ROOT))
+
+
+def move_to_media(apps, schema_editor):
+    _move(_stored_names(apps), str(settings.PROTECTED_MEDIA_ROOT), str(settings.MEDIA_ROOT))
+
+
+def mark_charts_stale(apps, schema_editor):
+    """Снимки карт с файлами содержат старые ссылки на /media/ - пересобрать."""
+    PatientChart = apps.get_model('patients', 'PatientChart')
+    PatientChart.objects.filter(patient__files__isnull=False).update(is_stale=True, version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0011_blob_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fileblob',
+            name='file',
+            field=models.FileField(storage=patients.storage.protected_storage, upload_to=patients.models.blob_upload_to, verbose_name='Файл'),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='preview',
+            field=models.FileField(blank=True, storage=patients.storage.protected_storage, upload_to=patients.models.derivative_upload_to, verbose_name='Превью'),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='thumbnail',
+            field=models.FileField(blank=True, storage=patients.storage.protected_storage, upload_to=patients.models.derivative_upload_to, verbose_name='Миниатюра'),
+        ),
+        migrations.AlterField(
+            model_name='patientfile',
+            name='file',
+            field=models.FileField(storage=patients.storage.protected_storage, upload_to='patient_files/%Y/%m/'),
+        ),
+        migrations.RunPython(move_to_protected, move_to_media),
+        migrations.RunPython(mark_charts_stale, mark_charts_stale),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:06
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы по большой таблице приемов - без блокировки записи (см. 0002)
+    atomic = False
+
+    dependencies = [
+        ('patients', '0012_protected_storage'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(models.F('doctor'), models.Case(models.When(status='scheduled', then=models.Value(1)), default=models.Value(2), output_field=models.IntegerField()), models.F('date_time'), models.F('id'), name='appt_doctor_list_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(models.F('patient'), models.Case(models.When(status='scheduled', then=models.Value(3)), models.When(status='completed', then=models.Value(2)), default=models.Value(1), output_field=models.IntegerField()), models.F('date_time'), models.F('id'), name='appt_patient_list_idx'),
+        ),
+    ]
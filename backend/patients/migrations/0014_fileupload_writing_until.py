@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0013_appointment_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='writing_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Часть пишется до'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Max, Min
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    """
+    Заполняет DoctorDailyStats за всю историю завершенных приемов, иначе
+    статистика врачей показывает нули до ручного запуска rebuild_doctor_stats.
+    Пересчет идет по году, чтобы не держать в памяти все приемы сразу.
+    """
+    from patients import stats
+
+    Appointment = apps.get_model('patients', 'Appointment')
+    bounds = Appointment.objects.filter(status='completed').aggregate(first=Min('date_time'), last=Max('date_time'))
+    if bounds['first'] is None:
+        return
+    start_day = timezone.localtime(bounds['first']).date()
+    end_day = timezone.localtime(bounds['last']).date()
+    written = 0
+    while start_day <= end_day:
+        chunk_end = min(start_day + timedelta(days=365), end_day)
+        written += stats.rebuild(start_day, chunk_end)
+        start_day = chunk_end + timedelta(days=1)
+    print(f"\n--- [Статистика] Заполнено строк статистики врачей: {written}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0014_fileupload_writing_until'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def requeue(apps, schema_editor):
+    """Очередь теперь по derivatives_next_at; блобы с ошибкой получают новые попытки."""
+    FileBlob = apps.get_model('patients', 'FileBlob')
+    FileBlob.objects.filter(derivatives_status='pending').update(derivatives_next_at=F('created_at'))
+    FileBlob.objects.filter(derivatives_status='failed').update(derivatives_next_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0015_backfill_doctor_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='fileblob',
+            name='blob_derivatives_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='fileblob',
+            name='derivatives_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Попыток создать копии'),
+        ),
+        migrations.AddField(
+            model_name='fileblob',
+            name='derivatives_next_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Следующая попытка'),
+        ),
+        migrations.AlterField(
+            model_name='fileblob',
+            name='derivatives_status',
+            field=models.CharField(choices=[('none', 'Не нужны'), ('pending', 'В очереди'), ('processing', 'Создаются'), ('ready', 'Готовы'), ('skipped', 'Не изображение'), ('failed', 'Ошибка')], default='none', max_length=10, verbose_name='Копии для просмотра'),
+        ),
+        migrations.AddIndex(
+            model_name='fileblob',
+            index=models.Index(condition=models.Q(('derivatives_status__in', ('pending', 'processing', 'failed'))), fields=['derivatives_next_at'], name='blob_derivatives_queue_idx'),
+        ),
+        migrations.RunPython(requeue, migrations.RunPython.noop),
+    ]
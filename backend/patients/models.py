@@ -1,6 +1,14 @@
+import os
+import uuid
+
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from django.conf import settings
 from django.utils import timezone
+from datetime import datetime, time, timedelta
+
+from .storage import protected_storage
+from .translit import search_key
 
 
 class Patient(models.Model):
@@ -83,11 +91,78 @@ class Medicine(models.Model):
     prescription_required = models.BooleanField(default=False, verbose_name='Требуется рецепт')
     side_effects = models.TextField(blank=True, null=True, verbose_name='Побочные эффекты')
     contraindications = models.TextField(blank=True, null=True, verbose_name='Противопоказания')
+    # Нормализованное название для поиска (см. translit.search_key)
+    search_key = models.CharField(max_length=400, blank=True, default='', db_index=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.search_key = search_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_key'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+def local_day_bounds(day):
+    """
+    Полуоткрытый интервал [начало дня, начало следующего дня) для локальной даты
+    в текущем часовом поясе (Asia/Almaty).
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(day, time.min, tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=tz)
+    return start, end
+
+
+# Ранги статусов для сортировки списков записей: врачу - сначала запланированные
+# (по возрастанию ранга), пациенту - запланированные, завершенные, отмененные
+# (по убыванию ранга, чтобы все поля ключа сортировки шли в одну сторону).
+# Те же выражения стоят в индексах appt_*_list_idx: курсорная пагинация
+# (pagination.py) сравнивает ключ целиком и идет по индексу.
+DOCTOR_LIST_RANK = Case(When(status='scheduled', then=Value(1)), default=Value(2), output_field=models.IntegerField())
+PATIENT_LIST_RANK = Case(
+    When(status='scheduled', then=Value(3)),
+    When(status='completed', then=Value(2)),
+    default=Value(1),
+    output_field=models.IntegerField(),
+)
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """
+    Фильтры записей по локальным дням и статусам.
+    Дни превращаются в диапазоны date_time >= ... AND date_time < ...,
+    поэтому запросы используют индексы по date_time (в отличие от date_time__date).
+    """
+
+    def for_local_day(self, day):
+        start, end = local_day_bounds(day)
+        return self.filter(date_time__gte=start, date_time__lt=end)
+
+    def for_local_range(self, start_day, end_day):
+        """Записи с start_day по end_day включительно (локальные даты)."""
+        start, _ = local_day_bounds(start_day)
+        _, end = local_day_bounds(end_day)
+        return self.filter(date_time__gte=start, date_time__lt=end)
+
+    def scheduled(self):
+        return self.filter(status='scheduled')
+
+    def completed(self):
+        return self.filter(status='completed')
+
+    def upcoming(self, now=None):
+        """Запланированные записи, которые еще не наступили."""
+        return self.scheduled().filter(date_time__gte=now or timezone.now())
+
+    def missed(self):
+        """Запланированные записи, день которых уже прошел (вчера и ранее)."""
+        today_start, _ = local_day_bounds(timezone.localdate())
+        return self.scheduled().filter(date_time__lt=today_start)
+
+
 class Appointment(models.Model):
     """
     Модель посещений (приемов).
@@ -95,6 +170,24 @@ class Appointment(models.Model):
     class Meta:
         verbose_name = 'Запись на приём'
         verbose_name_plural = 'Записи на приём'
+        indexes = [
+            # Списки и статистика врача/пациента: фильтр по статусу и диапазону времени
+            models.Index(fields=['doctor', 'status', 'date_time'], name='appt_doctor_status_dt_idx'),
+            models.Index(fields=['patient', 'status', 'date_time'], name='appt_patient_status_dt_idx'),
+            # Поиск просроченных запланированных записей по всей клинике
+            models.Index(fields=['date_time'], condition=Q(status='scheduled'), name='appt_scheduled_dt_idx'),
+            # Списки записей врача и пациента в порядке выдачи (курсорная пагинация)
+            models.Index(F('doctor'), DOCTOR_LIST_RANK, F('date_time'), F('id'), name='appt_doctor_list_idx'),
+            models.Index(F('patient'), PATIENT_LIST_RANK, F('date_time'), F('id'), name='appt_patient_list_idx'),
+        ]
+        constraints = [
+            # Один активный приём у врача на одно время (индекс заодно ускоряет поиск занятых слотов)
+            models.UniqueConstraint(
+                fields=['doctor', 'date_time'],
+                condition=Q(status='scheduled'),
+                name='appt_unique_scheduled_doctor_slot',
+            ),
+        ]
         
     STATUS_CHOICES = (
         ('scheduled', 'Запланировано'),
@@ -110,6 +203,18 @@ class Appointment(models.Model):
     notes = models.TextField(blank=True, null=True, verbose_name='Примечания')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled', verbose_name='Статус')
     room_number = models.CharField(max_length=10, blank=True, null=True, verbose_name='Номер кабинета')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменено')
+
+    objects = AppointmentQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходные врача и время, чтобы при переносе сбросить индекс слотов старого дня,
+        # и статус - чтобы пересчитать статистику дня, из которого ушел завершенный прием
+        instance._loaded_slot = (instance.__dict__.get('doctor_id'), instance.__dict__.get('date_time'))
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def __str__(self):
         local_time = timezone.localtime(self.date_time)
@@ -207,6 +312,60 @@ class DiagnosisTemplate(models.Model):
         return self.name
 
 
+def blob_upload_to(instance, filename):
+    # Имя определяется содержимым: blobs/ab/abcdef....pdf
+    ext = os.path.splitext(filename)[1].lower()
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256}{ext}'
+
+
+def derivative_upload_to(instance, filename):
+    # Рядом с файлом блоба: blobs/ab/abcdef..._thumbnail.jpg
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256}_{filename}'
+
+
+class FileBlob(models.Model):
+    """
+    Содержимое файла, хранящееся один раз (адресация по SHA-256).
+    PatientFile ссылаются на блоб; ref_count - число ссылок, блоб без ссылок
+    удаляется вместе с файлом (см. blobs.py).
+    Для снимков веб-процесс после загрузки создает миниатюру и превью (derivatives.py).
+    """
+    DERIVATIVES_CHOICES = (
+        ('none', 'Не нужны'),
+        ('pending', 'В очереди'),
+        ('processing', 'Создаются'),
+        ('ready', 'Готовы'),
+        ('skipped', 'Не изображение'),
+        ('failed', 'Ошибка'),
+    )
+
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name='SHA-256')
+    file = models.FileField(upload_to=blob_upload_to, storage=protected_storage, verbose_name='Файл')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    ref_count = models.PositiveIntegerField(default=0, verbose_name='Ссылок')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    thumbnail = models.FileField(upload_to=derivative_upload_to, storage=protected_storage, blank=True, verbose_name='Миниатюра')
+    preview = models.FileField(upload_to=derivative_upload_to, storage=protected_storage, blank=True, verbose_name='Превью')
+    derivatives_status = models.CharField(max_length=10, choices=DERIVATIVES_CHOICES, default='none', verbose_name='Копии для просмотра')
+    derivatives_attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток создать копии')
+    # В очереди - когда брать, при создании - конец аренды, после ошибки - время повтора
+    derivatives_next_at = models.DateTimeField(null=True, blank=True, verbose_name='Следующая попытка')
+
+    class Meta:
+        verbose_name = 'Содержимое файла'
+        verbose_name_plural = 'Содержимое файлов'
+        indexes = [
+            models.Index(
+                fields=['derivatives_next_at'],
+                condition=Q(derivatives_status__in=('pending', 'processing', 'failed')),
+                name='blob_derivatives_queue_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.sha256[:12]} ({self.size} байт, ссылок: {self.ref_count})'
+
+
 class PatientFile(models.Model):
     """
     Файлы пациента (анализы, снимки)
@@ -224,7 +383,9 @@ class PatientFile(models.Model):
     medical_record = models.ForeignKey(MedicalRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
     
     file_type = models.CharField(max_length=20, choices=FILE_TYPES)
-    file = models.FileField(upload_to='patient_files/%Y/%m/')
+    # Для загрузок через blobs.py file указывает на файл блоба (общий для дубликатов)
+    file = models.FileField(upload_to='patient_files/%Y/%m/', storage=protected_storage)
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='patient_files', verbose_name='Содержимое')
     title = models.CharField(max_length=255, verbose_name='Название', default='Документ')
     description = models.TextField(blank=True, null=True, verbose_name='Описание')
     
@@ -262,4 +423,178 @@ class PatientActiveMedicine(models.Model):
         unique_together = ('patient', 'doctor', 'medicine')
 
     def __str__(self):
-        return f'{self.patient} — {self.medicine.name} (назначил Dr. {self.doctor.last_name})'
\ No newline at end of file
+        return f'{self.patient} — {self.medicine.name} (назначил Dr. {self.doctor.last_name})'
+
+class OutboxMessage(models.Model):
+    """
+    Исходящее уведомление (email/SMS), записанное в той же транзакции,
+    что и изменение записи на прием. Доставляется фоновым процессом (process_outbox).
+    """
+    KIND_CHOICES = (
+        ('appointment_confirmation', 'Подтверждение записи'),
+        ('reception_summary', 'Отчет о приеме'),
+        ('sms', 'SMS'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('dead', 'Не доставлено'),
+    )
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, verbose_name='Тип')
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_messages', verbose_name='Запись на приём')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Данные')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, default='', verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name = 'Исходящее уведомление'
+        verbose_name_plural = 'Исходящие уведомления'
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.id} ({self.get_status_display()})'
+
+
+class AppointmentReminder(models.Model):
+    """
+    Отметка об отправке напоминания о приеме по конкретному каналу.
+    Повторный запуск рассылки пропускает уже отправленные напоминания.
+    """
+    CHANNEL_CHOICES = (
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    )
+    STATUS_CHOICES = (
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    )
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders', verbose_name='Запись на приём')
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, verbose_name='Канал')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name='Статус')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name = 'Напоминание о приёме'
+        verbose_name_plural = 'Напоминания о приёме'
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'channel'], name='reminder_unique_appointment_channel'),
+        ]
+
+    def __str__(self):
+        return f'Напоминание ({self.get_channel_display()}) для записи #{self.appointment_id}'
+
+
+class DoctorDailyStats(models.Model):
+    """
+    Сводка завершенных приемов врача за локальный день.
+    Пересчитывается при завершении приема (см. stats.py) и командой rebuild_doctor_stats.
+    """
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_stats', verbose_name='Врач')
+    day = models.DateField(verbose_name='День')
+    completed_count = models.PositiveIntegerField(default=0, verbose_name='Завершено приемов')
+    patient_ids = models.JSONField(default=list, blank=True, verbose_name='Пациенты')
+    diagnosis_counts = models.JSONField(default=dict, blank=True, verbose_name='Диагнозы')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Статистика врача за день'
+        verbose_name_plural = 'Статистика врачей по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day'], name='doctor_stats_unique_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.doctor} {self.day}: {self.completed_count}'
+
+
+class PatientChart(models.Model):
+    """
+    Готовая медицинская карта пациента (JSON ответа PatientMedicalHistoryView).
+    Хранится в двух вариантах: для пациента и для врача (с приватными заметками).
+    При изменении данных карта помечается устаревшей и пересобирается фоновой
+    командой rebuild_patient_charts (см. charts.py).
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='chart', verbose_name='Пациент')
+    patient_json = models.TextField(verbose_name='Карта для пациента')
+    doctor_json = models.TextField(verbose_name='Карта для врача')
+    version = models.PositiveIntegerField(default=0, verbose_name='Версия')
+    is_stale = models.BooleanField(default=False, verbose_name='Устарела')
+    built_at = models.DateTimeField(default=timezone.now, verbose_name='Собрана')
+
+    class Meta:
+        verbose_name = 'Медицинская карта (снимок)'
+        verbose_name_plural = 'Медицинские карты (снимки)'
+        indexes = [
+            models.Index(fields=['built_at'], condition=Q(is_stale=True), name='chart_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f'Карта пациента #{self.patient_id} v{self.version}'
+
+
+class AppointmentChange(models.Model):
+    """
+    Журнал изменений записей на прием для синхронизации клиентов (?since=).
+    Курсор синхронизации - id последнего полученного изменения (см. changelog.py).
+    Ссылки хранятся числами, чтобы запись журнала пережила удаление приема.
+    """
+    ACTION_CHOICES = (
+        ('created', 'Создана'),
+        ('updated', 'Изменена'),
+        ('deleted', 'Удалена'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    appointment_id = models.PositiveBigIntegerField(verbose_name='Запись на приём')
+    patient_id = models.PositiveBigIntegerField(null=True, verbose_name='Пациент')
+    doctor_id = models.PositiveBigIntegerField(null=True, verbose_name='Врач')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name='Действие')
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name = 'Изменение записи на приём'
+        verbose_name_plural = 'Журнал изменений записей'
+        indexes = [
+            models.Index(fields=['patient_id', 'id'], name='appt_change_patient_idx'),
+            models.Index(fields=['doctor_id', 'id'], name='appt_change_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.id}: запись #{self.appointment_id} {self.get_action_display()}'
+
+
+class FileUpload(models.Model):
+    """
+    Загрузка файла пациента по частям (см. uploads.py).
+    Части дописываются во временный файл; PatientFile создается при завершении.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='uploads', verbose_name='Пациент')
+    medical_record = models.ForeignKey(MedicalRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Медицинская запись')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Загружает')
+    file_type = models.CharField(max_length=20, choices=PatientFile.FILE_TYPES, verbose_name='Тип')
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    title = models.CharField(max_length=255, default='Документ', verbose_name='Название')
+    description = models.TextField(blank=True, default='', verbose_name='Описание')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    received = models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')
+    # Часть с позиции received сейчас пишется одним запросом (до этого времени)
+    writing_until = models.DateTimeField(null=True, blank=True, verbose_name='Часть пишется до')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Начата')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Последняя часть')
+
+    class Meta:
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+
+    def __str__(self):
+        return f'{self.filename}: {self.received}/{self.size}'
@@ -0,0 +1,145 @@
+"""
+Транзакционный outbox уведомлений.
+
+Представления вызывают enqueue() внутри transaction.atomic() вместе с изменением
+записи на прием, поэтому уведомление появляется только если изменение сохранено.
+Отправкой занимается команда process_outbox: она берет пачку сообщений в аренду
+(SELECT ... FOR UPDATE SKIP LOCKED и сразу коммит), отправляет письма через одно
+SMTP-соединение вне транзакции и записывает результат каждого сообщения отдельно,
+поэтому сбой посреди пачки не откатывает уже отправленные. При ошибке повтор
+откладывается с экспоненциальной задержкой. После MAX_ATTEMPTS неудачных
+попыток сообщение помечается как 'dead'.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .email_service import build_appointment_confirmation_email, build_reception_summary_email
+from .models import OutboxMessage
+from .sms_service import send_sms
+
+
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF_BASE = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', 30)
+BACKOFF_MAX = getattr(settings, 'OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+LEASE = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE_SECONDS', 600))
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def enqueue(kind, appointment=None, **payload):
+    """Ставит уведомление в очередь. Вызывать внутри транзакции изменения."""
+    return OutboxMessage.objects.create(kind=kind, appointment=appointment, payload=payload)
+
+
+def backoff_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def _deliver(message, connection):
+    appointment = message.appointment
+    if message.kind == 'appointment_confirmation':
+        email = build_appointment_confirmation_email(appointment, connection=connection)
+        email.send()
+    elif message.kind == 'reception_summary':
+        email = build_reception_summary_email(appointment, appointment.medical_record, connection=connection)
+        email.send()
+    elif message.kind == 'sms':
+        if not send_sms(message.payload.get('phone'), message.payload.get('message', '')):
+            raise DeliveryError('SMS не отправлено')
+    else:
+        raise DeliveryError(f'Неизвестный тип уведомления: {message.kind}')
+
+
+def _claim(batch_size):
+    """
+    Забирает пачку сообщений в аренду: попытка засчитывается сразу, а
+    next_attempt_at сдвигается на время аренды. Блокировки строк держатся
+    только до коммита этой короткой транзакции; другие процессы не видят
+    сообщения, пока аренда не истекла. Если процесс упал, сообщения вернутся
+    в очередь по истечении аренды.
+    """
+    now = timezone.now()
+    lease_until = now + LEASE
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return [], lease_until
+        OutboxMessage.objects.filter(id__in=ids).update(attempts=F('attempts') + 1, next_attempt_at=lease_until)
+
+    messages = list(
+        OutboxMessage.objects.filter(id__in=ids)
+        .select_related('appointment__patient__user', 'appointment__doctor', 'appointment__medical_record')
+        .order_by('next_attempt_at', 'id')
+    )
+    return messages, lease_until
+
+
+def _record(message, lease_until, **fields):
+    """
+    Результат одной отправки - отдельным UPDATE. Условие на аренду: если она
+    истекла и сообщение забрал другой процесс, его результат не затирается.
+    """
+    updated = OutboxMessage.objects.filter(
+        id=message.id, status='pending', next_attempt_at=lease_until
+    ).update(**fields)
+    if not updated:
+        print(f"--- [Outbox] Аренда сообщения {message.id} истекла, результат не записан")
+
+
+def _release(messages, lease_until):
+    """Возвращает неотправленные сообщения в очередь без учета попытки."""
+    OutboxMessage.objects.filter(
+        id__in=[m.id for m in messages], status='pending', next_attempt_at=lease_until
+    ).update(attempts=F('attempts') - 1, next_attempt_at=timezone.now())
+
+
+def deliver_batch(batch_size=50):
+    """
+    Отправляет одну пачку готовых к отправке сообщений: аренда (_claim),
+    отправка вне транзакции, запись результата по каждому сообщению (_record).
+    Возвращает (отправлено, отложено, не доставлено).
+    """
+    sent = retried = dead = 0
+    messages, lease_until = _claim(batch_size)
+    if not messages:
+        return sent, retried, dead
+
+    # Одно SMTP-соединение на всю пачку
+    connection = get_connection()
+    try:
+        for i, message in enumerate(messages):
+            # Медленный SMTP: остаток пачки отдаем, пока аренда не истекла
+            if timezone.now() >= lease_until - LEASE / 2:
+                _release(messages[i:], lease_until)
+                break
+            try:
+                _deliver(message, connection)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                if message.attempts >= MAX_ATTEMPTS:
+                    _record(message, lease_until, status='dead', last_error=error)
+                    dead += 1
+                else:
+                    _record(
+                        message, lease_until, last_error=error,
+                        next_attempt_at=timezone.now() + backoff_delay(message.attempts),
+                    )
+                    retried += 1
+            else:
+                _record(message, lease_until, status='sent', sent_at=timezone.now(), last_error='')
+                sent += 1
+    finally:
+        connection.close()
+    return sent, retried, dead
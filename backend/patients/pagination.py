@@ -0,0 +1,130 @@
+"""
+Курсорная (keyset) пагинация для списков, которые раньше отдавались целиком.
+
+Страница выбирается условием "строго после последней строки предыдущей
+страницы" по ключу сортировки, а не через OFFSET, поэтому стоимость любой
+страницы одинакова. Если все поля ключа сортируются в одну сторону, условие -
+сравнение строк (ROW(...) > ROW(...)), и при индексе на те же поля (или
+выражения) страница читается прямо из индекса. Ключ сортировки обязан быть
+уникальным (последним полем всегда идет id), тогда курсоры стабильны при
+вставке новых строк.
+
+Пагинация включается, только если клиент передал ?limit= или ?cursor=,
+иначе эндпоинты возвращают прежний список. ?count=1 добавляет общее число строк.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+MAX_PAGE_SIZE = 100
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, date):
+        return ['d', value.isoformat()]
+    return ['v', value]
+
+
+def _decode_value(item):
+    kind, value = item
+    if kind == 'dt':
+        return datetime.fromisoformat(value)
+    if kind == 'd':
+        return date.fromisoformat(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    ordering - поля сортировки, '-' означает убывание, например
+    ('status_order', '-date_time', '-id'). Поля могут быть аннотациями.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.limit_query_param in params or self.cursor_query_param in params
+
+    def get_limit(self, request):
+        default = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, default))
+        except (TypeError, ValueError):
+            raise ValidationError({'error': 'limit должен быть числом'})
+        return max(1, min(limit, MAX_PAGE_SIZE))
+
+    def encode_cursor(self, row):
+        values = [_encode_value(getattr(row, name)) for name, _ in self.fields]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [_decode_value(item) for item in values]
+        except (ValueError, TypeError):
+            raise ValidationError({'error': 'Некорректный курсор'})
+
+    def _after(self, values):
+        """Условие "строка идет после values" в порядке self.ordering."""
+        directions = {descending for _, descending in self.fields}
+        if len(directions) == 1:
+            # Все поля в одну сторону: сравнение строк (a, b, id) > (x, y, z) -
+            # одно условие, которое PostgreSQL проверяет по индексу на эти поля
+            row = Func(*[F(name) for name, _ in self.fields], function='ROW', output_field=Field())
+            cursor = Func(*[Value(value) for value in values], function='ROW', output_field=Field())
+            return LessThan(row, cursor) if directions == {True} else GreaterThan(row, cursor)
+
+        # Разные направления: цепочка (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Возвращает строки страницы или None, если пагинация не запрошена."""
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+
+        rows = list(queryset[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {'next_cursor': self.next_cursor, 'results': data}
+        if self.count is not None:
+            payload['count'] = self.count
+        return Response(payload)
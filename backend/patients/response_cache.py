@@ -0,0 +1,139 @@
+"""
+Кэш ответов для часто читаемых эндпоинтов.
+
+Ответ кэшируется по ключу (эндпоинт, хост, путь, параметры запроса, роль
+пользователя) и помечается тегами, например 'doctor' или 'medicine'.
+У каждого тега есть версия; версии тегов входят в ключ, поэтому сброс тега
+(invalidate) - это просто смена его версии, и все старые ответы с этим тегом
+перестают находиться. Теги сбрасываются сигналами моделей (см. signals.py).
+
+Версии тегов хранятся в том же кэше, поэтому сброс виден всем процессам
+только при общем кэше (django-redis, REDIS_URL). С LocMemCache у каждого
+воркера gunicorn свои версии, и закэшированные ответы переживают изменения,
+сделанные в других воркерах, - такой кэш годится только для разработки
+в одном процессе. Без DEBUG о LocMemCache предупреждает проверка
+patients.W001 (checks.py).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+
+CACHE_PREFIX = 'resp'
+CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+STATS_KEY = 'resp_stats'
+
+# Имена эндпоинтов, для которых ведется статистика попаданий
+_endpoints = set()
+
+
+def _tag_key(tag):
+    return f'{CACHE_PREFIX}:tag:{tag}'
+
+
+def _new_version():
+    # Версия от времени: если ключ версии вытеснен из кэша, новая версия
+    # не совпадет ни с одной из старых
+    return int(time.time() * 1000)
+
+
+def _tag_versions(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [str(versions[key]) for key in keys]
+
+
+def invalidate(*tags):
+    """Сбрасывает все закэшированные ответы с указанными тегами (после коммита)."""
+    def bump():
+        for tag in tags:
+            try:
+                cache.incr(_tag_key(tag))
+            except ValueError:
+                cache.set(_tag_key(tag), _new_version(), None)
+    transaction.on_commit(bump)
+
+
+def _role(request):
+    user = request.user
+    if user.is_staff:
+        return 'staff'
+    if getattr(request, 'doctor', None) is not None:
+        return 'doctor'
+    if getattr(request, 'patient', None) is not None:
+        return 'patient'
+    return 'user'
+
+
+def _response_key(name, request, tags, vary_on_user):
+    role = _role(request)
+    if vary_on_user:
+        role = f'{role}:{request.user.pk}'
+    query = sorted(request.query_params.lists())
+    raw = '|'.join([
+        request.get_host(), request.path, repr(query), role, *_tag_versions(tags),
+    ])
+    return f'{CACHE_PREFIX}:{name}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _count(name, outcome):
+    key = f'{STATS_KEY}:{name}:{outcome}'
+    if cache.add(key, 1, None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def cache_response(name, tags, vary_on_user=False, timeout=None):
+    """
+    Декоратор метода get/list представления DRF.
+    tags - список тегов или функция request -> список тегов.
+    vary_on_user - отдельный кэш для каждого пользователя, а не только для роли.
+    Кэшируются только ответы 200.
+    """
+    _endpoints.add(name)
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            tag_list = tags(request) if callable(tags) else tags
+            key = _response_key(name, request, tag_list, vary_on_user)
+            data = cache.get(key)
+            if data is not None:
+                _count(name, 'hits')
+                return Response(data)
+
+            _count(name, 'misses')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, CACHE_TIMEOUT if timeout is None else timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Счетчики попаданий/промахов по эндпоинтам."""
+    keys = {
+        f'{STATS_KEY}:{name}:{outcome}': (name, outcome)
+        for name in _endpoints for outcome in ('hits', 'misses')
+    }
+    values = cache.get_many(keys.keys())
+    result = {}
+    for key, (name, outcome) in keys.items():
+        result.setdefault(name, {'hits': 0, 'misses': 0})[outcome] = values.get(key, 0)
+    for counters in result.values():
+        total = counters['hits'] + counters['misses']
+        counters['hit_rate'] = round(counters['hits'] / total, 3) if total else None
+    return result
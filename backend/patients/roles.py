@@ -0,0 +1,47 @@
+"""
+Профили ролей (Doctor/Patient) текущего пользователя с общим кэшем.
+
+Профиль кэшируется по user_id вместе с отрицательным результатом ("профиля нет"),
+поэтому проверка роли в представлениях не обращается к БД. Кэш сбрасывается
+сигналами при сохранении/удалении Doctor и Patient.
+
+Сброс работает только с общим кэшем (Redis): с LocMemCache другие воркеры
+продолжали бы аутентифицировать по старому профилю. Поэтому без DEBUG
+проверка patients.W001 (checks.py) предупреждает о LocMemCache, а срок
+жизни записи короткий - он ограничивает устаревание и в этом случае.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Doctor, Patient
+
+
+CACHE_TIMEOUT = getattr(settings, 'ROLE_PROFILE_CACHE_TIMEOUT', 60)
+_NO_PROFILE = 'none'
+
+
+def _cache_key(model, user_id):
+    return f'role:{model._meta.model_name}:{user_id}'
+
+
+def _get_profile(model, user):
+    if not user or not user.is_authenticated:
+        return None
+    key = _cache_key(model, user.pk)
+    profile = cache.get(key)
+    if profile is None:
+        profile = model.objects.filter(user_id=user.pk).first() or _NO_PROFILE
+        cache.set(key, profile, CACHE_TIMEOUT)
+    return None if profile == _NO_PROFILE else profile
+
+
+def get_doctor(user):
+    return _get_profile(Doctor, user)
+
+
+def get_patient(user):
+    return _get_profile(Patient, user)
+
+
+def invalidate(model, user_id):
+    cache.delete(_cache_key(model, user_id))
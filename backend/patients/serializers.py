@@ -171,7 +171,7 @@ class DoctorSerializer(serializers.ModelSerializer):
 class MedicineSerializer(serializers.ModelSerializer):
     class Meta:
         model = Medicine
-        fields = "__all__"
+        exclude = ['search_key']
 
 
 class AppointmentSerializer(serializers.ModelSerializer):
@@ -213,12 +213,16 @@ class AppointmentDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Appointment
         fields = '__all__'
+        # Валидатор, который DRF строит по условному ограничению appt_unique_scheduled_doctor_slot,
+        # падает с KeyError на PATCH без status; занятое время ловит
+        # AppointmentDetailViewSet.perform_update по IntegrityError
+        validators = []
     
     def get_patient_details(self, obj):
         return {
             'id': obj.patient.id,
             'name': f"{obj.patient.first_name} {obj.patient.last_name}",
-            'phone': obj.patient.phone,
+            'phone': obj.patient.user.phone,
             'birth_date': obj.patient.birth_date,
             'gender': obj.patient.gender,
             'chronic_diseases': obj.patient.chronic_diseases,
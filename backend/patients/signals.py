@@ -1,16 +1,219 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
-from django.conf import settings
-from .models import Patient, Doctor
+from django.utils import timezone
+from accounts.models import User
+from .models import (
+    Appointment, Doctor, Patient, Medicine, DiagnosisTemplate,
+    MedicalRecord, Prescription, DoctorNote, PatientFile, FileUpload,
+)
+from . import allergies
+from . import blobs
+from . import changelog
+from . import charts
+from . import derivatives
+from . import medicine_search
+from . import response_cache
+from . import roles
+from . import slots
+from . import stats
+from . import uploads
 
 
-@receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_profile(sender, instance, created, **kwargs):
+# --- Журнал изменений для дельта-синхронизации (changelog.py) ---
+# Объявлен до индекса слотов: тот обновляет _loaded_slot, а здесь нужен исходный врач
+
+@receiver(post_save, sender=Appointment)
+def record_appointment_change(sender, instance, created, **kwargs):
+    changelog.record(instance.id, instance.patient_id, instance.doctor_id, 'created' if created else 'updated')
+    # Запись перенесли к другому врачу: у старого она должна исчезнуть
+    loaded_slot = getattr(instance, '_loaded_slot', None)
+    if not created and loaded_slot and loaded_slot[0] not in (None, instance.doctor_id):
+        changelog.record(instance.id, None, loaded_slot[0])
+
+
+@receiver(post_delete, sender=Appointment)
+def record_appointment_deletion(sender, instance, **kwargs):
+    changelog.record(instance.id, instance.patient_id, instance.doctor_id, 'deleted')
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def record_medical_record_change(sender, instance, **kwargs):
+    changelog.record_for_appointment_id(instance.appointment_id)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_save, sender=DoctorNote)
+@receiver(post_delete, sender=DoctorNote)
+def record_medical_record_item_change(sender, instance, **kwargs):
+    changelog.record_for_medical_record_id(instance.medical_record_id)
+
+
+@receiver(post_save, sender=PatientFile)
+@receiver(post_delete, sender=PatientFile)
+def record_file_change(sender, instance, **kwargs):
+    if instance.medical_record_id:
+        changelog.record_for_medical_record_id(instance.medical_record_id)
+
+
+# --- Дневная статистика врачей (stats.py) ---
+# Тоже до индекса слотов: нужен исходный день приема
+
+def _refresh_stats_on_commit(doctor_days):
+    if doctor_days:
+        transaction.on_commit(lambda: [stats.refresh_day(doctor_id, day) for doctor_id, day in doctor_days])
+
+
+def _local_day(slot):
+    return (slot[0], timezone.localtime(slot[1]).date())
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_doctor_stats_on_save(sender, instance, created, **kwargs):
+    """
+    Пересчитывает статистику дня, если прием в нем завершен или был завершен
+    до изменения (отмена, перенос, смена врача или диагноза). При переносе
+    завершенного приема пересчитываются оба дня.
+    """
+    loaded_status = getattr(instance, '_loaded_status', None)
+    loaded_slot = getattr(instance, '_loaded_slot', None)
+    instance._loaded_status = instance.status
+    doctor_days = set()
+    if instance.status == 'completed':
+        doctor_days.add(_local_day((instance.doctor_id, instance.date_time)))
+    if not created and loaded_status == 'completed' and loaded_slot and loaded_slot[1] is not None:
+        doctor_days.add(_local_day(loaded_slot))
+    _refresh_stats_on_commit(doctor_days)
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_doctor_stats_on_delete(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        _refresh_stats_on_commit({_local_day((instance.doctor_id, instance.date_time))})
+
+
+@receiver(post_save, sender=Appointment)
+def update_slot_index_on_save(sender, instance, created, **kwargs):
+    """
+    Поддерживает индекс занятости слотов врача: после коммита маска дня
+    сбрасывается и перестраивается из БД при следующем чтении. Если
+    транзакция откатится, индекс не изменится. При переносе записи
+    сбрасываются маски обоих дней.
+    """
+    loaded_slot = getattr(instance, '_loaded_slot', None)
+    current_slot = (instance.doctor_id, instance.date_time)
+    instance._loaded_slot = current_slot
+    affected = [current_slot]
+    if not created and loaded_slot and loaded_slot[1] is not None and loaded_slot != current_slot:
+        affected.append(loaded_slot)
+    transaction.on_commit(lambda: slots.invalidate_many(affected))
+
+
+@receiver(post_delete, sender=Appointment)
+def update_slot_index_on_delete(sender, instance, **kwargs):
+    slot = (instance.doctor_id, instance.date_time)
+    transaction.on_commit(lambda: slots.invalidate_many([slot]))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_role_profile(sender, instance, **kwargs):
     """
-    Создание Patient или Doctor при регистрации User.
+    Сбрасывает кэш профиля роли пользователя (см. patients.roles) после
+    коммита: иначе параллельный запрос успел бы закэшировать старую строку.
     """
+    transaction.on_commit(lambda: roles.invalidate(sender, instance.user_id))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_responses(sender, instance, **kwargs):
+    response_cache.invalidate('doctor')
+
+
+@receiver(post_save, sender=User)
+def invalidate_doctor_user_responses(sender, instance, update_fields=None, **kwargs):
+    # Список врачей содержит аватар из профиля пользователя;
+    # обновление last_login при входе на список не влияет
+    if instance.is_doctor and update_fields != frozenset({'last_login'}):
+        response_cache.invalidate('doctor')
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_responses(sender, instance, **kwargs):
+    # Список лекарств помечает аллергии конкретного пациента
+    patient_id = instance.id
+    transaction.on_commit(lambda: allergies.invalidate(patient_id))
+    response_cache.invalidate(f'patient:{instance.id}')
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def invalidate_medicine_responses(sender, instance, **kwargs):
+    response_cache.invalidate('medicine')
+    transaction.on_commit(medicine_search.invalidate)
+
+
+@receiver(post_save, sender=DiagnosisTemplate)
+@receiver(post_delete, sender=DiagnosisTemplate)
+def invalidate_diagnosis_template_responses(sender, instance, **kwargs):
+    response_cache.invalidate(f'diagnosis_template:{instance.doctor_id}')
+
+
+# --- Снимки медицинских карт (charts.py) ---
+
+@receiver(post_save, sender=Appointment)
+def mark_chart_stale_on_completion(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        charts.mark_stale(patient_id=instance.patient_id)
+
+
+@receiver(post_save, sender=Patient)
+def mark_chart_stale_on_patient(sender, instance, created, **kwargs):
+    if not created:
+        charts.mark_stale(patient_id=instance.id)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def mark_chart_stale_on_record(sender, instance, **kwargs):
+    charts.mark_stale(patient__appointments__id=instance.appointment_id)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_save, sender=DoctorNote)
+@receiver(post_delete, sender=DoctorNote)
+def mark_chart_stale_on_record_item(sender, instance, **kwargs):
+    charts.mark_stale(patient__appointments__medical_record__id=instance.medical_record_id)
+
+
+@receiver(post_save, sender=PatientFile)
+@receiver(post_delete, sender=PatientFile)
+def mark_chart_stale_on_file(sender, instance, **kwargs):
+    charts.mark_stale(patient_id=instance.patient_id)
+
+
+@receiver(post_delete, sender=FileUpload)
+def remove_upload_part(sender, instance, **kwargs):
+    # Временный файл загрузки (после завершения он уже перенесен в хранилище)
+    # Путь берем сразу: после delete() у instance уже не будет id
+    path = uploads.part_path(instance)
+    transaction.on_commit(lambda: uploads.remove_part(path))
+
+
+@receiver(post_delete, sender=PatientFile)
+def release_file_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        blobs.release(instance.blob_id)
+
+
+@receiver(post_save, sender=PatientFile)
+def enqueue_file_derivatives(sender, instance, created, **kwargs):
     if created:
-        if instance.is_patient:
-            Patient.objects.create(user=instance, first_name=instance.username, last_name='')
-        if instance.is_doctor:
-            Doctor.objects.create(user=instance, first_name=instance.username, last_name='')
+        derivatives.enqueue(instance)
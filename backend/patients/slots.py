@@ -0,0 +1,159 @@
+"""
+Индекс занятости слотов врача.
+
+Рабочий день разбит на 30-минутные слоты (09:00–18:00, обед 13:00–14:00).
+Занятость врача на локальный день хранится в кэше как битовая маска:
+бит i установлен, если слот SLOT_TIMES[i] занят запланированной записью.
+После коммита изменений Appointment сигналы сбрасывают маски затронутых
+дней (а не правят биты: get-modify-set в кэше не атомарен, параллельные
+записи затирали бы друг друга); маска перестраивается из БД одним запросом
+при следующем чтении.
+
+Нужен общий для всех воркеров кэш (REDIS_URL): с LocMemCache маска живет в
+памяти процесса, и сброс доходит только до воркера, сохранившего запись -
+остальные показывают устаревшую занятость до CACHE_TIMEOUT.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Appointment
+
+
+SLOT_MINUTES = 30
+WORK_START = time(9, 0)
+WORK_END = time(18, 0)
+LUNCH_START = time(13, 0)
+LUNCH_END = time(14, 0)
+WEEKEND_DAYS = (5, 6)
+
+
+def _build_slot_times():
+    slots = []
+    current = datetime.combine(datetime.min.date(), WORK_START)
+    end = datetime.combine(datetime.min.date(), WORK_END)
+    while current < end:
+        t = current.time()
+        if not (LUNCH_START <= t < LUNCH_END):
+            slots.append(t)
+        current += timedelta(minutes=SLOT_MINUTES)
+    return tuple(slots)
+
+
+SLOT_TIMES = _build_slot_times()
+SLOT_LABELS = tuple(f"{t.hour:02d}:{t.minute:02d}" for t in SLOT_TIMES)
+_SLOT_INDEX = {(t.hour, t.minute): i for i, t in enumerate(SLOT_TIMES)}
+
+CACHE_PREFIX = 'slots'
+CACHE_TIMEOUT = getattr(settings, 'SLOT_INDEX_TIMEOUT', 300)
+
+
+def slot_index(local_dt):
+    """Номер слота для локального времени или None, если время вне сетки."""
+    return _SLOT_INDEX.get((local_dt.hour, local_dt.minute))
+
+
+def _cache_key(doctor_id, day):
+    return f'{CACHE_PREFIX}:{doctor_id}:{day.isoformat()}'
+
+
+def build_mask(date_times):
+    """Собирает битовую маску из списка datetime записей."""
+    tz = timezone.get_current_timezone()
+    mask = 0
+    for dt in date_times:
+        idx = slot_index(dt.astimezone(tz))
+        if idx is not None:
+            mask |= 1 << idx
+    return mask
+
+
+def rebuild(doctor_id, day):
+    """Перестраивает маску дня из БД и кладёт её в кэш."""
+    date_times = Appointment.objects.filter(doctor_id=doctor_id).scheduled().for_local_day(day).values_list(
+        'date_time', flat=True
+    )
+    mask = build_mask(date_times)
+    cache.set(_cache_key(doctor_id, day), mask, CACHE_TIMEOUT)
+    return mask
+
+
+def get_mask(doctor_id, day):
+    """Маска занятости врача на день (из кэша или из БД)."""
+    mask = cache.get(_cache_key(doctor_id, day))
+    if mask is None:
+        mask = rebuild(doctor_id, day)
+    return mask
+
+
+def get_masks(doctor_ids, days):
+    """
+    Маски занятости для всех пар (врач, день).
+    Отсутствующие в кэше маски строятся одним запросом по всему диапазону.
+    Возвращает словарь {(doctor_id, day): mask}.
+    """
+    keys = {_cache_key(doctor_id, day): (doctor_id, day) for doctor_id in doctor_ids for day in days}
+    cached = cache.get_many(keys.keys())
+    masks = {keys[key]: mask for key, mask in cached.items()}
+
+    missing = [pair for key, pair in keys.items() if key not in cached]
+    if not missing:
+        return masks
+
+    missing_doctors = {doctor_id for doctor_id, _ in missing}
+    missing_days = sorted({day for _, day in missing})
+
+    rebuilt = {pair: 0 for pair in missing}
+    tz = timezone.get_current_timezone()
+    rows = Appointment.objects.filter(doctor_id__in=missing_doctors).scheduled().for_local_range(
+        missing_days[0], missing_days[-1]
+    ).values_list('doctor_id', 'date_time')
+    for doctor_id, dt in rows:
+        local_dt = dt.astimezone(tz)
+        pair = (doctor_id, local_dt.date())
+        idx = slot_index(local_dt)
+        if pair in rebuilt and idx is not None:
+            rebuilt[pair] |= 1 << idx
+
+    cache.set_many({_cache_key(*pair): mask for pair, mask in rebuilt.items()}, CACHE_TIMEOUT)
+    masks.update(rebuilt)
+    return masks
+
+
+def invalidate(doctor_id, dt):
+    """Сбрасывает маску дня, к которому относится dt."""
+    invalidate_many([(doctor_id, dt)])
+
+
+def invalidate_many(slots):
+    """Сбрасывает маски дней для пар (doctor_id, datetime). Вызывать после коммита."""
+    cache.delete_many({_cache_key(doctor_id, timezone.localtime(dt).date()) for doctor_id, dt in slots})
+
+
+def day_slots(day, mask, now=None):
+    """
+    Список слотов дня (без прошедших) с признаком доступности.
+    Возвращает (slots, available_count).
+    """
+    if day.weekday() in WEEKEND_DAYS:
+        return [], 0
+    tz = timezone.get_current_timezone()
+    now = now or timezone.now()
+    slots = []
+    available_count = 0
+    for idx, slot_time in enumerate(SLOT_TIMES):
+        slot_datetime = datetime.combine(day, slot_time, tzinfo=tz)
+        if slot_datetime <= now:
+            continue
+        available = not (mask >> idx) & 1
+        if available:
+            available_count += 1
+        slots.append({
+            'time': SLOT_LABELS[idx],
+            'datetime': slot_datetime.isoformat(),
+            'is_past': False,
+            'available': available,
+        })
+    return slots, available_count
@@ -0,0 +1,100 @@
+"""
+Сводная статистика врачей по дням (DoctorDailyStats).
+
+Строка дня пересчитывается целиком из завершенных приемов этого дня,
+поэтому пересчет идемпотентен: сигналы Appointment вызывают его после
+коммита при любом изменении завершенного приема (signals.py), а команда
+rebuild_doctor_stats повторяет его для починки.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, DoctorDailyStats
+
+
+def _summarize(rows):
+    """rows: (patient_id, diagnosis) -> значения полей строки статистики."""
+    patients = set()
+    diagnoses = Counter()
+    count = 0
+    for patient_id, diagnosis in rows:
+        count += 1
+        patients.add(patient_id)
+        if diagnosis:
+            diagnoses[diagnosis] += 1
+    return {
+        'completed_count': count,
+        'patient_ids': sorted(patients),
+        'diagnosis_counts': dict(diagnoses),
+    }
+
+
+def refresh_day(doctor_id, day):
+    """
+    Пересчитывает строку статистики врача за локальный день.
+    Строка блокируется до подсчета: параллельное завершение приема у того же
+    врача в тот же день ждет коммита первого и считает уже с его приемом,
+    а не перезаписывает итог устаревшим подсчетом.
+    """
+    with transaction.atomic():
+        DoctorDailyStats.objects.get_or_create(doctor_id=doctor_id, day=day)
+        stats_row = DoctorDailyStats.objects.select_for_update().get(doctor_id=doctor_id, day=day)
+        rows = Appointment.objects.completed().filter(doctor_id=doctor_id).for_local_day(day).values_list(
+            'patient_id', 'diagnosis'
+        )
+        values = _summarize(rows)
+        if not values['completed_count']:
+            stats_row.delete()
+            return
+        for field, value in values.items():
+            setattr(stats_row, field, value)
+        stats_row.save()
+
+
+def rebuild(start_day, end_day, doctor_id=None):
+    """
+    Пересчитывает статистику за дни [start_day, end_day] одним проходом по приемам.
+    Возвращает число записанных строк.
+    """
+    appointments = Appointment.objects.completed().for_local_range(start_day, end_day)
+    existing = DoctorDailyStats.objects.filter(day__gte=start_day, day__lte=end_day)
+    if doctor_id is not None:
+        appointments = appointments.filter(doctor_id=doctor_id)
+        existing = existing.filter(doctor_id=doctor_id)
+
+    grouped = defaultdict(list)
+    tz = timezone.get_current_timezone()
+    for doc_id, dt, patient_id, diagnosis in appointments.values_list(
+        'doctor_id', 'date_time', 'patient_id', 'diagnosis'
+    ).iterator(chunk_size=5000):
+        grouped[(doc_id, dt.astimezone(tz).date())].append((patient_id, diagnosis))
+
+    rows = [
+        DoctorDailyStats(doctor_id=doc_id, day=day, **_summarize(items))
+        for (doc_id, day), items in grouped.items()
+    ]
+    # Дни, где завершенных приемов больше нет
+    stale = [pk for pk, doc_id, day in existing.values_list('id', 'doctor_id', 'day') if (doc_id, day) not in grouped]
+    DoctorDailyStats.objects.filter(id__in=stale).delete()
+    DoctorDailyStats.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['doctor', 'day'],
+        update_fields=['completed_count', 'patient_ids', 'diagnosis_counts', 'updated_at'],
+    )
+    return len(rows)
+
+
+def summary(rows):
+    """Итоги по строкам сводки: всего приемов, уникальные пациенты и счетчик диагнозов."""
+    total = 0
+    patients = set()
+    diagnoses = Counter()
+    for stats in rows:
+        total += stats.completed_count
+        patients.update(stats.patient_ids)
+        diagnoses.update(stats.diagnosis_counts)
+    return total, len(patients), diagnoses
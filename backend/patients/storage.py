@@ -0,0 +1,26 @@
+"""
+Закрытое хранилище файлов пациентов (PatientFile, FileBlob и копии снимков).
+
+Файлы лежат в PROTECTED_MEDIA_ROOT, вне MEDIA_ROOT, поэтому публичный /media/
+их не отдает. Единственный путь к содержимому - PatientFileDownloadView с
+проверкой доступа: сам Django или nginx через X-Accel-Redirect на internal
+location (downloads.py). Публичных URL у таких файлов нет: url() возвращает None.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+
+class ProtectedStorage(FileSystemStorage):
+    def __init__(self):
+        super().__init__(location=settings.PROTECTED_MEDIA_ROOT, base_url=None)
+
+    def url(self, name):
+        return None
+
+
+_storage = ProtectedStorage()
+
+
+def protected_storage():
+    # Вызываемый объект: в миграциях сохраняется ссылка, а не путь на диске
+    return _storage
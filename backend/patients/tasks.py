@@ -1,30 +1,43 @@
+from django.db import transaction
 from django.utils import timezone
-from .models import Appointment, Doctor
 
-def cancel_missed_appointments_for_doctor(doctor_id):
+from . import changelog
+from .models import Appointment
+
+
+BATCH_SIZE = 1000
+
+
+def cancel_missed_appointments(batch_size=BATCH_SIZE):
     """
-    Находит просроченные запланированные записи для КОНКРЕТНОГО врача
-    и меняет их статус на "отменено".
-    "Просроченной" считается запись, которая была вчера или ранее.
+    Находит просроченные запланированные записи по всей клинике
+    и меняет их статус на "отменено" пачками по batch_size.
+    "Просроченной" считается запись, которая была вчера или ранее
+    (граница - начало сегодняшнего дня по местному времени).
+
+    Строки пачки блокируются (SKIP LOCKED - запись, которую сейчас завершает
+    врач, пропускается), а UPDATE повторяет условие missed(), поэтому
+    завершенная тем временем запись не станет отмененной.
     """
-    try:
-        doctor = Doctor.objects.get(id=doctor_id)
-        
-        # Устанавливаем границу на начало сегодняшнего дня в текущем часовом поясе
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        missed_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            status='scheduled',
-            date_time__lt=today_start # Все, что было до начала сегодняшнего дня
-        )
-        
-        count = missed_appointments.update(status='cancelled')
-        
-        if count > 0:
-            print(f"--- [Авто-отмена] Отменено {count} пропущенных записей для Dr. {doctor.last_name}.")
-        
-        return count
-        
-    except Doctor.DoesNotExist:
-        return 0
\ No newline at end of file
+    count = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Appointment.objects.missed().select_for_update(skip_locked=True)
+                .order_by('id').values_list('id', 'patient_id', 'doctor_id')[:batch_size]
+            )
+            if not rows:
+                break
+            updated = Appointment.objects.missed().filter(id__in=[row[0] for row in rows]).update(
+                status='cancelled', updated_at=timezone.now()
+            )
+            # UPDATE не вызывает сигналы: журнал для дельта-синхронизации пишем сами
+            changelog.record_many(rows)
+        count += updated
+        if len(rows) < batch_size:
+            break
+    
+    if count > 0:
+        print(f"--- [Авто-отмена] Отменено {count} пропущенных записей.")
+    
+    return count
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .allergies import AllergyMatcher, terms
+
+
+class AllergyMatcherTests(SimpleTestCase):
+    def matcher(self, allergies_text):
+        return AllergyMatcher(terms(allergies_text))
+
+    def test_hyphenated_medicine_name(self):
+        self.assertTrue(self.matcher('лидокаин').matches('Лидокаин-спрей'))
+
+    def test_medicine_word_starting_with_allergen(self):
+        self.assertTrue(self.matcher('йод').matches('Йодомарин'))
+
+    def test_inflected_allergen_and_synonym(self):
+        matcher = self.matcher('Аллергия на аспирин, пенициллину')
+        self.assertTrue(matcher.matches('Ацетилсалициловая кислота'))
+        self.assertTrue(matcher.matches('Бензилпенициллин'))
+        self.assertTrue(self.matcher('но-шпа').matches('Дротаверин'))
+
+    def test_generic_acid_does_not_match_other_acids(self):
+        matcher = self.matcher('аскорбиновая кислота')
+        self.assertTrue(matcher.matches('Аскорбиновая кислота'))
+        self.assertFalse(matcher.matches('Фолиевая кислота'))
+        self.assertFalse(matcher.matches('Ацетилсалициловая кислота'))
+
+    def test_vitamins_are_told_apart(self):
+        matcher = self.matcher('витамин B12')
+        self.assertTrue(matcher.matches('Витамин B12'))
+        self.assertFalse(matcher.matches('Витамин C'))
+        self.assertFalse(matcher.matches('Витамин D3'))
+
+    def test_salt_does_not_match_other_salts(self):
+        matcher = self.matcher('Диклофенак натрия')
+        self.assertTrue(matcher.matches('Диклофенак'))
+        self.assertFalse(matcher.matches('Натрия хлорид'))
+        self.assertFalse(matcher.matches('Метамизол натрия'))
+        self.assertFalse(matcher.matches('Калия хлорид'))
+
+    def test_no_allergies(self):
+        self.assertFalse(self.matcher('Аллергии не выявлено'))
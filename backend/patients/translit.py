@@ -0,0 +1,47 @@
+"""
+Ключ поиска для названий: кириллица и латиница сводятся к одному
+латинскому написанию, чтобы "парацетамол" и "paracetamol" совпадали.
+
+Правила приблизительные (фонетическая свертка, а не транслитерация по ГОСТ):
+латинские сочетания приводятся к тому, как слово пишется по-русски
+(x -> ks, ph -> f, c перед a/o/u -> k), затем кириллица заменяется латиницей,
+удвоенные буквы схлопываются, дефисы убираются, остальные знаки
+препинания заменяются пробелами.
+"""
+import re
+
+
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+    # казахские буквы
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'і': 'i',
+}
+_CYRILLIC_TABLE = str.maketrans(_CYRILLIC)
+
+_LATIN_RULES = (
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'ch'), 'h'),
+    (re.compile(r'ck'), 'k'),
+    (re.compile(r'c(?![eiy])'), 'k'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'j'), 'i'),
+)
+_DOUBLE_RE = re.compile(r'([a-z])\1+')
+_SEPARATOR_RE = re.compile(r'[^a-z0-9]+')
+
+
+def search_key(text):
+    """Нормализованный ключ поиска для текста на кириллице или латинице."""
+    text = (text or '').lower().replace('-', '')
+    for pattern, replacement in _LATIN_RULES:
+        text = pattern.sub(replacement, text)
+    text = text.translate(_CYRILLIC_TABLE)
+    text = _DOUBLE_RE.sub(r'\1', text)
+    return _SEPARATOR_RE.sub(' ', text).strip()
@@ -0,0 +1,269 @@
+"""
+Загрузка файлов пациента по частям с докачкой.
+
+1. POST /api/patients/<id>/files/uploads/ - метаданные и размер файла;
+   в ответ id загрузки и рекомендуемый размер части.
+2. PUT /api/uploads/<id>/?offset=N - тело запроса дописывается во временный
+   файл с позиции N. N должен совпадать с уже полученным объемом; после обрыва
+   клиент узнает его через GET /api/uploads/<id>/ и продолжает с этого места.
+3. POST /api/uploads/<id>/complete/ - проверка формата по сигнатуре,
+   SHA-256 одним проходом по файлу и только затем создание PatientFile
+   (содержимое сохраняется через blobs.py, дубликаты не пишутся на диск).
+
+Тело части читается из потока блоками по BLOCK_SIZE и сразу пишется на диск,
+поэтому память на загрузку не зависит от размера файла.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs
+from . import roles
+from .models import FileUpload, MedicalRecord, PatientFile
+
+
+UPLOAD_DIR = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'upload_tmp'))
+MAX_SIZE = getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+CHUNK_SIZE = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+MAX_CHUNK_SIZE = 4 * CHUNK_SIZE
+BLOCK_SIZE = 64 * 1024
+STALE_AFTER = timedelta(hours=24)
+# Сколько одна часть может писаться, прежде чем ее смещение можно занять снова
+CHUNK_LEASE = timedelta(seconds=getattr(settings, 'CHUNKED_UPLOAD_CHUNK_TIMEOUT', 600))
+
+# Формат по сигнатуре: (формат, смещение, байты)
+SIGNATURES = [
+    ('pdf', 0, b'%PDF-'),
+    ('png', 0, b'\x89PNG\r\n\x1a\n'),
+    ('jpg', 0, b'\xff\xd8\xff'),
+    ('doc', 0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),
+    ('zip', 0, b'PK\x03\x04'),  # docx и архивы исследований
+    ('dcm', 128, b'DICM'),      # DICOM (МРТ, КТ)
+]
+HEAD_SIZE = max(offset + len(magic) for _, offset, magic in SIGNATURES)
+EXTENSIONS = {
+    'pdf': ('.pdf',),
+    'png': ('.png',),
+    'jpg': ('.jpg', '.jpeg'),
+    'doc': ('.doc',),
+    'zip': ('.docx', '.zip'),
+    'dcm': ('.dcm',),
+}
+ALLOWED_FORMATS_TEXT = 'pdf, doc, docx, jpg, jpeg, png, zip, dcm'
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def part_path(upload):
+    return os.path.join(UPLOAD_DIR, f'{upload.id}.part')
+
+
+def detect_format(head):
+    """Формат файла по первым HEAD_SIZE байтам; None, если формат не разрешен."""
+    for file_format, offset, magic in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return file_format
+    return None
+
+
+def _read_head(upload):
+    with open(part_path(upload), 'rb') as fh:
+        return fh.read(HEAD_SIZE)
+
+
+def _stored_name(filename, file_format):
+    """Имя для хранения: расширение всегда соответствует реальному формату."""
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    if ext.lower() in EXTENSIONS[file_format]:
+        return f'{stem}{ext}'
+    return f'{stem or "file"}{EXTENSIONS[file_format][0]}'
+
+
+def can_upload(patient, user):
+    """Загружать файлы в карту могут врачи и сам пациент."""
+    return roles.get_doctor(user) is not None or patient.user_id == user.pk
+
+
+def start(patient, user, filename, size, file_type, title='Документ', description='', medical_record_id=None):
+    if not can_upload(patient, user):
+        raise UploadError('Доступ запрещен', status=403)
+    if file_type not in dict(PatientFile.FILE_TYPES):
+        raise UploadError('Недопустимый тип файла')
+    if not filename:
+        raise UploadError('Не указано имя файла')
+    if size <= 0:
+        raise UploadError('Некорректный размер файла')
+    if size > MAX_SIZE:
+        raise UploadError(f'Размер файла превышает {MAX_SIZE // 1024 ** 2} МБ')
+    if medical_record_id and not MedicalRecord.objects.filter(
+        id=medical_record_id, appointment__patient=patient
+    ).exists():
+        raise UploadError('Медицинская запись не найдена')
+
+    upload = FileUpload.objects.create(
+        patient=patient,
+        uploaded_by=user,
+        medical_record_id=medical_record_id or None,
+        file_type=file_type,
+        filename=os.path.basename(filename)[:255],
+        title=title or 'Документ',
+        description=description or '',
+        size=size,
+    )
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload_id, user, offset, stream, length):
+    """
+    Дописывает часть длиной length с позиции offset. Возвращает загрузку с новым объемом.
+    Если соединение оборвалось посреди части, сохраняется то, что успело прийти.
+
+    Блокировка строки держится только на проверке смещения с резервированием
+    части (writing_until) и на переносе части в файл загрузки. Сама часть
+    читается из сети без транзакции в отдельный временный файл этого запроса
+    и переносится, только если смещение и резерв все еще наши: запрос, который
+    завис дольше CHUNK_LEASE, не испортит данные, принятые после него.
+    """
+    with transaction.atomic():
+        upload = FileUpload.objects.select_for_update().filter(id=upload_id, uploaded_by=user).first()
+        if upload is None:
+            raise UploadError('Загрузка не найдена', status=404)
+        if offset != upload.received:
+            raise UploadError('Неверное смещение', status=409, offset=upload.received)
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError(f'Часть больше {MAX_CHUNK_SIZE // 1024 ** 2} МБ', status=413)
+        if offset + length > upload.size:
+            raise UploadError('Данные выходят за объявленный размер файла')
+        now = timezone.now()
+        if upload.writing_until and upload.writing_until > now:
+            raise UploadError('Эта часть уже загружается', status=409, offset=upload.received)
+        writing_until = now + CHUNK_LEASE
+        FileUpload.objects.filter(id=upload.id).update(writing_until=writing_until)
+
+    # Временный файл удаляется при закрытии, в том числе при ошибке
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=f'{upload.id}.', suffix='.chunk') as chunk:
+        written = 0
+        try:
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                chunk.write(block)
+                written += len(block)
+        except OSError as e:
+            print(f"--- [Загрузка] Обрыв части {upload.id} на {offset + written}: {e}")
+        except BaseException:
+            # Снимаем свой резерв, чтобы клиент мог сразу повторить часть
+            FileUpload.objects.filter(id=upload.id, writing_until=writing_until).update(writing_until=None)
+            raise
+        chunk.flush()
+        chunk.seek(0)
+
+        with transaction.atomic():
+            upload = FileUpload.objects.select_for_update().filter(id=upload.id).first()
+            if upload is None:
+                raise UploadError('Загрузка не найдена', status=404)
+            if upload.received != offset or upload.writing_until != writing_until:
+                raise UploadError('Часть не принята, повторите с текущего смещения', status=409, offset=upload.received)
+            with open(part_path(upload), 'r+b') as fh:
+                fh.seek(offset)
+                shutil.copyfileobj(chunk, fh, BLOCK_SIZE)
+                # Хвост от прежней оборванной попытки отбрасываем
+                fh.truncate()
+            upload.received = offset + written
+            upload.writing_until = None
+            upload.save(update_fields=['received', 'writing_until', 'updated_at'])
+
+    # Формат проверяем, как только пришли первые байты, а не после всего файла
+    if offset < HEAD_SIZE and upload.received >= min(HEAD_SIZE, upload.size):
+        if detect_format(_read_head(upload)) is None:
+            upload.delete()
+            raise UploadError(f'Недопустимый формат файла. Разрешены: {ALLOWED_FORMATS_TEXT}')
+    return upload
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _PartFile(File):
+    """Временный файл загрузки: FileSystemStorage переносит его на место без копирования."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def complete(upload_id, user, expected_sha256=None):
+    """Проверяет файл и создает PatientFile. Возвращает (PatientFile, sha256)."""
+    upload = FileUpload.objects.filter(id=upload_id, uploaded_by=user).first()
+    if upload is None:
+        raise UploadError('Загрузка не найдена', status=404)
+    if upload.received != upload.size:
+        raise UploadError('Файл загружен не полностью', status=409, offset=upload.received)
+
+    path = part_path(upload)
+    try:
+        file_format = detect_format(_read_head(upload))
+        sha256 = file_sha256(path) if file_format else None
+    except FileNotFoundError:
+        # Параллельный запрос уже завершил эту загрузку
+        raise UploadError('Загрузка не найдена', status=404)
+    if file_format is None:
+        upload.delete()
+        raise UploadError(f'Недопустимый формат файла. Разрешены: {ALLOWED_FORMATS_TEXT}')
+    if expected_sha256 and expected_sha256.lower() != sha256:
+        upload.delete()
+        raise UploadError('Контрольная сумма не совпадает, загрузите файл заново')
+
+    with transaction.atomic():
+        if not FileUpload.objects.select_for_update().filter(id=upload.id).exists():
+            raise UploadError('Загрузка не найдена', status=404)
+        with open(path, 'rb') as fh:
+            # Если такое содержимое уже есть, временный файл просто удаляется вместе с загрузкой
+            pf = blobs.create_patient_file(
+                _PartFile(fh, name=_stored_name(upload.filename, file_format)),
+                sha256=sha256,
+                patient_id=upload.patient_id,
+                medical_record_id=upload.medical_record_id,
+                file_type=upload.file_type,
+                title=upload.title,
+                description=upload.description,
+                uploaded_by=upload.uploaded_by,
+            )
+        upload.delete()
+    return pf, sha256
+
+
+def remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_stale(max_age=STALE_AFTER):
+    """Удаляет брошенные загрузки (временные файлы удаляет сигнал post_delete)."""
+    stale = FileUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale.iterator():
+        upload.delete()
+        count += 1
+    return count
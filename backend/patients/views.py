@@ -4,14 +4,30 @@ from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from datetime import datetime, timedelta, time, date
 from django.utils.dateparse import parse_date
 from django.utils.dateparse import parse_datetime
-from django.db.models import Count, Q, Case, When, Value, IntegerField, CharField
-from .sms_service import send_sms
-from .email_service import send_appointment_confirmation_email
-from .email_service import send_reception_summary_email
+from django.utils.http import http_date
+from django.db import transaction, IntegrityError
+from django.db.models import Count, Q
+from . import allergies
+from . import analytics
+from . import blobs
+from . import changelog
+from . import chart_pdf
+from . import charts
+from . import downloads
+from . import history
+from . import medicine_search
+from . import outbox
+from .pagination import KeysetPagination
+from . import response_cache
+from . import slots
+from . import stats
+from . import uploads
 from .models import (
     Patient, 
     Doctor,
@@ -22,7 +38,11 @@ from .models import (
     PatientFile,
     DoctorNote,
     DiagnosisTemplate,
+    DoctorDailyStats,
     PatientActiveMedicine,
+    FileUpload,
+    DOCTOR_LIST_RANK,
+    PATIENT_LIST_RANK,
     )
 from .serializers import (
     PatientSerializer,
@@ -168,12 +188,10 @@ class PatientMeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        try:
-            patient = Patient.objects.get(user=request.user)
-            serializer = PatientSerializer(patient)
-            return Response(serializer.data)
-        except Patient.DoesNotExist:
+        if request.patient is None:
             return Response({'error': 'Пациент не найден'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = PatientSerializer(request.patient)
+        return Response(serializer.data)
 
 
 # ===== DOCTORS =====
@@ -181,14 +199,17 @@ class DoctorListView(generics.ListAPIView):
     """
     Список всех врачей (публичный или для пациентов)
     """
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.select_related('user').order_by('last_name', 'first_name', 'id')
     permission_classes = [IsAuthenticated]
     
+    @response_cache.cache_response('doctor_list', tags=['doctor'])
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        paginator = KeysetPagination(ordering=('last_name', 'first_name', 'id'))
+        page = paginator.paginate_queryset(queryset, request)
         data = []
         
-        for doctor in queryset:
+        for doctor in queryset if page is None else page:
             doctor_data = {
                 'id': doctor.id,
                 'first_name': doctor.first_name,
@@ -208,6 +229,8 @@ class DoctorListView(generics.ListAPIView):
             
             data.append(doctor_data)
         
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response({'results': data})
 
 
@@ -232,12 +255,10 @@ class DoctorMeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-            serializer = DoctorSerializer(doctor)
-            return Response(serializer.data)
-        except Doctor.DoesNotExist:
+        if request.doctor is None:
             return Response({'error': 'Доктор не найден'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = DoctorSerializer(request.doctor)
+        return Response(serializer.data)
 
 
 # ===== MEDICINES =====
@@ -247,6 +268,21 @@ class MedicineListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
 
+class MedicineSearchView(APIView):
+    """
+    Автодополнение препаратов: ?q=парац&limit=10 -> [{id, name}]
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', medicine_search.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'limit должен быть числом'}, status=400)
+        return Response({'results': medicine_search.search(query, limit)})
+
+
 class MedicineDetailView(generics.RetrieveAPIView):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
@@ -366,9 +402,8 @@ class AppointmentCreateView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
-        try:
-            patient = Patient.objects.get(user=request.user)
-        except Patient.DoesNotExist:
+        patient = request.patient
+        if patient is None:
             return Response({
                 'success': False,
                 'message': 'Только пациенты могут создавать записи'
@@ -397,24 +432,29 @@ class AppointmentCreateView(APIView):
             current_tz = timezone.get_current_timezone()
             appointment_datetime = timezone.make_aware(appointment_datetime, current_tz)
         
-        existing = Appointment.objects.filter(
+        existing = Appointment.objects.scheduled().filter(
             doctor=doctor,
-            date_time=appointment_datetime,
-            status='scheduled'
+            date_time=appointment_datetime
         ).exists()
         
         if existing:
             return Response({'success': False, 'message': 'Это время уже занято'}, status=400)
         
-        appointment = Appointment.objects.create(
-            patient=patient,
-            doctor=doctor,
-            date_time=appointment_datetime,
-            notes=notes,
-            status='scheduled',
-            room_number=doctor.office_number
-        )
-        send_appointment_confirmation_email(appointment)
+        try:
+            # Уникальное ограничение защищает от одновременной записи на один слот
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    patient=patient,
+                    doctor=doctor,
+                    date_time=appointment_datetime,
+                    notes=notes,
+                    status='scheduled',
+                    room_number=doctor.office_number
+                )
+                # Письмо уйдет из outbox фоновым процессом
+                outbox.enqueue('appointment_confirmation', appointment=appointment)
+        except IntegrityError:
+            return Response({'success': False, 'message': 'Это время уже занято'}, status=400)
 
         
         return Response({
@@ -435,105 +475,130 @@ class AppointmentCreateView(APIView):
             }
         })
 
+def _doctor_appointment_entry(apt):
+    age = None
+    if apt.patient.birth_date:
+        today = date.today()
+        born = apt.patient.birth_date
+        age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+    patient_data = {
+        'id': apt.patient.id, 'first_name': apt.patient.first_name, 'last_name': apt.patient.last_name,
+        'phone': apt.patient.user.phone or '', 'age': age, 'gender': apt.patient.get_gender_display(), 'iin': apt.patient.iin,
+    }
+    return {
+        'id': apt.id, 'date_time': apt.date_time.isoformat(), 'status': apt.status,
+        'notes': apt.notes or '', 'diagnosis': apt.diagnosis or '',
+        'room_number': apt.room_number or '', 'patient': apt.patient.id,
+        'patient_details': patient_data
+    }
+
+
+def _patient_appointment_entry(apt):
+    return {
+        'id': apt.id,
+        'date_time': apt.date_time.isoformat(),
+        'status': apt.status,
+        'notes': apt.notes or '',
+        'diagnosis': apt.diagnosis or '',
+        'room_number': apt.room_number or '',
+        'doctor': apt.doctor.id,
+        'doctor_details': {
+            'id': apt.doctor.id,
+            'name': f"{apt.doctor.last_name} {apt.doctor.first_name}",
+            'specialization': apt.doctor.specialty,
+            'office_number': apt.room_number or getattr(apt.doctor, 'office_number', ''),
+            'phone': apt.doctor.work_phone or '',
+            'experience_years': apt.doctor.experience_years,
+        }
+    }
+
+
+def _parse_since(request):
+    """Курсор ?since= (None, если не передан); ValueError, если некорректен."""
+    since = request.query_params.get('since')
+    if since is None:
+        return None
+    return changelog.parse_cursor(since)
+
+
+def _delta_response(cursor, queryset, make_entry, **filters):
+    """
+    Ответ дельта-синхронизации: измененные после cursor записи из queryset
+    и id записей, которые удалены или больше не попадают в выборку.
+    """
+    changed_ids, new_cursor = changelog.changes_since(cursor, **filters)
+    apts = list(queryset.filter(id__in=changed_ids)) if changed_ids else []
+    return Response({
+        'cursor': new_cursor,
+        'changed': [make_entry(apt) for apt in apts],
+        'removed': sorted(changed_ids - {apt.id for apt in apts}),
+    })
+
+
 class MyAppointmentsView(APIView):
     """
     Получить записи текущего пользователя (пациента или врача)
-    с правильной сортировкой и "ленивой" отменой для пациента.
+    с правильной сортировкой.
+
+    Полный ответ содержит курсор в заголовке X-Sync-Cursor; с ?since=<курсор>
+    возвращаются только изменившиеся записи: {cursor, changed, removed}.
     """
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         date_str = request.query_params.get('date')
+        try:
+            since = _parse_since(request)
+        except ValueError:
+            return Response({'error': 'Некорректный параметр since'}, status=400)
+        # Курсор снимается до чтения, чтобы изменения во время чтения пришли в следующий раз
+        cursor = changelog.current_cursor() if since is None else None
         
         # 1. Если зашел ВРАЧ
-        try:
-            doctor = Doctor.objects.get(user=request.user)
+        doctor = request.doctor
+        if doctor is not None:
             
             queryset = Appointment.objects.filter(doctor=doctor)
             if date_str:
                 target_date = parse_date(date_str)
                 if target_date:
-                    queryset = queryset.filter(date_time__date=target_date)
+                    queryset = queryset.for_local_day(target_date)
 
             # Сортировка для врача: сначала 'scheduled', потом остальные, и по времени
             appointments = queryset.select_related('patient', 'patient__user').annotate(
-                status_order=Case(
-                    When(status='scheduled', then=Value(1)),
-                    default=Value(2),
-                    output_field=IntegerField()
-                )
-            ).order_by('status_order', 'date_time')
-            
-            data = []
-            for apt in appointments:
-                # ... (ваш код сериализации для врача без изменений) ...
-                # ... (я скопирую его из вашего предыдущего ответа) ...
-                age = None
-                if apt.patient.birth_date:
-                    today = date.today()
-                    born = apt.patient.birth_date
-                    age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
-                patient_data = {
-                    'id': apt.patient.id, 'first_name': apt.patient.first_name, 'last_name': apt.patient.last_name,
-                    'phone': apt.patient.user.phone or '', 'age': age, 'gender': apt.patient.get_gender_display(), 'iin': apt.patient.iin,
-                }
-                data.append({
-                    'id': apt.id, 'date_time': apt.date_time.isoformat(), 'status': apt.status,
-                    'notes': apt.notes or '', 'diagnosis': apt.diagnosis or '',
-                    'room_number': apt.room_number or '', 'patient': apt.patient.id,
-                    'patient_details': patient_data
-                })
-            return Response(data)
-            
-        except Doctor.DoesNotExist:
-            pass # Если не врач, идем дальше
+                status_order=DOCTOR_LIST_RANK
+            ).order_by('status_order', 'date_time', 'id')
+            if since is not None:
+                return _delta_response(since, appointments, _doctor_appointment_entry, doctor_id=doctor.id)
+
+            paginator = KeysetPagination(ordering=('status_order', 'date_time', 'id'))
+            page = paginator.paginate_queryset(appointments, request)
+            data = [_doctor_appointment_entry(apt) for apt in (appointments if page is None else page)]
+            response = paginator.get_paginated_response(data) if page is not None else Response(data)
+            response[changelog.CURSOR_HEADER] = cursor
+            return response
         
         # 2. Если зашел ПАЦИЕНТ
-        try:
-            patient = Patient.objects.get(user=request.user)
-            
-            today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            appointments = Appointment.objects.filter(patient=patient).select_related('doctor').annotate(
-                # Вычисляем статус "на лету"
-                effective_status=Case(
-                    When(Q(status='scheduled') & Q(date_time__lt=today_start), then=Value('cancelled')),
-                    default='status',
-                    output_field=CharField()
-                ),
-                # Сортируем по вычисленному статусу
-                status_order=Case(
-                    When(effective_status='scheduled', then=Value(1)),
-                    When(effective_status='completed', then=Value(2)),
-                    default=Value(3),
-                    output_field=IntegerField()
-                )
-            ).order_by('status_order', '-date_time')
-            
-            data = []
-            for apt in appointments:
-                data.append({
-                    'id': apt.id,
-                    'date_time': apt.date_time.isoformat(),
-                    'status': apt.effective_status, # <-- Используем вычисленный статус
-                    'notes': apt.notes or '',
-                    'diagnosis': apt.diagnosis or '',
-                    'room_number': apt.room_number or '',
-                    'doctor': apt.doctor.id,
-                    'doctor_details': {
-                        'id': apt.doctor.id,
-                        'name': f"{apt.doctor.last_name} {apt.doctor.first_name}",
-                        'specialization': apt.doctor.specialty,
-                        'office_number': apt.room_number or getattr(apt.doctor, 'office_number', ''),
-                        'phone': apt.doctor.work_phone or '',
-                        'experience_years': apt.doctor.experience_years,
-                    }
-                })
-            return Response(data)
-            
-        except Patient.DoesNotExist:
+        patient = request.patient
+        if patient is None:
             return Response({"error": "Профиль не найден"}, status=403)
 
+        # Просроченные записи отменяет процесс clock (cancel_missed_appointments --loop) после полуночи
+        # Сначала запланированные, затем завершенные и отмененные; внутри - новые первыми
+        appointments = Appointment.objects.filter(patient=patient).select_related('doctor').annotate(
+            status_order=PATIENT_LIST_RANK
+        ).order_by('-status_order', '-date_time', '-id')
+        if since is not None:
+            return _delta_response(since, appointments, _patient_appointment_entry, patient_id=patient.id)
+
+        paginator = KeysetPagination(ordering=('-status_order', '-date_time', '-id'))
+        page = paginator.paginate_queryset(appointments, request)
+        data = [_patient_appointment_entry(apt) for apt in (appointments if page is None else page)]
+        response = paginator.get_paginated_response(data) if page is not None else Response(data)
+        response[changelog.CURSOR_HEADER] = cursor
+        return response
+
+
 class AppointmentDetailViewSet(generics.RetrieveUpdateDestroyAPIView):
     """Просмотр, обновление и удаление записи"""
     queryset = Appointment.objects.all()
@@ -556,26 +621,33 @@ class AppointmentDetailViewSet(generics.RetrieveUpdateDestroyAPIView):
         
         # Пациент видит только свои записи
         if getattr(user, 'is_patient', False):
-            try:
-                patient = Patient.objects.get(user=user)
-                return Appointment.objects.filter(patient=patient)
-            except Patient.DoesNotExist:
+            patient = getattr(self.request, 'patient', None)
+            if patient is None:
                 return Appointment.objects.none()
+            return Appointment.objects.filter(patient=patient)
         
         # Врач видит записи к себе
         if getattr(user, 'is_doctor', False):
-            try:
-                doctor = Doctor.objects.get(user=user)
-                return Appointment.objects.filter(doctor=doctor)
-            except Doctor.DoesNotExist:
+            doctor = getattr(self.request, 'doctor', None)
+            if doctor is None:
                 return Appointment.objects.none()
+            return Appointment.objects.filter(doctor=doctor)
         
         return Appointment.objects.none()
 
+    def perform_update(self, serializer):
+        # Перенос на занятое время нарушает ограничение appt_unique_scheduled_doctor_slot
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise serializers.ValidationError({'error': 'У врача уже есть запись в это время'})
+
 
 class AvailableSlotsView(APIView):
     """
-    Получить доступные временные слоты для врача на конкретную дату
+    Получить доступные временные слоты для врача на конкретную дату.
+    Занятость берется из индекса слотов (patients.slots), без выборки записей.
     """
     permission_classes = [IsAuthenticated]
     
@@ -583,22 +655,21 @@ class AvailableSlotsView(APIView):
         doctor_id = request.query_params.get('doctor_id')
         date_str = request.query_params.get('date')
         
-        print(f"\n{'='*60}")
-        print(f"AvailableSlotsView вызван")
-        print(f"doctor_id: {doctor_id}")
-        print(f"date: {date_str}")
-        print(f"{'='*60}\n")
-        
         if not doctor_id or not date_str:
             return Response({
                 'success': False,
                 'message': 'Не указаны обязательные параметры: doctor_id и date'
             }, status=400)
-        
+
         try:
-            doctor = Doctor.objects.get(id=doctor_id)
-            print(f"✓ Врач найден: {doctor.first_name} {doctor.last_name}")
-        except Doctor.DoesNotExist:
+            doctor_id = int(doctor_id)
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': 'Неверный doctor_id'
+            }, status=400)
+
+        if not Doctor.objects.filter(id=doctor_id).exists():
             return Response({
                 'success': False,
                 'message': 'Врач не найден'
@@ -612,108 +683,26 @@ class AvailableSlotsView(APIView):
                 'message': 'Неверный формат даты'
             }, status=400)
         
-        print(f"✓ Дата распознана: {target_date} (день недели: {target_date.weekday()})")
-        
         # Проверяем выходной
-        if target_date.weekday() in [5, 6]:
-            print(f"⚠ Выходной день")
+        if target_date.weekday() in slots.WEEKEND_DAYS:
             return Response({
                 'success': True, 
                 'slots': [],
                 'message': 'Выходной день'
             })
         
-        # Получаем текущий часовой пояс
         current_tz = timezone.get_current_timezone()
         now = timezone.now()
         
-        print(f"✓ Текущее время (UTC): {now}")
-        print(f"✓ Текущее время (локальное): {now.astimezone(current_tz)}")
-        print(f"✓ Часовой пояс: {current_tz}")
-        
-        # Генерируем слоты
-        slots = []
-        start_hour = 9
-        end_hour = 18
-        lunch_start = 13
-        lunch_end = 14
-        
-        print(f"\n--- Генерация слотов ---")
-        
-        for hour in range(start_hour, end_hour):
-            for minute in [0, 30]:
-                # Пропускаем обед
-                if hour >= lunch_start and hour < lunch_end:
-                    continue
-                
-                # Создаем локальное время для слота
-                slot_time = time(hour, minute)
-                slot_datetime = timezone.make_aware(
-                    datetime.combine(target_date, slot_time),
-                    current_tz
-                )
-                
-                # Проверяем что слот не в прошлом
-                is_past = slot_datetime <= now
-                
-                if not is_past:
-                    slots.append({
-                        'time': f"{hour:02d}:{minute:02d}",
-                        'datetime': slot_datetime.isoformat(),
-                        'is_past': False
-                    })
-                    print(f"  ✓ Слот {hour:02d}:{minute:02d} добавлен (datetime={slot_datetime.isoformat()})")
-                else:
-                    print(f"  ✗ Слот {hour:02d}:{minute:02d} пропущен (в прошлом)")
-        
-        print(f"\nВсего сгенерировано слотов (не в прошлом): {len(slots)}")
-        
-        # Получаем занятые слоты
-        print(f"\n--- Проверка занятых слотов ---")
-        booked = Appointment.objects.filter(
-            doctor=doctor,
-            date_time__date=target_date,
-            status='scheduled'
-        )
-        
-        print(f"Найдено записей на эту дату: {booked.count()}")
-        
-        booked_times = set()
-        for apt in booked:
-            # Время в БД (UTC)
-            utc_time = apt.date_time
-            # Конвертируем в локальное время
-            local_time = utc_time.astimezone(current_tz)
-            time_str = f"{local_time.hour:02d}:{local_time.minute:02d}"
-            booked_times.add(time_str)
-            
-            print(f"  Запись ID={apt.id}:")
-            print(f"    - UTC: {utc_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-            print(f"    - Локальное: {local_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-            print(f"    - Время: {time_str}")
-            print(f"    - Пациент: {apt.patient.first_name} {apt.patient.last_name}")
-        
-        print(f"\nЗанятые времена: {sorted(booked_times)}")
-        
-        # Помечаем занятые слоты
-        available_count = 0
-        for slot in slots:
-            slot['available'] = slot['time'] not in booked_times
-            if slot['available']:
-                available_count += 1
-        
-        print(f"\n--- Итого ---")
-        print(f"Всего слотов: {len(slots)}")
-        print(f"Доступных: {available_count}")
-        print(f"Занятых: {len(booked_times)}")
-        print(f"{'='*60}\n")
+        mask = slots.get_mask(doctor_id, target_date)
+        day_slots, available_count = slots.day_slots(target_date, mask, now=now)
         
         return Response({
             'success': True,
-            'slots': slots,
-            'total_slots': len(slots),
+            'slots': day_slots,
+            'total_slots': len(day_slots),
             'available_count': available_count,
-            'booked_count': len(booked_times),
+            'booked_count': bin(mask).count('1'),
             'debug': {
                 'date': target_date.isoformat(),
                 'timezone': str(current_tz),
@@ -723,6 +712,76 @@ class AvailableSlotsView(APIView):
         })
 
         
+class AvailableSlotsRangeView(APIView):
+    """
+    Свободные слоты сразу для нескольких врачей на диапазон дат.
+    Параметры: start, end (включительно, YYYY-MM-DD) и doctor_ids=1,2,3 или specialty.
+    counts_only=1 — вернуть только количество свободных слотов по дням.
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 62
+
+    def get(self, request):
+        doctor_ids_str = request.query_params.get('doctor_ids')
+        specialty = request.query_params.get('specialty')
+        counts_only = request.query_params.get('counts_only') in ('1', 'true')
+
+        try:
+            # parse_date бросает ValueError на несуществующей дате (2024-02-30)
+            start = parse_date(request.query_params.get('start', ''))
+            end = parse_date(request.query_params.get('end', ''))
+        except ValueError:
+            start = end = None
+        if not start or not end:
+            return Response({'success': False, 'message': 'Укажите start и end в формате YYYY-MM-DD'}, status=400)
+        if end < start:
+            return Response({'success': False, 'message': 'end не может быть раньше start'}, status=400)
+        if (end - start).days + 1 > self.MAX_DAYS:
+            return Response({'success': False, 'message': f'Диапазон не может превышать {self.MAX_DAYS} дней'}, status=400)
+        if not doctor_ids_str and not specialty:
+            return Response({'success': False, 'message': 'Укажите doctor_ids или specialty'}, status=400)
+
+        doctors = Doctor.objects.all()
+        if doctor_ids_str:
+            try:
+                doctor_ids = [int(x) for x in doctor_ids_str.split(',') if x.strip()]
+            except ValueError:
+                return Response({'success': False, 'message': 'Неверный список doctor_ids'}, status=400)
+            doctors = doctors.filter(id__in=doctor_ids)
+        if specialty:
+            doctors = doctors.filter(specialty__iexact=specialty)
+        doctors = list(doctors.order_by('last_name', 'first_name').values('id', 'first_name', 'last_name', 'specialty'))
+
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        working_days = [d for d in days if d.weekday() not in slots.WEEKEND_DAYS]
+        masks = slots.get_masks([d['id'] for d in doctors], working_days)
+        now = timezone.now()
+
+        result = []
+        for doctor in doctors:
+            doctor_days = []
+            for day in days:
+                day_slots, free_count = slots.day_slots(day, masks.get((doctor['id'], day), 0), now=now)
+                day_data = {'date': day.isoformat(), 'free_count': free_count}
+                if not counts_only:
+                    day_data['slots'] = [slot for slot in day_slots if slot['available']]
+                doctor_days.append(day_data)
+            result.append({
+                'id': doctor['id'],
+                'name': f"{doctor['last_name']} {doctor['first_name']}",
+                'specialization': doctor['specialty'],
+                'free_total': sum(d['free_count'] for d in doctor_days),
+                'days': doctor_days,
+            })
+
+        return Response({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'doctors': result,
+        })
+
+
 class AppointmentDeleteView(APIView):
     """
     Удаление записи (только для администраторов)
@@ -754,15 +813,12 @@ class DoctorAppointmentsView(generics.ListAPIView):
         doctor_id = self.kwargs.get('doctor_id')
         date = self.request.query_params.get('date')
         
-        queryset = Appointment.objects.filter(
-            doctor_id=doctor_id,
-            status='scheduled'
-        )
+        queryset = Appointment.objects.scheduled().filter(doctor_id=doctor_id)
         
         if date:
             try:
                 date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-                queryset = queryset.filter(date_time__date=date_obj)
+                queryset = queryset.for_local_day(date_obj)
             except ValueError:
                 pass
         
@@ -775,10 +831,9 @@ class DoctorAppointmentsByDateView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        try:
-            # Получаем врача текущего пользователя
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        # Врач текущего пользователя (определяется при аутентификации)
+        doctor = request.doctor
+        if doctor is None:
             return Response({"error": "Вы не являетесь врачом"}, status=403)
         
         # Получаем дату из параметров запроса
@@ -791,9 +846,8 @@ class DoctorAppointmentsByDateView(APIView):
                 return Response({"error": "Неверный формат даты"}, status=400)
             
             appointments = Appointment.objects.filter(
-                doctor=doctor,
-                date_time__date=target_date
-            ).order_by('date_time')
+                doctor=doctor
+            ).for_local_day(target_date).order_by('date_time')
         else:
             # Возвращаем все записи врача
             appointments = Appointment.objects.filter(
@@ -826,7 +880,9 @@ class MedicineListView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        medicines = Medicine.objects.all()
+        medicines = Medicine.objects.order_by('name', 'id')
+        paginator = KeysetPagination(ordering=('name', 'id'))
+        page = paginator.paginate_queryset(medicines, request)
         data = [
             {
                 'id': m.id,
@@ -834,8 +890,10 @@ class MedicineListView(APIView):
                 'description': m.description,
                 'prescription_required': m.prescription_required
             }
-            for m in medicines
+            for m in (medicines if page is None else page)
         ]
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response(data)
     
 
@@ -844,86 +902,94 @@ class MedicineListView(APIView):
 class CompleteAppointmentView(APIView):
     """
     Завершение приема, создание мед. записи и отправка уведомлений.
+    Все записывается одной транзакцией под блокировкой строки приема,
+    поэтому повторная отправка формы не создаст вторую мед. запись.
     """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, appointment_id):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Только врачи могут завершать прием'}, status=403)
         
-        try:
-            appointment = Appointment.objects.get(id=appointment_id, doctor=doctor)
-        except Appointment.DoesNotExist:
-            return Response({'error': 'Запись не найдена'}, status=404)
-        
-        if appointment.status == 'completed':
-            return Response({'error': 'Прием уже завершен'}, status=400)
-        
         # --- 1. Получаем данные из запроса ---
         diagnosis = request.data.get('diagnosis')
         complaints = request.data.get('complaints', '')
         anamnesis = request.data.get('anamnesis', '')
         objective_data = request.data.get('objective_data', '')
         recommendations = request.data.get('recommendations', '')
-        prescriptions_data = request.data.get('prescriptions', [])
+        prescriptions_data = [p for p in request.data.get('prescriptions', []) if p.get('medicine_id')]
         doctor_notes = request.data.get('doctor_notes', '')
-        
-        if not diagnosis:
-            return Response({'error': 'Диагноз обязателен'}, status=400)
-        
-        # --- 2. Создаем медицинскую запись и рецепты ---
-        medical_record = MedicalRecord.objects.create(
-            appointment=appointment,
-            complaints=complaints,
-            anamnesis=anamnesis,
-            objective_data=objective_data,
-            diagnosis=diagnosis,
-            recommendations=recommendations
-        )
-        
-        for presc in prescriptions_data:
-            if presc.get('medicine_id'):
-                # Валидация, что такой препарат существует
-                if Medicine.objects.filter(id=presc.get('medicine_id')).exists():
-                    Prescription.objects.create(
-                        medical_record=medical_record,
-                        medicine_id=presc.get('medicine_id'),
-                        dosage=presc.get('dosage', ''),
-                        frequency=presc.get('frequency', ''),
-                        duration=presc.get('duration', ''),
-                        instructions=presc.get('instructions', '')
-                    )
-        
-        if doctor_notes:
-            DoctorNote.objects.create(
-                medical_record=medical_record,
-                doctor=doctor,
-                note=doctor_notes
-            )
-        
-        # --- 3. Обновляем статус приема ---
-        appointment.status = 'completed'
-        appointment.diagnosis = diagnosis
-        appointment.save()
-        
-        # --- 4. Отправляем уведомления ---
-        try:
-            # Email с полным отчетом
-            send_reception_summary_email(appointment, medical_record)
+        # Заметка одна (строка) или несколько (список строк)
+        notes = [n for n in (doctor_notes if isinstance(doctor_notes, list) else [doctor_notes]) if n]
 
-            # SMS с кратким итогом
+        # Все препараты проверяем одним запросом
+        try:
+            medicine_ids = {int(p['medicine_id']) for p in prescriptions_data}
+        except (TypeError, ValueError):
+            return Response({'error': 'Некорректный medicine_id в назначениях'}, status=400)
+        medicines = Medicine.objects.in_bulk(medicine_ids)
+        unknown = sorted(medicine_ids - medicines.keys())
+        if unknown:
+            return Response({'error': 'Препараты не найдены', 'medicine_ids': unknown}, status=400)
+
+        with transaction.atomic():
+            # Повторный запрос ждет здесь и затем видит статус completed
+            try:
+                appointment = Appointment.objects.select_for_update(of=('self',)).select_related(
+                    'patient__user'
+                ).get(id=appointment_id, doctor=doctor)
+            except Appointment.DoesNotExist:
+                return Response({'error': 'Запись не найдена'}, status=404)
+            
+            if appointment.status == 'completed':
+                return Response({'error': 'Прием уже завершен'}, status=400)
+            
+            if not diagnosis:
+                return Response({'error': 'Диагноз обязателен'}, status=400)
+            
+            # --- 2. Создаем медицинскую запись, рецепты и заметки ---
+            medical_record = MedicalRecord.objects.create(
+                appointment=appointment,
+                complaints=complaints,
+                anamnesis=anamnesis,
+                objective_data=objective_data,
+                diagnosis=diagnosis,
+                recommendations=recommendations
+            )
+            # bulk_create не вызывает сигналы: снимок карты и журнал изменений
+            # уже обновлены сигналами MedicalRecord и Appointment этой же транзакции
+            Prescription.objects.bulk_create([
+                Prescription(
+                    medical_record=medical_record,
+                    medicine=medicines[int(presc['medicine_id'])],
+                    dosage=presc.get('dosage', ''),
+                    frequency=presc.get('frequency', ''),
+                    duration=presc.get('duration', ''),
+                    instructions=presc.get('instructions', '')
+                )
+                for presc in prescriptions_data
+            ])
+            DoctorNote.objects.bulk_create([
+                DoctorNote(medical_record=medical_record, doctor=doctor, note=note)
+                for note in notes
+            ])
+            
+            # --- 3. Обновляем статус приема и ставим уведомления в очередь ---
+            appointment.status = 'completed'
+            appointment.diagnosis = diagnosis
+            # Дневную статистику врача пересчитает сигнал после коммита
+            appointment.save(update_fields=['status', 'diagnosis', 'updated_at'])
+
+            # Email с полным отчетом и SMS с кратким итогом отправит process_outbox
+            outbox.enqueue('reception_summary', appointment=appointment)
             patient_phone = appointment.patient.user.phone # Берем телефон из User
             if patient_phone:
-                sms_message = f"Прием у Dr. {appointment.doctor.last_name} ({appointment.date_time.strftime('%d.%m')}) завершен. Диагноз: {diagnosis}. Детали на почте."
-                send_sms(patient_phone, sms_message)
+                local_date = timezone.localtime(appointment.date_time).strftime('%d.%m')
+                sms_message = f"Прием у Dr. {doctor.last_name} ({local_date}) завершен. Диагноз: {diagnosis}. Детали на почте."
+                outbox.enqueue('sms', appointment=appointment, phone=patient_phone, message=sms_message)
 
-        except Exception as e:
-            # Логируем ошибку, но не прерываем основной процесс
-            print(f"ОШИБКА при отправке уведомлений для записи #{appointment.id}: {e}")
-
-        # --- 5. Возвращаем ответ ---
+        # --- 4. Возвращаем ответ ---
         return Response({
             'success': True,
             'message': 'Прием завершен',
@@ -932,116 +998,95 @@ class CompleteAppointmentView(APIView):
 # 2. История приемов пациента (медицинская карта)
 class PatientMedicalHistoryView(APIView):
     """
-    Получение полной истории приемов пациента
+    Получение полной истории приемов пациента.
+    Полный ответ содержит курсор в заголовке X-Sync-Cursor; с ?since=<курсор>
+    возвращаются только изменившиеся приемы: {cursor, patient, changed, removed}.
     """
     permission_classes = [IsAuthenticated]
     
     def get(self, request, patient_id):
         # Проверяем права доступа (врач или сам пациент)
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-            is_doctor = True
-        except Doctor.DoesNotExist:
-            is_doctor = False
+        is_doctor = request.doctor is not None
         
         if not is_doctor:
             # Если не врач, проверяем что это сам пациент
-            try:
-                patient = Patient.objects.get(user=request.user)
-                if patient.id != int(patient_id):
-                    return Response({'error': 'Доступ запрещен'}, status=403)
-            except Patient.DoesNotExist:
+            patient = request.patient
+            if patient is None or patient.id != int(patient_id):
                 return Response({'error': 'Доступ запрещен'}, status=403)
-        
+
         try:
-            patient = Patient.objects.get(id=patient_id)
-        except Patient.DoesNotExist:
-            return Response({'error': 'Пациент не найден'}, status=404)
+            since = _parse_since(request)
+        except ValueError:
+            return Response({'error': 'Некорректный параметр since'}, status=400)
+        if since is not None:
+            try:
+                patient = Patient.objects.select_related('user').get(id=patient_id)
+            except Patient.DoesNotExist:
+                return Response({'error': 'Пациент не найден'}, status=404)
+            response = _delta_response(
+                since, history.history_queryset(patient),
+                lambda apt: history.history_entry(apt, is_doctor), patient_id=patient.id
+            )
+            response.data['patient'] = history.patient_data(patient)
+            return response
+
+        # Курсор снимается до чтения, чтобы изменения во время чтения пришли в следующий раз
+        cursor = changelog.current_cursor()
         
-        # Получаем все завершенные приемы
-        appointments = Appointment.objects.filter(
-            patient=patient,
-            status='completed'
-        ).select_related('doctor', 'medical_record').prefetch_related(
-            'medical_record__prescriptions__medicine',
-            'medical_record__doctor_notes',
-            'medical_record__files'
-        ).order_by('-date_time')
-        
-        history = []
-        for apt in appointments:
-            record_data = {
-                'appointment_id': apt.id,
-                'date': apt.date_time.isoformat(),
-                'doctor': f"{apt.doctor.last_name} {apt.doctor.first_name}",
-                'doctor_specialization': apt.doctor.specialty,
-                'diagnosis': apt.diagnosis,
-            }
-            
-            if hasattr(apt, 'medical_record'):
-                mr = apt.medical_record
-                record_data.update({
-                    'medical_record_id': mr.id,
-                    'complaints': mr.complaints,
-                    'anamnesis': mr.anamnesis,
-                    'objective_data': mr.objective_data,
-                    'recommendations': mr.recommendations,
-                    'prescriptions': [
-                        {
-                            'id': p.id,
-                            'medicine': p.medicine.name,
-                            'medicine_id': p.medicine.id,
-                            'dosage': p.dosage,
-                            'frequency': p.frequency,
-                            'duration': p.duration,
-                            'instructions': p.instructions
-                        }
-                        for p in mr.prescriptions.all()
-                    ],
-                    'files': [
-                        {
-                            'id': f.id,
-                            'title': f.title,
-                            'file_type': f.get_file_type_display(),
-                            'uploaded_at': f.uploaded_at.isoformat(),
-                            'url': f.file.url if f.file else None
-                        }
-                        for f in mr.files.all()
-                    ]
-                })
-                
-                # Приватные заметки видны только врачу
-                if is_doctor:
-                    record_data['doctor_notes'] = [
-                        {
-                            'note': note.note,
-                            'created_at': note.created_at.isoformat()
-                        }
-                        for note in mr.doctor_notes.all()
-                    ]
-            
-            history.append(record_data)
+        # Большие карты можно получать по частям: ?stream=1
+        if request.query_params.get('stream') in ('1', 'true'):
+            try:
+                patient = Patient.objects.select_related('user').get(id=patient_id)
+            except Patient.DoesNotExist:
+                return Response({'error': 'Пациент не найден'}, status=404)
+            response = StreamingHttpResponse(
+                history.stream(patient, is_doctor),
+                content_type='application/json'
+            )
+            response[changelog.CURSOR_HEADER] = cursor
+            return response
         
-        return Response({
-            'patient': {
-                'id': patient.id,
-                'name': f"{patient.first_name} {patient.last_name}",
-                'first_name': patient.first_name,
-                'last_name': patient.last_name,
-                'birth_date': patient.birth_date,
-                'gender': patient.get_gender_display(),
-                'height': patient.height,
-                'weight': patient.weight,
-                'iin': patient.iin,
-                'phone': patient.user.phone,
-                'chronic_diseases': patient.chronic_diseases,
-                'allergies': patient.allergies,
-                'blood_type': patient.blood_type,
-                'insurance_number': patient.insurance_number,
-                'emergency_contact': patient.emergency_contact,
-            },
-            'history': history
-        })
+        # Готовый снимок карты (собирается заново, только если устарел)
+        chart_json = charts.get_json(int(patient_id), is_doctor)
+        if chart_json is None:
+            return Response({'error': 'Пациент не найден'}, status=404)
+        response = HttpResponse(chart_json, content_type='application/json')
+        response[changelog.CURSOR_HEADER] = cursor
+        return response
+
+
+class PatientMedicalHistoryPdfView(APIView):
+    """
+    Медицинская карта пациента в PDF (см. chart_pdf).
+    Документ отдается по страницам; готовый PDF берется из кэша, пока карта не менялась.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, patient_id):
+        # Те же права, что у PatientMedicalHistoryView
+        is_doctor = request.doctor is not None
+        if not is_doctor:
+            patient = request.patient
+            if patient is None or patient.id != int(patient_id):
+                return Response({'error': 'Доступ запрещен'}, status=403)
+
+        chart = charts.get(int(patient_id), is_doctor)
+        if chart is None:
+            return Response({'error': 'Пациент не найден'}, status=404)
+        chart_json, version, built_at = chart
+
+        pdf = chart_pdf.get_cached(patient_id, is_doctor, version, built_at)
+        if pdf is not None:
+            response = HttpResponse(pdf, content_type='application/pdf')
+        else:
+            response = StreamingHttpResponse(
+                chart_pdf.stream(patient_id, is_doctor, chart_json, version, built_at),
+                content_type='application/pdf'
+            )
+        response['Content-Disposition'] = f'attachment; filename="{chart_pdf.filename(patient_id)}"'
+        if built_at is not None:
+            response['Last-Modified'] = http_date(built_at.timestamp())
+        return response
 
 
 # 3. Шаблоны диагнозов
@@ -1051,13 +1096,19 @@ class DiagnosisTemplateListView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @response_cache.cache_response(
+        'diagnosis_template_list',
+        tags=lambda request: [f'diagnosis_template:{request.doctor.id if request.doctor else None}'],
+        vary_on_user=True,
+    )
     def get(self, request):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Только врачи имеют доступ'}, status=403)
         
         templates = DiagnosisTemplate.objects.filter(doctor=doctor)
+        paginator = KeysetPagination(ordering=('-usage_count', 'name', 'id'))
+        page = paginator.paginate_queryset(templates, request)
         
         data = [
             {
@@ -1067,16 +1118,17 @@ class DiagnosisTemplateListView(APIView):
                 'recommendations': t.recommendations,
                 'usage_count': t.usage_count
             }
-            for t in templates
+            for t in (templates if page is None else page)
         ]
         
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response(data)
     
     def post(self, request):
         """Создание нового шаблона"""
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Только врачи могут создавать шаблоны'}, status=403)
         
         name = request.data.get('name')
@@ -1111,9 +1163,8 @@ class UseTemplateView(APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, template_id):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Только врачи имеют доступ'}, status=403)
         
         try:
@@ -1128,7 +1179,8 @@ class UseTemplateView(APIView):
 # 4. Загрузка файлов пациента
 class PatientFileUploadView(APIView):
     """
-    Загрузка файлов для пациента (анализы, снимки)
+    Загрузка файлов для пациента (анализы, снимки).
+    Большие файлы (МРТ, КТ) загружаются по частям: PatientFileUploadStartView.
     """
     permission_classes = [IsAuthenticated]
     
@@ -1160,12 +1212,13 @@ class PatientFileUploadView(APIView):
         if file.content_type not in ALLOWED_CONTENT_TYPES:
             return Response({'error': 'Недопустимый формат файла. Разрешены: pdf, doc, docx, jpg, jpeg, png'}, status=400)
 
-        # ВАЖНО: всегда создаём НОВЫЙ файл (не обновляем существующий)
-        pf = PatientFile.objects.create(
+        # ВАЖНО: всегда создаём НОВЫЙ PatientFile (не обновляем существующий);
+        # одинаковое содержимое хранится на диске один раз (blobs.py)
+        pf = blobs.create_patient_file(
+            file,
             patient=patient,
             medical_record_id=medical_record_id if medical_record_id else None,
             file_type=file_type,
-            file=file,
             title=title,
             description=description,
             uploaded_by=request.user
@@ -1179,11 +1232,157 @@ class PatientFileUploadView(APIView):
                 'title': pf.title,
                 'file_type': pf.get_file_type_display(),
                 'uploaded_at': pf.uploaded_at.isoformat(),
-                'url': request.build_absolute_uri(pf.file.url) if pf.file else None
+                'url': request.build_absolute_uri(downloads.url(pf)),
+                'download_url': request.build_absolute_uri(downloads.url(pf, as_attachment=True)),
+            }
+        })
+
+def _upload_error(e):
+    return Response({'error': str(e), **e.extra}, status=e.status)
+
+
+def _upload_state(upload):
+    return {
+        'upload_id': str(upload.id),
+        'filename': upload.filename,
+        'offset': upload.received,
+        'size': upload.size,
+        'chunk_size': uploads.CHUNK_SIZE,
+    }
+
+
+class PatientFileUploadStartView(APIView):
+    """
+    Начало загрузки файла по частям (см. uploads.py).
+    Тело: filename, size, file_type, title, description, medical_record_id.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, patient_id):
+        try:
+            patient = Patient.objects.get(id=patient_id)
+        except Patient.DoesNotExist:
+            return Response({'error': 'Пациент не найден'}, status=404)
+
+        # Как и скачивать: врачи и сам пациент
+        if request.doctor is None:
+            if request.patient is None or request.patient.id != patient.id:
+                return Response({'error': 'Доступ запрещен'}, status=403)
+
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'Не указан размер файла'}, status=400)
+
+        try:
+            upload = uploads.start(
+                patient, request.user,
+                filename=request.data.get('filename'),
+                size=size,
+                file_type=request.data.get('file_type', 'other'),
+                title=request.data.get('title', 'Документ'),
+                description=request.data.get('description', ''),
+                medical_record_id=request.data.get('medical_record_id'),
+            )
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        return Response(_upload_state(upload), status=201)
+
+
+class FileUploadChunkView(APIView):
+    """
+    GET - сколько байт уже получено (для докачки после обрыва).
+    PUT ?offset=N - тело запроса (application/octet-stream) дописывается с позиции N.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        upload = FileUpload.objects.filter(id=upload_id, uploaded_by=request.user).first()
+        if upload is None:
+            return Response({'error': 'Загрузка не найдена'}, status=404)
+        return Response(_upload_state(upload))
+
+    def put(self, request, upload_id):
+        try:
+            offset = int(request.query_params.get('offset', request.headers.get('Upload-Offset')))
+        except (TypeError, ValueError):
+            return Response({'error': 'Не указано смещение offset'}, status=400)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH'))
+        except (TypeError, ValueError):
+            return Response({'error': 'Не указана длина части'}, status=411)
+
+        try:
+            upload = uploads.append(upload_id, request.user, offset, request.stream, length)
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        return Response(_upload_state(upload))
+
+
+class FileUploadCompleteView(APIView):
+    """
+    Завершение загрузки: проверка формата и SHA-256 (если клиент передал sha256),
+    создание файла пациента.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        try:
+            pf, sha256 = uploads.complete(upload_id, request.user, request.data.get('sha256'))
+        except uploads.UploadError as e:
+            return _upload_error(e)
+
+        return Response({
+            'success': True,
+            'message': 'Файл успешно загружен',
+            'file': {
+                'id': pf.id,
+                'title': pf.title,
+                'file_type': pf.get_file_type_display(),
+                'uploaded_at': pf.uploaded_at.isoformat(),
+                'url': request.build_absolute_uri(downloads.url(pf)),
+                'download_url': request.build_absolute_uri(downloads.url(pf, as_attachment=True)),
+                'sha256': sha256,
             }
         })
 
+
+class PatientFileDownloadView(APIView):
+    """
+    Скачивание файла пациента: только врачам и самому пациенту.
+    Поддерживает Range и условные запросы (см. downloads.py); ?download=1 - как вложение,
+    ?variant=thumbnail|preview - уменьшенная копия снимка.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, file_id):
+        try:
+            pf = PatientFile.objects.get(id=file_id)
+        except PatientFile.DoesNotExist:
+            return Response({'error': 'Файл не найден'}, status=404)
+
+        if request.doctor is None:
+            patient = request.patient
+            if patient is None or patient.id != pf.patient_id:
+                return Response({'error': 'Доступ запрещен'}, status=403)
+        variant = request.query_params.get('variant') or None
+        if variant is not None and variant not in downloads.VARIANTS:
+            return Response({'error': 'variant: thumbnail или preview'}, status=400)
+
+        try:
+            return downloads.serve(
+                request, pf, variant=variant,
+                as_attachment=request.query_params.get('download') in ('1', 'true'),
+            )
+        except FileNotFoundError:
+            return Response({'error': 'Файл не найден'}, status=404)
+
+
 # 5. Статистика для врача
+# Максимальный период статистики, дней (10 лет)
+MAX_STATISTICS_DAYS = 3650
+
+
 class DoctorStatisticsView(APIView):
     """
     Статистика врача (количество приемов, популярные диагнозы)
@@ -1191,66 +1390,50 @@ class DoctorStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Только врачи имеют доступ'}, status=403)
         
         # Период (по умолчанию - последние 30 дней)
-        days = int(request.query_params.get('days', 30))
-        start_date = timezone.now() - timedelta(days=days)
-        
-        # Общее количество приемов
-        total_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            status='completed',
-            date_time__gte=start_date
-        ).count()
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days должен быть числом'}, status=400)
+        if not 1 <= days <= MAX_STATISTICS_DAYS:
+            return Response({'error': f'days должен быть от 1 до {MAX_STATISTICS_DAYS}'}, status=400)
+        today = timezone.localdate()
+        start_day = today - timedelta(days=days)
+        week_start = today - timedelta(days=6)
+        
+        # Завершенные приемы берутся из дневной сводки: одна строка на день
+        rows = list(DoctorDailyStats.objects.filter(
+            doctor=doctor, day__gte=min(start_day, week_start), day__lte=today
+        ))
+        total_appointments, unique_patients, diagnoses = stats.summary(r for r in rows if r.day >= start_day)
         
         # Запланированные приемы
-        scheduled_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            status='scheduled'
-        ).count()
+        scheduled_appointments = Appointment.objects.scheduled().filter(doctor=doctor).count()
         
         # Популярные диагнозы
-        popular_diagnoses = Appointment.objects.filter(
-            doctor=doctor,
-            status='completed',
-            date_time__gte=start_date,
-            diagnosis__isnull=False
-        ).exclude(diagnosis='').values('diagnosis').annotate(
-            count=Count('id')
-        ).order_by('-count')[:10]
-        
-        # Уникальные пациенты
-        unique_patients = Appointment.objects.filter(
-            doctor=doctor,
-            status='completed',
-            date_time__gte=start_date
-        ).values('patient').distinct().count()
+        popular_diagnoses = [
+            {'diagnosis': diagnosis, 'count': count}
+            for diagnosis, count in diagnoses.most_common(10)
+        ]
         
         # Приемы по дням (последние 7 дней)
-        appointments_by_day = []
-        for i in range(7):
-            day = timezone.now().date() - timedelta(days=i)
-            count = Appointment.objects.filter(
-                doctor=doctor,
-                status='completed',
-                date_time__date=day
-            ).count()
-            appointments_by_day.append({
-                'date': day.isoformat(),
-                'count': count
-            })
+        by_day = {r.day: r.completed_count for r in rows}
+        appointments_by_day = [
+            {'date': day.isoformat(), 'count': by_day.get(day, 0)}
+            for day in (week_start + timedelta(days=i) for i in range(7))
+        ]
         
         return Response({
             'period_days': days,
             'total_completed': total_appointments,
             'scheduled': scheduled_appointments,
             'unique_patients': unique_patients,
-            'popular_diagnoses': list(popular_diagnoses),
-            'appointments_by_day': list(reversed(appointments_by_day))
+            'popular_diagnoses': popular_diagnoses,
+            'appointments_by_day': appointments_by_day
         })
 
 
@@ -1261,13 +1444,27 @@ class MedicineListView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
+    @response_cache.cache_response(
+        'medicine_list',
+        tags=lambda request: ['medicine', f"patient:{request.query_params.get('patient_id')}"],
+    )
     def get(self, request):
         patient_id = request.query_params.get('patient_id')
         
-        medicines = Medicine.objects.all()
+        # Аллергии пациента разбираются один раз на весь каталог
+        allergy_matcher = None
+        if patient_id:
+            try:
+                allergy_matcher = allergies.get_matcher(int(patient_id))
+            except ValueError:
+                return Response({'error': 'Некорректный patient_id'}, status=400)
+        
+        medicines = Medicine.objects.order_by('name', 'id')
+        paginator = KeysetPagination(ordering=('name', 'id'))
+        page = paginator.paginate_queryset(medicines, request)
         data = []
         
-        for m in medicines:
+        for m in medicines if page is None else page:
             medicine_data = {
                 'id': m.id,
                 'name': m.name,
@@ -1278,29 +1475,26 @@ class MedicineListView(APIView):
             }
             
             # Проверка на аллергии пациента
-            if patient_id:
-                try:
-                    patient = Patient.objects.get(id=patient_id)
-                    if patient.allergies:
-                        # Простая проверка - если название лекарства содержится в аллергиях
-                        if m.name.lower() in patient.allergies.lower():
-                            medicine_data['warning'] = f'⚠️ ВНИМАНИЕ! У пациента аллергия!'
-                            medicine_data['has_allergy'] = True
-                except Patient.DoesNotExist:
-                    pass
+            if allergy_matcher and allergy_matcher.matches(m.name):
+                medicine_data['warning'] = f'⚠️ ВНИМАНИЕ! У пациента аллергия!'
+                medicine_data['has_allergy'] = True
             
             data.append(medicine_data)
         
+        if page is not None:
+            return paginator.get_paginated_response(data)
         return Response(data)
 
 # 1. СИНХРОНИЗАЦИЯ АКТИВНЫХ ПРЕПАРАТОВ
+ACTIVE_MEDICINE_FIELDS = ['dosage', 'frequency', 'duration', 'instructions']
+
+
 class PatientActiveMedicinesSyncView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'error': 'Доступ только для врача'}, status=status.HTTP_403_FORBIDDEN)
 
         patient_id = request.data.get('patient_id')
@@ -1315,32 +1509,68 @@ class PatientActiveMedicinesSyncView(APIView):
         except Patient.DoesNotExist:
             return Response({'error': 'Пациент не найден'}, status=status.HTTP_404_NOT_FOUND)
 
-        PatientActiveMedicine.objects.filter(patient=patient, doctor=doctor).delete()
-
+        # Желаемый набор: medicine_id -> поля назначения (повтор препарата - действует последний)
+        desired = {}
         if bool(active):
-            bulk = []
             for m in meds:
                 mid = m.get('medicine_id')
-                if not mid: continue
-                if not Medicine.objects.filter(id=mid).exists(): continue
-                bulk.append(PatientActiveMedicine(
-                    patient=patient, doctor=doctor, medicine_id=mid,
-                    dosage=m.get('dosage', ''), frequency=m.get('frequency', ''),
-                    duration=m.get('duration', ''), instructions=m.get('instructions', '')
-                ))
-            if bulk:
-                PatientActiveMedicine.objects.bulk_create(bulk)
-
-        return Response({'success': True})
+                if not mid:
+                    continue
+                try:
+                    mid = int(mid)
+                except (TypeError, ValueError):
+                    return Response({'error': 'Некорректный medicine_id'}, status=status.HTTP_400_BAD_REQUEST)
+                desired[mid] = {field: m.get(field) or '' for field in ACTIVE_MEDICINE_FIELDS}
+
+        known = Medicine.objects.in_bulk(list(desired))
+        missing = sorted(set(desired) - set(known))
+        if missing:
+            return Response(
+                {'error': 'Препараты не найдены', 'medicine_ids': missing},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic():
+            current = {
+                am.medicine_id: am
+                for am in PatientActiveMedicine.objects.select_for_update().filter(patient=patient, doctor=doctor)
+            }
+
+            to_create, to_update = [], []
+            for mid, values in desired.items():
+                am = current.get(mid)
+                if am is None:
+                    to_create.append(PatientActiveMedicine(patient=patient, doctor=doctor, medicine_id=mid, **values))
+                elif any(getattr(am, field) != value for field, value in values.items()):
+                    for field, value in values.items():
+                        setattr(am, field, value)
+                    # bulk_update не вызывает auto_now
+                    am.updated_at = timezone.now()
+                    to_update.append(am)
+            to_delete = [am.id for mid, am in current.items() if mid not in desired]
+
+            if to_delete:
+                PatientActiveMedicine.objects.filter(id__in=to_delete).delete()
+            if to_update:
+                PatientActiveMedicine.objects.bulk_update(to_update, ACTIVE_MEDICINE_FIELDS + ['updated_at'])
+            if to_create:
+                PatientActiveMedicine.objects.bulk_create(to_create)
+
+        return Response({
+            'success': True,
+            'created': len(to_create),
+            'updated': len(to_update),
+            'deleted': len(to_delete),
+            'unchanged': len(desired) - len(to_create) - len(to_update),
+        })
 
 # 2. ПОЛУЧЕНИЕ СПИСКА АКТИВНЫХ ПРЕПАРАТОВ ДЛЯ ПАЦИЕНТА
 class PatientActiveMedicinesListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        try:
-            patient = Patient.objects.get(user=request.user)
-        except Patient.DoesNotExist:
+        patient = request.patient
+        if patient is None:
             return Response({'error': 'Вы не являетесь пациентом'}, status=status.HTTP_403_FORBIDDEN)
         
         active_medicines = PatientActiveMedicine.objects.filter(
@@ -1367,13 +1597,42 @@ class PatientActiveMedicinesListView(APIView):
         return Response(data)
 
 # 3. СОЗДАНИЕ ПОВТОРНОЙ ЗАПИСИ ВРАЧОМ
+SERIES_FREQUENCIES = {'daily': 1, 'weekly': 7}
+SERIES_MAX_COUNT = 52
+
+
+def _series_occurrences(first_dt, recurrence):
+    """
+    Даты серии по правилу {"frequency": "daily"|"weekly", "interval": 1, "count": N}.
+    Время приема одно и то же по местному времени. ValueError - некорректное правило.
+    """
+    if not isinstance(recurrence, dict):
+        raise ValueError('recurrence должен быть объектом')
+    step_days = SERIES_FREQUENCIES.get(recurrence.get('frequency', 'weekly'))
+    if step_days is None:
+        raise ValueError('frequency: daily или weekly')
+    try:
+        interval = int(recurrence.get('interval', 1))
+        count = int(recurrence.get('count'))
+    except (TypeError, ValueError):
+        raise ValueError('interval и count должны быть числами')
+    if interval < 1 or not 1 <= count <= SERIES_MAX_COUNT:
+        raise ValueError(f'interval >= 1, count от 1 до {SERIES_MAX_COUNT}')
+
+    current_tz = timezone.get_current_timezone()
+    local_dt = first_dt.astimezone(current_tz)
+    return [
+        timezone.make_aware(datetime.combine(local_dt.date() + timedelta(days=i * interval * step_days), local_dt.time()), current_tz)
+        for i in range(count)
+    ]
+
+
 class AppointmentCreateByDoctorView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        try:
-            doctor = Doctor.objects.get(user=request.user)
-        except Doctor.DoesNotExist:
+        doctor = request.doctor
+        if doctor is None:
             return Response({'success': False, 'message': 'Только врач может создавать запись'}, status=status.HTTP_403_FORBIDDEN)
 
         patient_id = request.data.get('patient_id')
@@ -1403,16 +1662,125 @@ class AppointmentCreateByDoctorView(APIView):
         if not (time(9, 0) <= local_time < time(18, 0) and not (time(13, 0) <= local_time < time(14, 0))):
             return Response({'success': False, 'message': 'Запись возможна только в рабочее время'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if Appointment.objects.filter(doctor=doctor, date_time=dt, status='scheduled').exists():
+        recurrence = request.data.get('recurrence')
+        if recurrence:
+            try:
+                occurrences = _series_occurrences(dt, recurrence)
+            except ValueError as e:
+                return Response({'success': False, 'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return self._create_series(doctor, patient, occurrences, notes)
+
+        if Appointment.objects.scheduled().filter(doctor=doctor, date_time=dt).exists():
             return Response({'success': False, 'message': 'У врача уже есть запись в это время'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if Appointment.objects.filter(patient=patient, date_time=dt, status='scheduled').exists():
+        if Appointment.objects.scheduled().filter(patient=patient, date_time=dt).exists():
             return Response({'success': False, 'message': 'У пациента уже есть запись в это время'}, status=status.HTTP_400_BAD_REQUEST)
 
-        appointment = Appointment.objects.create(
-            patient=patient, doctor=doctor, date_time=dt, notes=notes,
-            status='scheduled',
-            room_number=doctor.office_number if hasattr(doctor, 'office_number') else None
-        )
+        try:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(
+                    patient=patient, doctor=doctor, date_time=dt, notes=notes,
+                    status='scheduled',
+                    room_number=doctor.office_number if hasattr(doctor, 'office_number') else None
+                )
+        except IntegrityError:
+            return Response({'success': False, 'message': 'У врача уже есть запись в это время'}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'success': True, 'message': 'Повторная запись создана', 'appointment': {'id': appointment.id}})
+
+    def _create_series(self, doctor, patient, occurrences, notes):
+        """
+        Серия записей: занятость врача и пациента на все даты проверяется одним
+        запросом по диапазону дат, свободные даты создаются одним bulk_create.
+        """
+        conflicts = {}
+        for occurrence in occurrences:
+            if occurrence.weekday() in [5, 6]:
+                conflicts[occurrence] = 'Выходной день'
+
+        busy = Appointment.objects.scheduled().filter(
+            Q(doctor=doctor) | Q(patient=patient),
+            date_time__gte=occurrences[0],
+            date_time__lte=occurrences[-1],
+        ).values_list('date_time', 'doctor_id')
+        for busy_dt, busy_doctor_id in busy:
+            if busy_dt in occurrences and busy_dt not in conflicts:
+                conflicts[busy_dt] = (
+                    'У врача уже есть запись в это время' if busy_doctor_id == doctor.id
+                    else 'У пациента уже есть запись в это время'
+                )
+
+        conflicts_data = [
+            {'date_time': occurrence.isoformat(), 'reason': conflicts[occurrence]}
+            for occurrence in occurrences if occurrence in conflicts
+        ]
+        free = [occurrence for occurrence in occurrences if occurrence not in conflicts]
+        if not free:
+            return Response({
+                'success': False, 'message': 'Все даты серии заняты', 'conflicts': conflicts_data,
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        room_number = doctor.office_number if hasattr(doctor, 'office_number') else None
+        try:
+            with transaction.atomic():
+                created = Appointment.objects.bulk_create([
+                    Appointment(
+                        patient=patient, doctor=doctor, date_time=occurrence, notes=notes,
+                        status='scheduled', room_number=room_number,
+                    )
+                    for occurrence in free
+                ])
+                # bulk_create не вызывает сигналы: журнал изменений и индекс слотов обновляем сами
+                changelog.record_many(((a.id, patient.id, doctor.id) for a in created), action='created')
+                transaction.on_commit(lambda: slots.invalidate_many((doctor.id, a.date_time) for a in created))
+        except IntegrityError:
+            # Слот заняли параллельно, пока шла проверка
+            return Response({'success': False, 'message': 'Расписание врача изменилось, повторите запись'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'message': f'Создано записей: {len(created)} из {len(occurrences)}',
+            'appointments': [{'id': a.id, 'date_time': a.date_time.isoformat()} for a in created],
+            'conflicts': conflicts_data,
+        })
+
+
+# ===== КЭШ ОТВЕТОВ =====
+class ResponseCacheStatsView(APIView):
+    """
+    Счетчики попаданий/промахов кэша ответов по эндпоинтам (только для админов)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'backend': settings.CACHES['default']['BACKEND'],
+            'endpoints': response_cache.stats(),
+        })
+
+
+class ClinicAnalyticsView(APIView):
+    """
+    Аналитика по всей клинике (только для админов):
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD, по умолчанию - последние 90 дней;
+    ?refresh=1 - пересчитать, не дожидаясь истечения кэша
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        start_str = request.query_params.get('start')
+        end_str = request.query_params.get('end')
+        try:
+            # ValueError - несуществующая дата вроде 2024-02-30
+            start_day = parse_date(start_str) if start_str else None
+            end_day = parse_date(end_str) if end_str else None
+        except ValueError:
+            return Response({'error': 'Неверная дата, нужен YYYY-MM-DD'}, status=400)
+        if (start_str and not start_day) or (end_str and not end_day):
+            return Response({'error': 'Неверный формат даты, нужен YYYY-MM-DD'}, status=400)
+        # Без end отчет строится по сегодняшний день
+        if start_day and start_day > (end_day or timezone.localdate()):
+            return Response({'error': 'start позже end'}, status=400)
+
+        refresh = request.query_params.get('refresh') in ('1', 'true')
+        return Response(analytics.get_report(start_day, end_day, refresh=refresh))
@@ -52,6 +52,21 @@ export default function PatientMedicalCardModal({ open, onClose, patientId }) {
         }
     }, [open, patientId]);
 
+    // Файлы отдаются только с проверкой доступа: ссылка без токена не откроется
+    const openFile = async (file) => {
+        const tab = window.open('', '_blank');
+        try {
+            const response = await axios.get(file.url, { baseURL: '', responseType: 'blob' });
+            const blobUrl = URL.createObjectURL(response.data);
+            tab.location.href = blobUrl;
+            setTimeout(() => URL.revokeObjectURL(blobUrl), 60000);
+        } catch (err) {
+            console.error("Error opening file:", err);
+            tab.close();
+            setError("Не удалось открыть файл.");
+        }
+    };
+
     const renderDetail = (label, value) => (
         <Grid item xs={12} sm={6} md={4}>
             <Typography variant="caption" color="text.secondary">{label}</Typography>
@@ -172,7 +187,7 @@ return (
                                                 </Typography>
                                                 {record.files.length > 0 ? (
                                                     record.files.map(f => (
-                                                        <Button key={f.id} href={f.url} target="_blank" rel="noreferrer" startIcon={<DescriptionIcon />}>
+                                                        <Button key={f.id} onClick={() => openFile(f)} startIcon={<DescriptionIcon />}>
                                                             {f.title}
                                                         </Button>
                                                     ))